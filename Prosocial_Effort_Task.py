@@ -2,11 +2,12 @@
 # coding=utf-8
 
 # Para compilar
-# pyinstaller --onefile --add-data "media;media" --add-data "data;data" --hidden-import=pylsl --hidden-import=pygame --collect-all pylsl --name "Prosocial_Effort_Task" finalfinal.py
+# pyinstaller --onefile --add-data "media;media" --add-data "data;data" --hidden-import=pylsl --hidden-import=pygame --collect-all pylsl --exclude-module cv2 --exclude-module numpy --name "Prosocial_Effort_Task" Prosocial_Effort_Task.py
+# Tiempo de importación: python benchmarks/import_time.py
 
 
 # Important parameters
-# Size of the circle = standard_circle_size 
+# Size of the circle = standard_circle_size (a 1080p, se escala con la resolución)
 # Size of the square = box_padding
 # Total Blocks = blocks_number
 # Repetitions of ecah condition per block = repetitions_per_block
@@ -14,17 +15,55 @@
 """
 tested in Python 3.10.18
 """
-import pygame, sys, os, cv2, math
-from pygame.locals import FULLSCREEN, USEREVENT, KEYUP, KEYDOWN, K_SPACE, K_RETURN, K_ESCAPE, QUIT, Color, K_c, K_n, K_m, K_RIGHT
+import pygame, sys, os, math
+from pygame.locals import USEREVENT, KEYUP, KEYDOWN, K_SPACE, K_RETURN, K_ESCAPE, QUIT, Color, K_c, K_n, K_m, K_RIGHT
 from os.path import join
-from time import gmtime, strftime
+from time import gmtime, strftime, perf_counter
 from math import ceil, sqrt
 import itertools
 from random import shuffle
-from pylsl import StreamInfo, StreamOutlet
+from contextlib import nullcontext
+from asset_pack import AssetPack, CIRCLE_IMAGES, fit_size, variant_name, write_pack
+from session_timeline import SessionTimeline
+from profiling import profiler
+from slide_markup import SlideMarkup
+from render_backend import create_backend
+from calibration import AdaptiveCalibration
+from fatigue import FatigueModel
+from session_checkpoint import (SessionCheckpoint, checkpoint_path, encode_effort_table, decode_effort_table,
+                                encode_schedule, decode_schedule)
+from marker_grammar import MarkerGrammar
+from clock_sync import ClockSync
 
 debug_mode = True
 
+# pylsl se importa recién en initialize_lsl() para que las sesiones sin EEG
+# (y el arranque del ejecutable) no carguen la librería de LSL
+use_lsl = True  # False para sesiones sin EEG
+
+# Histogramas de latencia de render, flip y eventos por fase (ver profiling.py).
+# El costo es bajo, así que puede quedar activo en sesiones reales
+profile_mode = False
+
+# "software": se dibuja en la ventana y se muestra con display.flip() (original).
+# "sdl2": texturas de SDL2 (pygame._sdl2), menos uso de CPU en monitores 4K; si no
+# está disponible se usa "software" (ver render_backend.py)
+render_backend = "software"
+backend = None
+
+# Sigue la capacidad del participante trial a trial con un filtro de Kalman y la
+# registra en el CSV (ver fatigue.py). Con fatigue_reanchor además se recalculan
+# los objetivos de esfuerzo entre bloques si la capacidad cambió
+fatigue_mode = False
+fatigue_reanchor = False
+fatigue = None
+
+# Base SQLite con los trials, presiones, marcadores y calibración de todas las
+# sesiones (ver results_store.py), p. ej. join('data', 'results.sqlite'). Se
+# escribe en lotes desde un hilo de fondo; el CSV de la sesión se sigue escribiendo
+results_db = None
+results = None
+
 # MARCADORES LSL PARA EEG
 MARKERS = {
     # Eventos de decisión
@@ -55,43 +94,79 @@ MARKERS = {
     'CALIBRATION_END': 253,           # Fin calibración
     'PRACTICE_START': 254,            # Inicio práctica
     'PRACTICE_END': 255,              # Fin práctica
+    'SESSION_RESUMED': 256,           # Sesión reanudada con --resume (le sigue BLOCK_START)
 }
 
-# Variable global para LSL outlet
-lsl_outlet = None
+# Nombre del evento de cada código (para el stream de metadatos)
+MARKER_NAMES = {code: name for name, code in MARKERS.items()}
+MARKER_NAMES.update({MARKERS['FEEDBACK_CREDITS'] + n: 'FEEDBACK_CREDITS' for n in range(1, 10)})
+
+# Campos del trial que acompañan a cada marcador en el stream de metadatos
+MARKER_FIELDS = ("block", "trial", "effort", "credits", "condition", "target", "rt", "presses", "earned")
+
+# Stream LSL de marcadores (ver lsl_markers.py) y datos del trial en curso que
+# se agregan a cada marcador
+marker_stream = None
+marker_context = {}
+
+# Valida cada marcador contra la gramática del protocolo al enviarlo (ver
+# marker_grammar.py); las violaciones van a data/<fecha>_<id>_marker_check.csv
+check_markers = True
+marker_validator = None
+
+# Ajusta en línea get_ticks() y perf_counter() contra el reloj de LSL (ver
+# clock_sync.py) y lo escribe en data/<fecha>_<id>_clock_sync.json, para pasar los
+# tiempos del CSV al reloj de los marcadores
+clock_sync = True
+clock_sync_interval = 1.0  # s entre muestras
+clock_sampler = None
+
+# True cuando la sesión terminó normalmente (EXPERIMENT_END enviado e informes escritos en main())
+experiment_ended = False
 
 def initialize_lsl():
     """Inicializa la conexión LSL para enviar marcadores al EEG"""
-    global lsl_outlet
+    global marker_stream
+    from lsl_markers import MarkerStream
+
     print("\n" + "="*50)
     print("INICIALIZANDO CONEXIÓN LSL PARA EEG")
     print("="*50)
     
-    # Crear stream LSL
-    info = StreamInfo(name='ProsocialTaskMarkers',
-                      type='Markers',
-                      channel_count=1,
-                      channel_format='int32',
-                      source_id='ProsocialTask')
-    
-    lsl_outlet = StreamOutlet(info)
+    # Crear streams LSL: códigos int32 y metadatos JSON (ProsocialTaskMarkersEvents)
+    marker_stream = MarkerStream('ProsocialTaskMarkers', 'ProsocialTask', names=MARKER_NAMES,
+                                 fields=MARKER_FIELDS, debug=debug_mode)
     print("✓ Stream LSL creado exitosamente")
     print("  Por favor, conecte la aplicación de EEG ahora...")
     input("  Presione ENTER cuando el EEG esté conectado...")
     print("="*50 + "\n")
     
-    return lsl_outlet
+    return marker_stream
 
-def send_marker(marker_code, description=""):
-    """Envía un marcador al sistema EEG via LSL"""
-    global lsl_outlet
-    if lsl_outlet:
-        try:
-            lsl_outlet.push_sample([marker_code])
-            if debug_mode:
-                print(f"[EEG Marker] {marker_code} - {description}")
-        except Exception as e:
-            print(f"Error enviando marcador: {e}")
+@profiler.timed("send_marker")
+def send_marker(marker_code, description="", **fields):
+    """Envía un marcador al sistema EEG via LSL. fields - datos del evento (TR,
+    presiones, ...) que se suman a los del trial en curso en el stream de metadatos"""
+    if results is not None:
+        results.add_marker(marker_code, description, pygame.time.get_ticks())
+    if marker_validator is not None:
+        violation = marker_validator.feed(marker_code, pygame.time.get_ticks())
+        if violation is not None:
+            print(f"[Marcadores] {marker_code} ({description}) no esperado: {violation['rule']}")
+    if marker_stream is not None:
+        # El envío lo hace el hilo del stream; la marca de tiempo se toma ahora
+        marker_stream.send(marker_code, description, dict(marker_context, **fields))
+
+
+def set_marker_context(**values):
+    """Datos del trial en curso que acompañan a los marcadores siguientes"""
+    marker_context.clear()
+    marker_context.update(values)
+
+
+def condition_label(condition):
+    """Nombre de la condición en los datos (TI -> Self, GRUPO -> Group, OTRO -> Other)"""
+    return "Self" if condition == "TI" else ("Group" if condition == "GRUPO" else "Other")
 
 class TextRectException(Exception):
     def __init__(self, message=None):
@@ -136,74 +211,61 @@ def get_display_name(condition):
     else:
         return condition
 
+# Marcadores de color de las diapositivas: {NOMBRE} -> (texto, color). Para agregar
+# uno nuevo basta con sumarlo aquí (ver slide_markup.py, que también acepta
+# {b}...{/b} y {size=N}...{/size})
+MARKUP_TOKENS = {
+    "DISPLAY_NAME_SELF": (DISPLAY_NAME_SELF, (255, 0, 0)),          # Rojo
+    "DISPLAY_NAME_INGROUP": (DISPLAY_NAME_INGROUP, (0, 0, 255)),    # Azul
+    "DISPLAY_NAME_OUTGROUP": (DISPLAY_NAME_OUTGROUP, (0, 128, 0)),  # Verde
+}
+
+# Fuentes de los tramos con marcado, por (tamaño, negrita)
+markup_fonts = {}
+
+
+def markup_font(size, bold=False):
+    """Fuente del texto de las diapositivas para un tramo de marcado"""
+    key = (size, bold)
+    if key not in markup_fonts:
+        markup_fonts[key] = load_font(task_font, size)
+        markup_fonts[key].set_bold(bold)
+    return markup_fonts[key]
+
+
+slide_markup = SlideMarkup(MARKUP_TOKENS, markup_font)
+
+
 def render_multicolor_line(line, font, default_color):
     """
     Procesa una línea de texto y devuelve una lista de tuplas (texto, color)
     reemplazando {DISPLAY_NAME_*} por sus valores con colores correspondientes
     """
-    # Definir los marcadores y sus reemplazos con colores
-    markers = [
-        ("{DISPLAY_NAME_SELF}", DISPLAY_NAME_SELF, (255, 0, 0)),      # Rojo
-        ("{DISPLAY_NAME_INGROUP}", DISPLAY_NAME_INGROUP, (0, 0, 255)),  # Azul
-        ("{DISPLAY_NAME_OUTGROUP}", DISPLAY_NAME_OUTGROUP, (0, 128, 0))  # Verde
-    ]
-    
-    # Verificar si la línea contiene algún marcador
-    has_markers = any(marker[0] in line for marker in markers)
-    
-    if not has_markers:
-        return [(line, default_color)]
-    
-    # Procesar la línea reemplazando marcadores
-    parts = []
-    remaining = line
-    
-    while remaining:
-        # Encontrar el próximo marcador
-        earliest_pos = len(remaining)
-        earliest_marker = None
-        
-        for marker, value, color in markers:
-            pos = remaining.find(marker)
-            if pos != -1 and pos < earliest_pos:
-                earliest_pos = pos
-                earliest_marker = (marker, value, color)
-        
-        if earliest_marker is None:
-            # No hay más marcadores, agregar el resto
-            if remaining:
-                parts.append((remaining, default_color))
-            break
-        else:
-            # Agregar texto antes del marcador
-            if earliest_pos > 0:
-                parts.append((remaining[:earliest_pos], default_color))
-            # Agregar el valor del marcador con su color
-            parts.append((earliest_marker[1], earliest_marker[2]))
-            # Continuar con el resto
-            remaining = remaining[earliest_pos + len(earliest_marker[0]):]
-    
-    return parts
+    return slide_markup.plain_parts(line, default_color)
 
 def render_line_with_colors(line, font, default_color, surface, row, center_x):
     """Renderiza una línea con colores múltiples, centrada horizontalmente"""
     parts = render_multicolor_line(line, font, default_color)
-    
-    # Calcular ancho total para centrar
-    total_width = sum(font.size(part[0])[0] for part in parts)
-    x_pos = center_x - total_width // 2
+    widths = [text_width(font, text_part) for text_part, _ in parts]
+    x_pos = center_x - sum(widths) // 2
     
     # Renderizar cada parte
-    for text_part, color in parts:
+    for (text_part, color), width in zip(parts, widths):
         phrase = font.render(text_part, True, color)
         surface.blit(phrase, (x_pos, row))
-        x_pos += font.size(text_part)[0]
+        x_pos += width
 
 # block_type = division, total
 block_type = "division"
 
 min_buttons = 10
 
+# Calibración adaptativa (ver calibration.py): termina cuando la estimación de la
+# cantidad máxima de presiones es estable (IC 95 % dentro de ±tolerancia)
+calibration_min_attempts = 2
+calibration_max_attempts = 3
+calibration_tolerance = 0.08
+
 practice_iterations = 1  # Repeticiones de la práctica de esfuerzos
 decision_practice_trials = 1  # Trials de práctica
 
@@ -212,6 +274,10 @@ max_answer_time = 5  # Tiempo para trabajar = 5 segundos
 max_decision_time = 4  # Tiempo de decisión = 4 segundos 
 max_resting_time = 5  # Tiempo para descansar = 5 segundos
 
+# Tamaño de los círculos de esfuerzo en una pantalla de 1080 px de alto
+# (se escala según la resolución) - PERSONALIZABLE
+standard_circle_size = 550
+
 optimal_square = [1, 2, 3, 4, 6, 8, 9, 12, 15, 16, 18, 20, 21, 24, 25, 27, 28, 30, 32, 35, 36, 40, 42, 45, 48, 49, 50]
 
 # buttons configuration
@@ -368,6 +434,12 @@ def select_slide(slide_name):
         'wait': [
             "+"
         ],
+        'Resume': [
+            u"Continuemos con el experimento",
+            u"desde donde quedó.",
+            " ",
+            u"Recuerda: N para la opción de la izquierda y M para la de la derecha."
+        ],
         'farewell': [
             u"El experimento ha terminado.",
             "",
@@ -379,15 +451,230 @@ def select_slide(slide_name):
 
     return (selected_slide)
 
+# Paquete de recursos (ver asset_pack.py). Si existe media/assets.pak, las imágenes
+# y la fuente se leen desde él con mmap en vez de decodificar los archivos de media/
+asset_pack_name = 'assets.pak'
+assets = None
+
+# Versiones escaladas a la resolución de la pantalla. Se generan una vez por modo
+# de video (con smoothscale) y se guardan en media/cache/, así durante la tarea
+# nunca se re-escalan imágenes
+prescaled_cache_dir = 'cache'
+prescaled_assets = None
+scaled_images = {}
+
+# Tamaños de referencia: el diseño original es para una pantalla de 1080 px de alto
+reference_height = 1080
+ui_scale = 1.0
+
+
+def media_path(*parts):
+    """Ruta a un archivo de media/. En el ejecutable busca primero junto al .exe"""
+    if getattr(sys, 'frozen', False):
+        base_dirs = [os.path.dirname(sys.executable), getattr(sys, '_MEIPASS', None)]
+        for base_dir in base_dirs:
+            if base_dir and os.path.exists(join(base_dir, 'media', *parts)):
+                return join(base_dir, 'media', *parts)
+    return join('media', *parts)
+
+
+def open_assets():
+    """Abre el paquete de recursos si existe"""
+    global assets
+    path = media_path(asset_pack_name)
+    if assets is None and os.path.exists(path):
+        assets = AssetPack(path)
+        if debug_mode:
+            print(f"[Assets] {path}: {len(assets.names())} recursos")
+    return assets
+
+
+def scaled(value):
+    """Escala una medida del diseño de referencia (1080p) a la resolución actual"""
+    return int(round(value * ui_scale))
+
+
+def load_image(*parts):
+    """Carga una imagen de media/ (desde el paquete si está disponible)"""
+    name = '/'.join(parts)
+    if assets is not None and name in assets:
+        return assets.image(name)
+    return pygame.image.load(media_path(*parts))
+
+
+def image_source_size(*parts):
+    """Tamaño original de una imagen de media/"""
+    name = '/'.join(parts)
+    for pack in (prescaled_assets, assets):
+        if pack is not None and name in pack.source_sizes:
+            return pack.source_sizes[name]
+    return load_image(*parts).get_size()
+
+
+def load_scaled_image(size, *parts):
+    """Imagen de media/ escalada a size. Busca primero la versión pre-escalada
+    (caché en memoria, caché de la resolución o paquete) y sólo si no existe la
+    escala con smoothscale"""
+    size = (int(size[0]), int(size[1]))
+    name = '/'.join(parts)
+    key = (name, size)
+    if key in scaled_images:
+        return scaled_images[key]
+    scaled_name = variant_name(name, size)
+    for pack in (prescaled_assets, assets):
+        if pack is not None and scaled_name in pack:
+            scaled_images[key] = pack.image(scaled_name)
+            return scaled_images[key]
+    image = load_image(*parts)
+    if image.get_bitsize() not in (24, 32):
+        image = image.convert_alpha()
+    scaled_images[key] = pygame.transform.smoothscale(image, size)
+    return scaled_images[key]
+
+
+def load_fitted_image(max_side, *parts):
+    """Imagen escalada para que su lado mayor mida max_side, manteniendo la proporción"""
+    return load_scaled_image(fit_size(image_source_size(*parts), max_side), *parts)
+
+
+def calibration_image_size(*parts):
+    """Tamaño de la imagen de calibration_slide: media pantalla de alto"""
+    width, height = image_source_size(*parts)
+    return (int(resolution[1] / 2 * width / height), int(resolution[1] / 2))
+
+
+def cases_image_size(*parts):
+    """Tamaño de las imágenes de cases_slide: media pantalla de ancho"""
+    width, height = image_source_size(*parts)
+    return (int(resolution[0] / 2), int(resolution[0] / 2 * height / width))
+
+
+def prescaled_variants():
+    """Todas las imágenes escaladas que usa la tarea en la resolución actual"""
+    variants = [(name, fit_size(image_source_size(name), scaled(standard_circle_size))) for name in CIRCLE_IMAGES]
+    variants.append(("images/testing_schema.jpg", calibration_image_size("images", "testing_schema.jpg")))
+    variants.append(("images/TI_schema.jpg", cases_image_size("images", "TI_schema.jpg")))
+    return variants
+
+
+def prescale_assets():
+    """Abre (o genera la primera vez) la caché de imágenes escaladas para la resolución actual"""
+    global prescaled_assets
+    cache_name = f"assets_{resolution[0]}x{resolution[1]}.pak"
+    path = media_path(prescaled_cache_dir, cache_name)
+    if os.path.exists(path):
+        prescaled_assets = AssetPack(path)
+
+    variants = prescaled_variants()
+    missing = [(name, size) for name, size in variants
+               if prescaled_assets is None or variant_name(name, size) not in prescaled_assets]
+    if not missing:
+        warm_scaled_images(variants)
+        return prescaled_assets
+
+    print(f"Generando imágenes para {resolution[0]}x{resolution[1]}...")
+    images = {}
+    sources = {}
+    for name, size in variants:
+        parts = name.split('/')
+        images[variant_name(name, size)] = load_scaled_image(size, *parts)
+        sources[variant_name(name, size)] = (name, image_source_size(*parts))
+
+    if prescaled_assets is not None:
+        prescaled_assets.close()
+        prescaled_assets = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_pack(path, images, {}, sources)
+        prescaled_assets = AssetPack(path)
+        scaled_images.clear()
+    except OSError as e:
+        # Sin permisos de escritura: las imágenes quedan escaladas sólo en memoria
+        print(f"No se pudo guardar la caché de imágenes: {e}")
+    warm_scaled_images(variants)
+    return prescaled_assets
+
+
+def warm_scaled_images(variants):
+    """Deja en scaled_images todas las imágenes de la tarea, para que ningún trial
+    tenga que leerlas del paquete (ni escalarlas) la primera vez que aparecen"""
+    for name, size in variants:
+        load_scaled_image(size, *name.split('/'))
+
+
+def load_font(name, size):
+    """Carga una fuente de media/ (desde el paquete si está disponible)"""
+    if assets is not None and name in assets:
+        return assets.font(name, size)
+    return pygame.font.Font(media_path(name), size)
+
+
 # Text and screen Functions
+task_font = 'Arial_Rounded_MT_Bold.ttf'
+
+
 def setfonts():
     """Sets font parameters"""
     global bigchar, char, charnext
     pygame.font.init()
-    font = join('media', 'Arial_Rounded_MT_Bold.ttf')
-    bigchar = pygame.font.Font(font, 96)
-    char = pygame.font.Font(font, 32)
-    charnext = pygame.font.Font(font, 24)
+    open_assets()
+    bigchar = load_font(task_font, 96)
+    char = load_font(task_font, 32)
+    charnext = load_font(task_font, 24)
+
+
+# Ancho medido de cada palabra, por fuente (ver text_width). Las instrucciones
+# repiten mucho vocabulario, así que cada palabra se mide con font.size una vez
+text_widths = {}
+
+# Fuentes por tamaño para fit_textrect
+fitted_fonts = {}
+
+
+def text_width(font, token):
+    """Ancho en pixeles de token con font (memoizado)"""
+    key = (font, token)
+    width = text_widths.get(key)
+    if width is None:
+        width = text_widths[key] = font.size(token)[0]
+    return width
+
+
+def wrap_text(string, font, width):
+    """Divide string en líneas que caben en width.
+
+    Cada palabra se mide una sola vez y el ancho de la línea se acumula sumando
+    el avance del espacio. Devuelve una lista de (línea, palabras, ajustada), donde
+    ajustada indica que la línea se cortó y el párrafo continúa en la siguiente."""
+    space = text_width(font, " ")
+    lines = []
+    for requested_line in string.splitlines():
+        if text_width(font, requested_line) <= width:
+            lines.append((requested_line, None, False))
+            continue
+        words = requested_line.split(' ')
+        # if any of our words are too long to fit, return.
+        for word in words:
+            if text_width(font, word) >= width:
+                raise TextRectException(
+                    "The word " + word + " is too long to fit in the rect passed.")
+        # Build the line while the words fit (cada palabra lleva su espacio, como antes)
+        line_words = []
+        line_width = 0
+        for word in words:
+            word_width = text_width(font, word) + space
+            candidate_width = line_width + word_width
+            # La suma de anchos ignora el kerning entre palabras: cerca del borde se
+            # mide la línea completa para cortar igual que midiendo la línea entera
+            if line_words and (candidate_width >= width or (candidate_width >= width - 2 * space and
+                               font.size(" ".join(line_words) + " " + word + " ")[0] >= width)):
+                lines.append((" ".join(line_words) + " ", line_words, True))
+                line_words = []
+                line_width = 0
+            line_words.append(word)
+            line_width += word_width
+        lines.append((" ".join(line_words) + " ", line_words, False))
+    return lines
 
 
 def render_textrect(string, font, rect, text_color, background_color, justification=1):
@@ -405,97 +692,198 @@ def render_textrect(string, font, rect, text_color, background_color, justificat
     justification - 0 left-justified
                     1 (default) horizontally centered
                     2 right-justified
+                    3 justified (las líneas cortadas ocupan todo el ancho)
 
     Returns:
-    Success - a surface object with the text rendered onto it.
+    Success - the list of lines and a surface object with the text rendered onto it.
     Failure - raises a TextRectException if the text won't fit onto the surface.
     """
+    if justification not in (0, 1, 2, 3):
+        raise TextRectException(
+            "Invalid justification argument: " + str(justification))
 
-    import pygame
-
-    final_lines = []
-
-    requested_lines = string.splitlines()
-
-    # Create a series of lines that will fit on the provided
-    # rectangle.
-    for requested_line in requested_lines:
-        if font.size(requested_line)[0] > rect.width:
-            words = requested_line.split(' ')
-            # if any of our words are too long to fit, return.
-            for word in words:
-                if font.size(word)[0] >= rect.width:
-                    raise TextRectException(
-                        "The word " + word + " is too long to fit in the rect passed.")
-            # Start a new line
-            accumulated_line = ""
-            for word in words:
-                test_line = accumulated_line + word + " "
-                # Build the line while the words fit.
-                if font.size(test_line)[0] < rect.width:
-                    accumulated_line = test_line
-                else:
-                    final_lines.append(accumulated_line)
-                    accumulated_line = word + " "
-            final_lines.append(accumulated_line)
-        else:
-            final_lines.append(requested_line)
+    rect = pygame.Rect(rect)
+    lines = wrap_text(string, font, rect.width)
+    line_height = font.get_height()
+    if len(lines) * line_height >= rect.height:
+        raise TextRectException(
+            "Once word-wrapped, the text string was too tall to fit in the rect.")
 
     # Let's try to write the text out on the surface.
     surface = pygame.Surface(rect.size)
     surface.fill(background_color)
 
     accumulated_height = 0
-    for line in final_lines:
-        if accumulated_height + font.size(line)[1] >= rect.height:
-            raise TextRectException(
-                "Once word-wrapped, the text string was too tall to fit in the rect.")
-        if line != "":
+    for line, words, wrapped in lines:
+        if justification == 3 and wrapped and len(words) > 1:
+            # Reparte el espacio sobrante entre las palabras
+            words_width = sum(text_width(font, word) for word in words)
+            gap = (rect.width - words_width) / (len(words) - 1)
+            x = 0.0
+            for word in words:
+                surface.blit(font.render(word, 1, text_color), (round(x), accumulated_height))
+                x += text_width(font, word) + gap
+        elif line != "":
             tempsurface = font.render(line, 1, text_color)
-            if justification == 0:
+            if justification in (0, 3):
                 surface.blit(tempsurface, (0, accumulated_height))
             elif justification == 1:
                 surface.blit(
                     tempsurface, ((rect.width - tempsurface.get_width()) / 2, accumulated_height))
-            elif justification == 2:
+            else:
                 surface.blit(tempsurface, (rect.width -
                              tempsurface.get_width(), accumulated_height))
-            else:
-                raise TextRectException(
-                    "Invalid justification argument: " + str(justification))
-        accumulated_height += font.size(line)[1]
+        accumulated_height += line_height
 
-    return final_lines, surface
+    return [line for line, _, _ in lines], surface
 
 
-def paragraph(text, key=None, no_foot=False, color=None):
-    """Organizes a text into a paragraph"""
-    screen.fill(background)
-    row = center[1] - 20 * len(text)
+def fit_textrect(string, rect, text_color, background_color, justification=1, max_size=96, min_size=12,
+                 font_name=None):
+    """render_textrect con el mayor tamaño de fuente (entre min_size y max_size)
+    con el que el texto cabe en rect. Devuelve (líneas, superficie, tamaño)"""
+    font_name = font_name or task_font
 
-    if color == None:
-        color = char_color
+    def font_of(size):
+        if (font_name, size) not in fitted_fonts:
+            fitted_fonts[(font_name, size)] = load_font(font_name, size)
+        return fitted_fonts[(font_name, size)]
 
-    for line in text:
-        # Usar renderizado multicolor para detectar y colorear los DISPLAY_NAME_*
-        render_line_with_colors(line, char, color, screen, row, center[0])
-        row += 40
-    if key != None:
-        if key == K_SPACE:
-            foot = u"Para continuar presione la tecla ESPACIO..."
-        elif key == K_RETURN:
-            foot = u"Para continuar presione la tecla ENTER..."
-        elif key == K_RIGHT:
-            foot = u"Para avanzar presione la flecha derecha..."
+    def fits(size):
+        try:
+            return render_textrect(string, font_of(size), rect, text_color, background_color, justification)
+        except TextRectException:
+            return None
+
+    # Búsqueda binaria: si cabe con un tamaño, cabe con cualquiera menor
+    best = None
+    low, high = min_size, max_size
+    while low <= high:
+        size = (low + high) // 2
+        rendered = fits(size)
+        if rendered is not None:
+            best = rendered + (size,)
+            low = size + 1
+        else:
+            high = size - 1
+    if best is None:
+        raise TextRectException("The text doesn't fit in the rect even at size " + str(min_size))
+    return best
+
+
+# Diapositivas pre-renderizadas (ver compile_slides). Cada entrada es una lista de
+# capas (superficie, posición) que se muestran con screen.fill + blit + flip
+slide_cache = {}
+
+
+def compose_text_block(text, color):
+    """Renderiza las líneas de una diapositiva (40 px entre líneas, centradas) en una superficie ajustada al texto"""
+    base_size = 32  # tamaño de char (ver setfonts)
+    base_ascent = char.get_ascent()
+    layouts = [slide_markup.layout(line, color, base_size) for line in text]
+
+    # Los tramos de otro tamaño se alinean a la línea base de char
+    top = min([0] + [base_ascent - layout.ascent for layout in layouts])
+    bottom = max([40 * (len(text) - 1) + char.get_linesize()] +
+                 [40 * i + base_ascent - layout.ascent + layout.height for i, layout in enumerate(layouts)])
+    block = pygame.Surface((max([layout.width for layout in layouts] + [1]), bottom - top)).convert()
+    block.fill(background)
+    for i, layout in enumerate(layouts):
+        x_pos = block.get_width() // 2 - layout.width // 2
+        for span in layout.spans:
+            phrase = span.font.render(span.text, True, span.color)
+            block.blit(phrase, (x_pos, 40 * i + base_ascent - span.font.get_ascent() - top))
+            x_pos += span.width
+    return block
+
+
+def compose_footer(key, no_foot=False, paragraph_style=True):
+    """Texto de la esquina inferior izquierda según la tecla para avanzar"""
+    if paragraph_style:
+        if key != None:
+            if key == K_SPACE:
+                foot = u"Para continuar presione la tecla ESPACIO..."
+            elif key == K_RETURN:
+                foot = u"Para continuar presione la tecla ENTER..."
+            elif key == K_RIGHT:
+                foot = u"Para avanzar presione la flecha derecha..."
+        else:
+            foot = u"Responda con la fila superior de teclas de numéricas"
+    elif key == K_RIGHT:
+        foot = u"Para avanzar presione la flecha derecha..."
     else:
-        foot = u"Responda con la fila superior de teclas de numéricas"
+        foot = u"Para continuar presione la tecla ESPACIO..."
     if no_foot:
         foot = ""
 
     nextpage = charnext.render(foot, True, charnext_color)
     nextbox = nextpage.get_rect(left=15, bottom=resolution[1] - 15)
-    screen.blit(nextpage, nextbox)
-    pygame.display.flip()
+    return nextpage, nextbox
+
+
+def compile_slide(kind, text, key=None, no_foot=False, color=None, images=()):
+    """Devuelve (y guarda en slide_cache) las capas de una diapositiva.
+
+    kind - 'paragraph', 'calibration' (texto + una imagen) o 'cases' (texto + imágenes lado a lado)
+    """
+    cache_key = (kind, tuple(text), key, no_foot, None if color is None else tuple(color), tuple(images))
+    if cache_key in slide_cache:
+        return slide_cache[cache_key]
+
+    if color == None:
+        color = char_color
+
+    block = compose_text_block(text, color)
+    if kind == 'paragraph':
+        row = center[1] - 20 * len(text)
+    else:
+        row = screen.get_rect().height // 8
+    layers = [(block, (center[0] - block.get_width() // 2, row))]
+    row += 40 * len(text)
+
+    if kind == 'calibration':
+        for image in images:
+            picture = load_scaled_image(calibration_image_size("images", image), "images", image)
+            layers.append((picture, (screen.get_rect().width // 2 - picture.get_width() // 2, row + 40)))
+    elif kind == 'cases':
+        for i, image in enumerate(images):
+            picture = load_scaled_image(cases_image_size("images", image), "images", image)
+            if len(images) == 1:
+                # Si hay solo 1 imagen, centrarla
+                x_pos = screen.get_rect().width / 2 - picture.get_width() / 2
+            else:
+                # Múltiples imágenes lado a lado
+                x_pos = (1 + (2 * i)) * screen.get_rect().width / 4 - picture.get_width() / 2
+            layers.append((picture, (int(x_pos), row + 40)))
+
+    layers.append(compose_footer(key, no_foot, paragraph_style=(kind == 'paragraph')))
+    slide_cache[cache_key] = layers
+    return layers
+
+
+def show_compiled_slide(layers):
+    """Muestra una diapositiva ya compilada"""
+    show_layers(layers)
+
+
+def compile_slides():
+    """Pre-renderiza todas las diapositivas de instrucciones que muestra main()"""
+    for slide_name, key, no_foot in [('welcome', K_RIGHT, False), ('Interlude_Casillas', K_RIGHT, False),
+                                     ('Cargando', K_RIGHT, False), ('Pre_Instructions', K_RIGHT, False),
+                                     ('Instructions_Decision_1', K_RIGHT, False), ('Instructions_Decision_3', K_RIGHT, False),
+                                     ('Instructions_Decision_final', K_RIGHT, False), ('Interlude_Practice', K_RIGHT, False),
+                                     ('Effort_ending', K_RIGHT, False), ('TestingDecision', K_SPACE, False),
+                                     ('Practice_ending', K_RIGHT, False), ('Break', K_SPACE, False), ('Resume', K_RIGHT, False),
+                                     ('farewell', K_RIGHT, True)]:
+        compile_slide('paragraph', select_slide(slide_name), key, no_foot)
+    compile_slide('calibration', select_slide('Instructions_Casillas'), K_RIGHT, images=("testing_schema.jpg",))
+    compile_slide('cases', select_slide('Instructions_Decision_2'), K_RIGHT, images=("TI_schema.jpg",))
+
+
+@profiler.timed("paragraph")
+def paragraph(text, key=None, no_foot=False, color=None):
+    """Organizes a text into a paragraph"""
+    show_compiled_slide(compile_slide('paragraph', text, key, no_foot, color))
 
 
 def slide(text, info, key, limit_time=0):
@@ -527,7 +915,7 @@ def show_gif_loading(gif_path=None, duration_ms=10000):
     # Bucle principal para mostrar la animación
     while pygame.time.get_ticks() - start_time < duration_ms:
         # Manejar eventos
-        for event in pygame.event.get():
+        for event in get_events():
             if event.type == pygame.QUIT:
                 ends()
             elif event.type == KEYUP and event.key == K_ESCAPE:
@@ -563,83 +951,22 @@ def show_gif_loading(gif_path=None, duration_ms=10000):
         progress_rect = progress_text.get_rect(center=(center_x, center_y + 100))
         screen.blit(progress_text, progress_rect)
         
-        pygame.display.flip()
+        display_flip()
         clock.tick(60)
     
     # Limpiar la pantalla al final
     screen.fill(background)
-    pygame.display.flip()
+    display_flip()
 
 def calibration_slide(text, key, image=None):    
-    screen.fill(background)
-    row = screen.get_rect().height // 8
-
-    for line in text:
-        phrase = char.render(line, True, char_color)
-        phrasebox = phrase.get_rect(centerx=center[0], top=row)
-        screen.blit(phrase, phrasebox)
-        row += 40
-
-    if image != None:
-        # Cambiado para usar PNG
-        picture = pygame.image.load(join("media", "images", image))
-        picture = pygame.transform.scale(picture, (screen.get_rect().height/2*picture.get_width()/picture.get_height(), screen.get_rect().height/2))        
-        rect = picture.get_rect()
-        rect = rect.move((screen.get_rect().width/2 - picture.get_width()/2,row + 40))
-        screen.blit(picture, rect)
-    
-
-    # Mostrar footer según la tecla
-    if key == K_RIGHT:
-        foot = u"Para avanzar presione la flecha derecha..."
-    else:
-        foot = u"Para continuar presione la tecla ESPACIO..."
-
-    nextpage = charnext.render(foot, True, charnext_color)
-    nextbox = nextpage.get_rect(left=15, bottom=resolution[1] - 15)
-    screen.blit(nextpage, nextbox)
-    pygame.display.flip()
+    images = (image,) if image != None else ()
+    show_compiled_slide(compile_slide('calibration', text, key, images=images))
     wait_time = wait(key, 0)
     return wait_time
 
 
 def cases_slide(text, key, images=[]):    
-    screen.fill(background)
-    row = screen.get_rect().height // 8
-    first_image = 0
-
-    for line in text:
-        # Usar renderizado multicolor para detectar y colorear los DISPLAY_NAME_*
-        render_line_with_colors(line, char, char_color, screen, row, center[0])
-        row += 40
-
-    # Si hay solo 1 imagen, centrarla
-    if len(images) == 1:
-        picture = pygame.image.load(join("media", "images", images[0]))
-        picture = pygame.transform.scale(picture, (screen.get_rect().width/2, screen.get_rect().width/2*picture.get_height()/picture.get_width()))        
-        rect = picture.get_rect()
-        rect = rect.move((screen.get_rect().width/2 - picture.get_width()/2, row + 40))
-        screen.blit(picture, rect)
-    else:
-        # Múltiples imágenes lado a lado
-        for image in images:
-            picture = pygame.image.load(join("media", "images", image))
-            picture = pygame.transform.scale(picture, (screen.get_rect().width/2, screen.get_rect().width/2*picture.get_height()/picture.get_width()))        
-            rect = picture.get_rect()
-            rect = rect.move(( (1+(2*first_image)) * screen.get_rect().width/4 - picture.get_width()/2, row + 40))
-            screen.blit(picture, rect)
-            first_image += 1
-
-    # Mostrar footer según la tecla
-    if key == K_RIGHT:
-        foot = u"Para avanzar presione la flecha derecha..."
-    else:
-        foot = u"Para continuar presione la tecla ESPACIO..."
-    
-    nextpage = charnext.render(foot, True, charnext_color)
-    nextbox = nextpage.get_rect(left=15, bottom=resolution[1] - 15)
-    screen.blit(nextpage, nextbox)
-    pygame.display.flip()
+    show_compiled_slide(compile_slide('cases', text, key, images=tuple(images)))
     wait_time = wait(key, 0)
     return wait_time
 
@@ -647,11 +974,11 @@ def cases_slide(text, key, images=[]):
 def blackscreen(blacktime=0):
     """Erases the screen"""
     screen.fill(background)
-    pygame.display.flip()
+    display_flip()
     pygame.time.delay(blacktime)
 
 
-def wait(key, limit_time):
+def wait(key, limit_time, idle_task=None):
     """Hold a bit"""
 
     TIME_OUT_WAIT = USEREVENT + 1
@@ -660,9 +987,13 @@ def wait(key, limit_time):
 
     tw = pygame.time.get_ticks()
 
+    # Trabajo en segundo plano durante la espera (el timer ya está corriendo)
+    if idle_task is not None:
+        idle_task()
+
     switch = True
     while switch:
-        for event in pygame.event.get():
+        for event in get_events():
             if event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE):
                 pygame_exit()
             elif event.type == KEYDOWN:
@@ -683,19 +1014,27 @@ def ends():
     dot = char.render('.', True, char_color)
     dotbox = dot.get_rect(left=15, bottom=resolution[1] - 15)
     screen.blit(dot, dotbox)
-    pygame.display.flip()
+    display_flip()
     while True:
-        for evento in pygame.event.get():
+        for evento in get_events():
             if evento.type == KEYUP and evento.key == K_ESCAPE:
                 pygame_exit()
 
 
-def windows(text, key=None, limit_time=0): 
-    """Organizes a text into a paragraph"""
-    screen.fill(background)
+# Textos de windows() ya renderizados: tupla de líneas -> capas (superficie, posición)
+windows_cache = {}
+
+
+def compose_windows(text):
+    """Renderiza (una sola vez) las líneas que muestra windows()"""
+    cache_key = tuple(text)
+    if cache_key in windows_cache:
+        return windows_cache[cache_key]
+
+    layers = []
     row = center[1] - 120
 
-    font = pygame.font.Font(None, 90)
+    font = get_default_font(90)
 
     # Detectar si es una pantalla de "Créditos para [condición]"
     # Verificar tanto los display names como los nombres internos originales
@@ -705,10 +1044,10 @@ def windows(text, key=None, limit_time=0):
     if is_condition_screen:
         phrase = font.render(text[0], True, (0, 0, 0))
         phrasebox = phrase.get_rect(centerx=center[0], top=row)
-        screen.blit(phrase, phrasebox)
+        layers.append((phrase, phrasebox))
         row += 120
 
-        font = pygame.font.Font(None, 140)
+        font = get_default_font(140)
 
         # Determinar color según la condición
         if text[1] == DISPLAY_NAME_SELF or text[1] == "TI":
@@ -720,48 +1059,125 @@ def windows(text, key=None, limit_time=0):
 
         phrase = font.render(text[1], True, color)
         phrasebox = phrase.get_rect(centerx=center[0], top=row)
-        screen.blit(phrase, phrasebox)
+        layers.append((phrase, phrasebox))
     
     else:
         # Feedback general - usar color amarillo
         for line in text:
             phrase = font.render(line, True, feedback_color)
             phrasebox = phrase.get_rect(centerx=center[0], top=row)
-            screen.blit(phrase, phrasebox)
+            layers.append((phrase, phrasebox))
             row += 120
 
-    pygame.display.flip()
-    wait(key, limit_time)
+    windows_cache[cache_key] = layers
+    return layers
+
+
+@profiler.timed("windows")
+def windows(text, key=None, limit_time=0, idle_task=None): 
+    """Organizes a text into a paragraph.
+    idle_task se ejecuta mientras se muestra el texto (p. ej. preload_trial)"""
+    show_layers(compose_windows(text))
+    wait(key, limit_time, idle_task)
+
+
+# Línea de tiempo de la sesión (ver session_timeline.py): duración planificada vs
+# real de cada fase. Se crea en main() y se escribe al terminar o al salir con ESC
+timeline = None
+timeline_base = None
+
+# Punto de control de la sesión (ver session_checkpoint.py), para continuar con --resume
+checkpoint = None
+
+
+def timed_phase(name, planned_ms=None, **info):
+    """Registra una fase en la línea de tiempo de la sesión (si está activa)"""
+    if timeline is None:
+        return nullcontext({"planned_ms": planned_ms, "info": info})
+    return timeline.phase(name, planned_ms, **info)
+
+
+def display_flip(rect=None):
+    """pygame.display.flip(), o update(rect) para actualizar sólo una región.
+    Con profile_mode se registran los tiempos de render y de flip"""
+    profiler.flip(rect, backend.present)
+
+
+def show_layers(layers, rect=None):
+    """Muestra capas (superficie, posición) ya compuestas sobre el fondo. Con rect
+    sólo se actualiza esa región. Con el backend sdl2 cada capa es una textura"""
+    profiler.flip(rect, lambda region: backend.show_layers(layers, background, region))
+
+
+def get_events():
+    """pygame.event.get() (con profile_mode se registra el tiempo de lectura)"""
+    return profiler.events()
+
+
+def start_clock_sync(base):
+    """Muestreo de los relojes de la sesión. Sin LSL la referencia es perf_counter()"""
+    if use_lsl:
+        from pylsl import local_clock
+        return ClockSync({"ticks": (pygame.time.get_ticks, 0.001), "perf_counter": (perf_counter, 1.0)},
+                         ("lsl", local_clock), clock_sync_interval, base)
+    return ClockSync({"ticks": (pygame.time.get_ticks, 0.001)}, ("perf_counter", perf_counter),
+                     clock_sync_interval, base)
+
+
+def write_timeline_reports():
+    """Escribe el informe de desfase de la sesión junto al archivo de datos"""
+    if timeline is None or timeline_base is None:
+        return
+    try:
+        timeline.write_all(timeline_base)
+    except OSError as e:
+        print(f"No se pudo escribir la línea de tiempo de la sesión: {e}")
+    if marker_validator is not None and marker_validator.violations:
+        print(f"Marcadores: {len(marker_validator.violations)} violaciones de la secuencia esperada")
+        try:
+            marker_validator.write_report(timeline_base + "_marker_check.csv", os.path.basename(timeline_base))
+        except OSError as e:
+            print(f"No se pudo escribir el informe de marcadores: {e}")
+    if clock_sampler is not None:
+        try:
+            clock_sampler.save()
+        except OSError as e:
+            print(f"No se pudo escribir el modelo de relojes: {e}")
+    if profiler.enabled:
+        try:
+            print("\n".join(profiler.dump(timeline_base + "_profile.json")))
+        except OSError as e:
+            print(f"No se pudo escribir el perfil de latencias: {e}")
 
 
 # Program Functions
 def init():
     """Init display and others"""
     setfonts()
-    global screen, resolution, center, background, char_color, charnext_color, fix, fixbox, fix_think, fixbox_think, izq, der, quest, questbox
+    global screen, resolution, center, background, char_color, charnext_color, fix, fixbox, fix_think, fixbox_think, izq, der, quest, questbox, ui_scale, backend
     pygame.init()  # soluciona el error de inicializacion de pygame.time
     pygame.display.init()
-    pygame.display.set_caption(test_name)
     pygame.mouse.set_visible(False)
     if FullScreenShow:
         resolution = (pygame.display.Info().current_w,
                       pygame.display.Info().current_h)
-        screen = pygame.display.set_mode(resolution, FULLSCREEN)
     else:
         try:
             resolution = pygame.display.list_modes()[3]
         except:
             resolution = (1280, 720)
-        screen = pygame.display.set_mode(resolution)
+    backend = create_backend(render_backend, resolution, FullScreenShow, test_name)
+    screen = backend.screen
     
     # Forzar el foco de la ventana para solucionar problemas con teclado
     pygame.event.clear()  # Limpiar eventos pendientes
-    pygame.display.flip()
+    display_flip()
     pygame.time.delay(100)  # Pequeña pausa para que Windows establezca el foco
     pygame.event.pump()  # Procesar eventos del sistema
     pygame.event.clear()  # Limpiar nuevamente
     
     center = (int(resolution[0] / 2), int(resolution[1] / 2))
+    ui_scale = resolution[1] / reference_height
     izq = (int(resolution[0] / 8), (int(resolution[1] / 8)*7))
     der = ((int(resolution[0] / 8)*7), (int(resolution[1] / 8)*7))
     background = Color('lightgray')
@@ -774,12 +1190,24 @@ def init():
     quest = bigchar.render('?', True, char_color)
     questbox = quest.get_rect(centerx=center[0], centery=center[1])
     screen.fill(background)
-    pygame.display.flip()
+    display_flip()
+
+    # Imágenes escaladas a esta resolución (se generan sólo la primera vez)
+    prescale_assets()
 
 
 def pygame_exit():
-    # Enviar marcador de fin del experimento antes de salir
-    send_marker(MARKERS['EXPERIMENT_END'], "Experiment ended")
+    # Sólo si se sale antes de terminar (ESC); si no, main() ya envió EXPERIMENT_END
+    if not experiment_ended:
+        send_marker(MARKERS['EXPERIMENT_END'], "Experiment ended")
+    if marker_stream is not None:
+        marker_stream.close()
+    if clock_sampler is not None:
+        clock_sampler.close()
+    if not experiment_ended:
+        write_timeline_reports()
+    if results is not None:
+        results.close()
     pygame.quit()
     sys.exit()
 
@@ -788,7 +1216,7 @@ def block_spacebar(duration_ms):
     """Block spacebar input for specified duration in milliseconds"""
     start_time = pygame.time.get_ticks()
     while pygame.time.get_ticks() - start_time < duration_ms:
-        for event in pygame.event.get():
+        for event in get_events():
             if event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE):
                 pygame_exit()
             # Consume all other events during blocking period
@@ -796,6 +1224,7 @@ def block_spacebar(duration_ms):
     pygame.event.clear()  # Clear any accumulated events
 
 
+@profiler.timed("draw_progress_bar")
 def draw_progress_bar(current_presses, total_presses, bar_width=100, bar_height=400):
     """Draw a vertical progress bar"""
     # Calculate bar position (centered on screen)
@@ -817,7 +1246,7 @@ def draw_progress_bar(current_presses, total_presses, bar_width=100, bar_height=
     # Draw border
     pygame.draw.rect(screen, (0, 0, 0), (bar_x, bar_y, bar_width, bar_height), 3)
     
-    pygame.display.flip()
+    display_flip()
 
 
 def show_effort_preview(effort_level, effort_percentage):
@@ -825,30 +1254,19 @@ def show_effort_preview(effort_level, effort_percentage):
     screen.fill(background)
     
     # CORRECCIÓN: Mostrar solo "Nivel de esfuerzo" sin el porcentaje
-    font = pygame.font.Font(None, 48)
+    font = pygame.font.Font(None, scaled(48))
     text = font.render("Nivel de esfuerzo", True, (0, 0, 0))
     text_rect = text.get_rect(center=(resolution[0]/2, resolution[1]/3))
     screen.blit(text, text_rect)
     
     # Load and display effort image - use PNG with self version (red)
     try:
-        effort_image = pygame.image.load(join('media', f'{effort_percentage}_self.png'))
-        
         # USAR EL MISMO TAMAÑO QUE EN take_decision() para consistencia
         # Aquí también se puede personalizar el tamaño
-        preview_size = 550
-        
-        # Mantener proporción original
-        original_width = effort_image.get_width()
-        original_height = effort_image.get_height()
-        
-        # Calcular el factor de escala manteniendo la proporción
-        scale_factor = preview_size / max(original_width, original_height)
-        new_width = int(original_width * scale_factor)
-        new_height = int(original_height * scale_factor)
+        preview_size = scaled(standard_circle_size)
         
         # Escalar la imagen manteniendo su proporción
-        effort_image = pygame.transform.scale(effort_image, (new_width, new_height))
+        effort_image = load_fitted_image(preview_size, f'{effort_percentage}_self.png')
         img_rect = effort_image.get_rect(center=(resolution[0]/2, resolution[1]/2))
         screen.blit(effort_image, img_rect)
     except:
@@ -857,23 +1275,32 @@ def show_effort_preview(effort_level, effort_percentage):
         circle_center = (resolution[0]//2, resolution[1]//2)
         pygame.draw.circle(screen, (255, 255, 255), circle_center, circle_radius)
         pygame.draw.circle(screen, (255, 0, 0), circle_center, circle_radius, 2)  # Red border for self
-        fallback_font = pygame.font.Font(None, 24)
+        fallback_font = pygame.font.Font(None, scaled(24))
         text = fallback_font.render(f"{effort_percentage}%", True, (255, 0, 0))
         text_rect = text.get_rect(center=circle_center)
         screen.blit(text, text_rect)
     
     # Instructions
-    instruction_font = pygame.font.Font(None, 32)
+    instruction_font = pygame.font.Font(None, scaled(32))
     text = instruction_font.render("Presiona Espacio para continuar", True, (0, 0, 0))
     text_rect = text.get_rect(center=(resolution[0]/2, resolution[1]*2/3))
     screen.blit(text, text_rect)
     
-    pygame.display.flip()
+    display_flip()
     wait(K_SPACE, 0)
 
 
-def show_effort_bar(target_presses, max_time=5, title_text="", is_calibration=False):
-    """Show vertical bar that fills with spacebar presses"""
+# get_ticks() del inicio de la última decisión y de la última barra de esfuerzo: los
+# TR y los tiempos de las presiones del CSV son relativos a ellos
+decision_onset = None
+effort_onset = None
+
+
+@profiler.timed("show_effort_bar")
+def show_effort_bar(target_presses, max_time=5, title_text="", is_calibration=False, press_log=None):
+    """Show vertical bar that fills with spacebar presses.
+    press_log - lista a la que se agregan los ms (desde el inicio) de cada presión"""
+    global effort_onset
     # CORRECCIÓN BUG: Limpiar el buffer de eventos antes de empezar
     pygame.event.clear()
     
@@ -911,7 +1338,7 @@ def show_effort_bar(target_presses, max_time=5, title_text="", is_calibration=Fa
         text = instruction_font.render(instruction_text, True, (0, 0, 0))
         text_rect = text.get_rect(centerx=center[0], bottom=resolution[1] - 50)
         screen.blit(text, text_rect)
-        pygame.display.flip()
+        display_flip()
 
     presses_count = 0
     done = False
@@ -923,9 +1350,10 @@ def show_effort_bar(target_presses, max_time=5, title_text="", is_calibration=Fa
     pygame.event.clear()
     
     tw = pygame.time.get_ticks()
+    effort_onset = tw
 
     while not done:
-        for event in pygame.event.get():
+        for event in get_events():
             if event.type == KEYUP and event.key == K_ESCAPE:
                 pygame_exit()
 
@@ -938,6 +1366,8 @@ def show_effort_bar(target_presses, max_time=5, title_text="", is_calibration=Fa
                 if first_press_time is None:
                     first_press_time = pygame.time.get_ticks() - tw
                 last_press_time = pygame.time.get_ticks() - tw
+                if press_log is not None:
+                    press_log.append(last_press_time)
                 
                 # Update progress bar
                 screen.fill(background)
@@ -971,9 +1401,11 @@ def show_effort_bar(target_presses, max_time=5, title_text="", is_calibration=Fa
 
     # Enviar marcador de fin de barra de esfuerzo
     if presses_count >= target_presses:
-        send_marker(MARKERS['EFFORT_BAR_SUCCESS'], f"Effort bar completed - Presses: {presses_count}")
+        send_marker(MARKERS['EFFORT_BAR_SUCCESS'], f"Effort bar completed - Presses: {presses_count}",
+                    presses=presses_count)
     else:
-        send_marker(MARKERS['EFFORT_BAR_FAIL'], f"Effort bar failed - Presses: {presses_count}/{target_presses}")
+        send_marker(MARKERS['EFFORT_BAR_FAIL'], f"Effort bar failed - Presses: {presses_count}/{target_presses}",
+                    presses=presses_count)
 
     # Block spacebar for 3 seconds
     block_spacebar(3000)
@@ -982,62 +1414,63 @@ def show_effort_bar(target_presses, max_time=5, title_text="", is_calibration=Fa
     return presses_count, presses_count >= target_presses, first_press_time, last_press_time
 
 
-def take_decision(buttons_number, credits_number, title_text, max_time = 5, test = False, effort_level = None, condition = None):
-    """Show decision screen with condition-specific colors and images"""
-    # CORRECCIÓN BUG: Limpiar el buffer de eventos antes de empezar
-    pygame.event.clear()
-    
-    # Enviar marcador de inicio de decisión según condición
-    if condition == "TI":
-        send_marker(MARKERS['DECISION_START_SELF'], f"Decision start - Self - Credits: {credits_number}")
-    elif condition == "GRUPO":
-        send_marker(MARKERS['DECISION_START_GROUP'], f"Decision start - Group - Credits: {credits_number}")
-    else:
-        send_marker(MARKERS['DECISION_START_OTHER'], f"Decision start - Other - Credits: {credits_number}")
-    
-    screen.fill(background)
+# Pantallas de decisión compuestas de antemano (ver preload_trial). Sólo guarda
+# las del próximo trial: cada una es una superficie de pantalla completa
+decision_screen_cache = {}
 
-    font = pygame.font.Font(None, 72)
-    
-    # Determine condition and colors based on internal condition name
+# Fuentes por defecto de pygame ya cargadas, por tamaño
+default_fonts = {}
+
+
+def get_default_font(size):
+    """pygame.font.Font(None, size) sin volver a leer el archivo de la fuente en cada pantalla"""
+    if size not in default_fonts:
+        default_fonts[size] = pygame.font.Font(None, size)
+    return default_fonts[size]
+
+
+def condition_style(condition):
+    """Color y nombre en pantalla según la condición interna"""
     if condition == "TI":
-        text_color = (255, 0, 0)  # Red for self
-        display_name = DISPLAY_NAME_SELF
+        return (255, 0, 0), DISPLAY_NAME_SELF  # Red for self
     elif condition == "OTRO":
-        text_color = (0, 0, 255)  # Blue for in-group
-        display_name = DISPLAY_NAME_INGROUP
+        return (0, 0, 255), DISPLAY_NAME_INGROUP  # Blue for in-group
     elif condition == "GRUPO":
-        text_color = (0, 128, 0)  # Green for out-group
-        display_name = DISPLAY_NAME_OUTGROUP
+        return (0, 128, 0), DISPLAY_NAME_OUTGROUP  # Green for out-group
     else:
-        text_color = (0, 128, 0)  # Green for neutral
-        display_name = ""
+        return (0, 128, 0), ""  # Green for neutral
+
+
+def compose_decision_screen(credits_number, effort_level, condition, work_side, test=False):
+    """Compone la pantalla de decisión en una superficie, con la opción de trabajar
+    a la izquierda (work_side = "left") o a la derecha, y calcula el cuadro de
+    selección de cada opción"""
+    frame = pygame.Surface(resolution).convert()
+    frame.fill(background)
+
+    font = get_default_font(scaled(72))
+    text_color, display_name = condition_style(condition)
 
     # Renderizar "Créditos para" en la primera línea
     text = font.render("Créditos para", True, text_color)
     text_rect = text.get_rect(center=(resolution[0]/2, (resolution[1]/6)))
-    screen.blit(text, text_rect)
+    frame.blit(text, text_rect)
     
     # Renderizar el nombre de la condición en la segunda línea
     if display_name:
         text2 = font.render(display_name, True, text_color)
-        text_rect2 = text2.get_rect(center=(resolution[0]/2, (resolution[1]/6) + 80))
-        screen.blit(text2, text_rect2)
-
-    # Changed from vertical to horizontal layout
-    button_positions = ["left", "right"]  # Left and right positions
+        text_rect2 = text2.get_rect(center=(resolution[0]/2, (resolution[1]/6) + scaled(80)))
+        frame.blit(text2, text_rect2)
 
-    shuffle(button_positions)
-    
     # Define positions for text and images (no button rectangles)
     left_x = resolution[0]/4  # Left side of screen
     right_x = 3*resolution[0]/4  # Right side of screen
     content_y = resolution[1]/2  # Vertically centered
     
-    font = pygame.font.Font(None, 48)
+    font = get_default_font(scaled(48))
     
     # Position 1 (Work option) - determine if left or right
-    if button_positions[0] == "left":
+    if work_side == "left":
         work_x = left_x
         rest_x = right_x
         work_key = "N"
@@ -1048,13 +1481,13 @@ def take_decision(buttons_number, credits_number, title_text, max_time = 5, test
         work_key = "M"
         rest_key = "N"
     
-    # Aquí se declara el tamaño de las imágenes - PERSONALIZABLE
-    standard_circle_size = 550
+    # Tamaño de las imágenes según la resolución (ver standard_circle_size)
+    circle_size = scaled(standard_circle_size)
     
     # Work option - credits text
     text = font.render(f"{credits_number} créditos", True, text_color)
-    text_rect = text.get_rect(centerx=work_x, centery=content_y - 130)
-    screen.blit(text, text_rect)
+    text_rect = text.get_rect(centerx=work_x, centery=content_y - scaled(130))
+    frame.blit(text, text_rect)
     
     # Store positions and sizes for drawing selection box
     work_img_rect = None
@@ -1066,279 +1499,217 @@ def take_decision(buttons_number, credits_number, title_text, max_time = 5, test
         try:
             # Use condition-specific image (self or other)
             if condition == "TI":
-                effort_image = pygame.image.load(join('media', f'{effort_level}_self.png'))
+                image_name = f'{effort_level}_self.png'
             elif condition == "OTRO":
-                effort_image = pygame.image.load(join('media', f'{effort_level}_other.png'))
+                image_name = f'{effort_level}_other.png'
             elif condition == "GRUPO":
-                effort_image = pygame.image.load(join('media', f'{effort_level}_group.png'))
+                image_name = f'{effort_level}_group.png'
             else:
                 # Fallback to self version if condition not specified
-                effort_image = pygame.image.load(join('media', f'{effort_level}_self.png'))
+                image_name = f'{effort_level}_self.png'
             
             # CORRECCIÓN: Escalar manteniendo la proporción original
-            original_width = effort_image.get_width()
-            original_height = effort_image.get_height()
-            
-            # Calcular el factor de escala manteniendo la proporción
-            scale_factor = standard_circle_size / max(original_width, original_height)
-            new_width = int(original_width * scale_factor)
-            new_height = int(original_height * scale_factor)
-            
-            # Escalar la imagen manteniendo su proporción
-            effort_image = pygame.transform.scale(effort_image, (new_width, new_height))
-            work_img_rect = effort_image.get_rect(centerx=work_x, centery=content_y + 20)
-            screen.blit(effort_image, work_img_rect)
+            effort_image = load_fitted_image(circle_size, image_name)
+            work_img_rect = effort_image.get_rect(centerx=work_x, centery=content_y + scaled(20))
+            frame.blit(effort_image, work_img_rect)
         except:
             # Fallback: draw a simple circle with text if image not found
-            circle_radius = standard_circle_size // 2
-            circle_center = (int(work_x), int(content_y + 20))
+            circle_radius = circle_size // 2
+            circle_center = (int(work_x), int(content_y + scaled(20)))
             work_img_rect = pygame.Rect(circle_center[0] - circle_radius, circle_center[1] - circle_radius, 
-                                        standard_circle_size, standard_circle_size)
-            pygame.draw.circle(screen, (255, 255, 255), circle_center, circle_radius)
-            pygame.draw.circle(screen, text_color, circle_center, circle_radius, 2)
-            fallback_font = pygame.font.Font(None, 24)
+                                        circle_size, circle_size)
+            pygame.draw.circle(frame, (255, 255, 255), circle_center, circle_radius)
+            pygame.draw.circle(frame, text_color, circle_center, circle_radius, 2)
+            fallback_font = get_default_font(scaled(24))
             text = fallback_font.render(f"{effort_level}%", True, text_color)
             text_rect = text.get_rect(center=circle_center)
-            screen.blit(text, text_rect)
+            frame.blit(text, text_rect)
 
     # Rest option - text
     text = font.render("1 crédito", True, text_color)
-    text_rect = text.get_rect(centerx=rest_x, centery=content_y - 130)
-    screen.blit(text, text_rect)
+    text_rect = text.get_rect(centerx=rest_x, centery=content_y - scaled(130))
+    frame.blit(text, text_rect)
     rest_text_rect = text_rect  # Guardar la posición del texto
     
     # Load and display rest image with same size as effort image
     try:
-        rest_image = pygame.image.load(join('media', 'Rest.png'))
         # CORRECCIÓN: Escalar manteniendo la proporción original
-        original_width = rest_image.get_width()
-        original_height = rest_image.get_height()
-        
-        # Calcular el factor de escala manteniendo la proporción
-        scale_factor = standard_circle_size / max(original_width, original_height)
-        new_width = int(original_width * scale_factor)
-        new_height = int(original_height * scale_factor)
-        
-        # Escalar la imagen manteniendo su proporción
-        rest_image = pygame.transform.scale(rest_image, (new_width, new_height))
-        rest_img_rect = rest_image.get_rect(centerx=rest_x, centery=content_y + 20)
-        screen.blit(rest_image, rest_img_rect)
+        rest_image = load_fitted_image(circle_size, 'Rest.png')
+        rest_img_rect = rest_image.get_rect(centerx=rest_x, centery=content_y + scaled(20))
+        frame.blit(rest_image, rest_img_rect)
     except:
         # Fallback: draw a simple circle with text if image not found
-        circle_radius = standard_circle_size // 2
-        circle_center = (int(rest_x), int(content_y + 20))
+        circle_radius = circle_size // 2
+        circle_center = (int(rest_x), int(content_y + scaled(20)))
         rest_img_rect = pygame.Rect(circle_center[0] - circle_radius, circle_center[1] - circle_radius, 
-                                    standard_circle_size, standard_circle_size)
-        pygame.draw.circle(screen, (255, 255, 255), circle_center, circle_radius)
-        pygame.draw.circle(screen, text_color, circle_center, circle_radius, 2)
-        fallback_font = pygame.font.Font(None, 24)
+                                    circle_size, circle_size)
+        pygame.draw.circle(frame, (255, 255, 255), circle_center, circle_radius)
+        pygame.draw.circle(frame, text_color, circle_center, circle_radius, 2)
+        fallback_font = get_default_font(scaled(24))
         text = fallback_font.render("Descanso", True, text_color)
         text_rect = text.get_rect(center=circle_center)
-        screen.blit(text, text_rect)
+        frame.blit(text, text_rect)
 
     # MODIFICACIÓN: NO mostrar el cuadro inicial
     # El cuadro solo aparecerá después de que se tome una decisión
     
     # Add key indicators below images ONLY in test mode
     if test:
-        key_font = pygame.font.Font(None, 60)
+        key_font = get_default_font(scaled(60))
         text_work = key_font.render(work_key, True, text_color)
-        text_work_rect = text_work.get_rect(centerx=work_x, top=content_y + 210)
-        screen.blit(text_work, text_work_rect)
+        text_work_rect = text_work.get_rect(centerx=work_x, top=content_y + scaled(210))
+        frame.blit(text_work, text_work_rect)
         
         text_rest = key_font.render(rest_key, True, text_color)
-        text_rest_rect = text_rest.get_rect(centerx=rest_x, top=content_y + 210)
-        screen.blit(text_rest, text_rest_rect)
+        text_rest_rect = text_rest.get_rect(centerx=rest_x, top=content_y + scaled(210))
+        frame.blit(text_rest, text_rest_rect)
 
         # Instructions at the bottom ONLY in test mode
-        instruction_font = pygame.font.Font(None, 36)
+        instruction_font = get_default_font(scaled(36))
         text = instruction_font.render("Presiona N para la opción izquierda o M para la opción derecha", True, (0, 0, 0))
         text_rect = text.get_rect(center=(resolution[0]/2, resolution[1] * 0.89))
-        screen.blit(text, text_rect)
+        frame.blit(text, text_rect)
 
-    pygame.display.flip()
+    # Cuadro de selección de cada opción (rodea el texto y la imagen)
+    # MODIFICACIÓN: Padding aumentado a 50px
+    box_padding = scaled(20)
+    box_rects = {}
+    # Si no se mostró la imagen de esfuerzo (effort_level None) no hay cuadro para trabajar
+    for option, img_rect, option_text_rect in [("work", work_img_rect, work_text_rect),
+                                               ("rest", rest_img_rect, rest_text_rect)]:
+        if img_rect and option_text_rect:
+            min_top = min(option_text_rect.top, img_rect.top)
+            max_bottom = max(option_text_rect.bottom, img_rect.bottom)
+            combined_height = max_bottom - min_top
+            
+            box_rects[option] = pygame.Rect(
+                img_rect.centerx - img_rect.width//2 - box_padding,
+                min_top - box_padding,
+                img_rect.width + box_padding * 2,
+                combined_height + box_padding * 2
+            )
+
+    # Parche de pantalla ya compuesto con el cuadro dibujado: al responder basta con
+    # copiarlo encima y actualizar sólo esa región de la pantalla
+    box_frames = {}
+    for option, box_rect in box_rects.items():
+        area = box_rect.clip(frame.get_rect())
+        patch = frame.subsurface(area).copy()
+        pygame.draw.rect(patch, (0, 0, 0), box_rect.move(-area.x, -area.y), max(1, scaled(5)))
+        box_frames[option] = (patch, area)
+
+    return {'surface': frame, 'work_side': work_side, 'box_rects': box_rects, 'box_frames': box_frames}
+
+
+def get_decision_screen(credits_number, effort_level, condition, work_side, test=False):
+    """Pantalla de decisión ya compuesta por preload_trial, o la compone en el momento"""
+    cache_key = (credits_number, effort_level, condition, work_side, test)
+    if cache_key in decision_screen_cache:
+        return decision_screen_cache[cache_key]
+    return compose_decision_screen(credits_number, effort_level, condition, work_side, test)
+
+
+def preload_trial(combination, effort_table=None, test=False):
+    """Compone de antemano las pantallas del trial `combination`: el aviso
+    "Créditos para" y la pantalla de decisión con ambas posiciones de las opciones
+    (con sus cuadros de selección). Se llama mientras se muestra el feedback del
+    trial anterior"""
+    decision_screen_cache.clear()
+    compose_windows(["Créditos para", get_display_name(combination[2])])
+    effort_level = effort_table[combination[0]] if effort_table else None
+    for work_side in ["left", "right"]:
+        cache_key = (combination[1], effort_level, combination[2], work_side, test)
+        decision_screen = decision_screen_cache[cache_key] = compose_decision_screen(combination[1], effort_level, combination[2], work_side, test)
+        if backend is not None:
+            # Con el backend sdl2 se suben ya las texturas
+            backend.prepare(decision_screen['surface'])
+            for patch, area in decision_screen['box_frames'].values():
+                backend.prepare(patch)
+
+
+@profiler.timed("take_decision")
+def take_decision(buttons_number, credits_number, title_text, max_time = 5, test = False, effort_level = None, condition = None):
+    """Show decision screen with condition-specific colors and images"""
+    global decision_onset
+    # CORRECCIÓN BUG: Limpiar el buffer de eventos antes de empezar
+    pygame.event.clear()
+
+    # Changed from vertical to horizontal layout
+    button_positions = ["left", "right"]  # Left and right positions
+
+    shuffle(button_positions)
+
+    # Pantalla ya compuesta (normalmente durante el feedback del trial anterior)
+    decision_screen = get_decision_screen(credits_number, effort_level, condition, button_positions[0], test)
+    
+    # Enviar marcador de inicio de decisión según condición
+    if condition == "TI":
+        send_marker(MARKERS['DECISION_START_SELF'], f"Decision start - Self - Credits: {credits_number}")
+    elif condition == "GRUPO":
+        send_marker(MARKERS['DECISION_START_GROUP'], f"Decision start - Group - Credits: {credits_number}")
+    else:
+        send_marker(MARKERS['DECISION_START_OTHER'], f"Decision start - Other - Credits: {credits_number}")
+    
+    show_layers([(decision_screen['surface'], (0, 0))])
+
+    # La ventana de decisión dura siempre max_time, responda o no el participante:
+    # tras la respuesta se muestra el cuadro de selección hasta el plazo, pero sin
+    # bloquear (se siguen atendiendo los eventos, ESC incluido)
+    DECISION_DEADLINE = USEREVENT + 3
+    decision_ms = int(round(max_time * 1000))
+    tw = pygame.time.get_ticks()
+    decision_onset = tw
+    deadline = tw + decision_ms
+    pygame.time.set_timer(DECISION_DEADLINE, decision_ms, loops=1)
 
-    done = False
     selected_button = 0
     key_pressed = None
-    tw = pygame.time.get_ticks()
     reaction_time = None
 
-    # MODIFICACIÓN: Padding aumentado a 50px
-    box_padding = 20
+    while True:
+        # Espera bloqueante hasta el próximo evento; el timer garantiza despertar en el plazo
+        event = pygame.event.wait(max(1, deadline - pygame.time.get_ticks()))
+        profiler.mark()
+        if event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE):
+            pygame_exit()
+
+        elif event.type == KEYUP and event.key in (K_n, K_m) and key_pressed is None:
+            reaction_time = pygame.time.get_ticks() - tw
+            key_pressed = "left" if event.key == K_n else "right"
+            if (button_positions[0] == "left") == (key_pressed == "left"):  # Opción de trabajar
+                selected_button = 1
+                selected_option = "work"
+                send_marker(MARKERS['RESPONSE_WORK'], f"Response: Work - RT: {reaction_time}ms", rt=reaction_time)
+            else:
+                selected_button = 2
+                selected_option = "rest"
+                send_marker(MARKERS['RESPONSE_REST'], f"Response: Rest - RT: {reaction_time}ms", rt=reaction_time)
 
-    while not done:
-        for event in pygame.event.get():
-            if event.type == KEYUP and event.key == K_ESCAPE:
-                    pygame_exit()
-            
-            elif event.type == KEYUP and event.key == K_n:
-                reaction_time = pygame.time.get_ticks() - tw
-                key_pressed = "left"
-                if button_positions[0] == "left":  # First button is on the left
-                    selected_button = 1
-                    selected_option = "work"
-                    selected_img_rect = work_img_rect
-                    selected_text_rect = work_text_rect
-                    send_marker(MARKERS['RESPONSE_WORK'], f"Response: Work - RT: {reaction_time}ms")
-                else:  # Second button is on the left
-                    selected_button = 2
-                    selected_option = "rest"
-                    selected_img_rect = rest_img_rect
-                    selected_text_rect = rest_text_rect
-                    send_marker(MARKERS['RESPONSE_REST'], f"Response: Rest - RT: {reaction_time}ms")
-                
-                # MODIFICACIÓN: Calcular tiempo de display del cuadro
-                time_to_show_box = (max_time * 1000) - reaction_time
-                
-                # Redibujar pantalla con el cuadro de selección (código completo para N y M)
-                _redraw_decision_screen_with_box(text_color, display_name, credits_number, 
-                                                effort_level, condition, work_x, rest_x, content_y,
-                                                selected_img_rect, selected_text_rect, box_padding,
-                                                standard_circle_size, test, work_key, rest_key)
-                
-                pygame.display.flip()
-                pygame.time.delay(int(time_to_show_box))
-                pygame.event.clear()
-                done = True
-                
-            elif event.type == KEYUP and event.key == K_m:
-                reaction_time = pygame.time.get_ticks() - tw
-                key_pressed = "right"
-                if button_positions[0] == "left":  # Second button is on the right
-                    selected_button = 2
-                    selected_option = "rest"
-                    selected_img_rect = rest_img_rect
-                    selected_text_rect = rest_text_rect
-                    send_marker(MARKERS['RESPONSE_REST'], f"Response: Rest - RT: {reaction_time}ms")
-                else:  # First button is on the right
-                    selected_button = 1
-                    selected_option = "work"
-                    selected_img_rect = work_img_rect
-                    selected_text_rect = work_text_rect
-                    send_marker(MARKERS['RESPONSE_WORK'], f"Response: Work - RT: {reaction_time}ms")
-                
-                # MODIFICACIÓN: Calcular tiempo de display del cuadro
-                time_to_show_box = (max_time * 1000) - reaction_time
-                
-                # Redibujar pantalla con el cuadro de selección
-                _redraw_decision_screen_with_box(text_color, display_name, credits_number, 
-                                                effort_level, condition, work_x, rest_x, content_y,
-                                                selected_img_rect, selected_text_rect, box_padding,
-                                                standard_circle_size, test, work_key, rest_key)
-                
-                pygame.display.flip()
-                pygame.time.delay(int(time_to_show_box))
-                pygame.event.clear()
-                done = True
-        
-        # Check for timeout without visual timer
-        rt = pygame.time.get_ticks() - tw
-        if rt >= max_time * 1000:
-            send_marker(MARKERS['RESPONSE_OMISSION'], f"Response: Timeout after {rt}ms")
-            done = True
+            # Cuadro de selección sobre la pantalla ya mostrada (sólo se actualiza su región)
+            _redraw_decision_screen_with_box(decision_screen, selected_option)
 
-    return (selected_button, key_pressed, reaction_time)
+        if event.type == DECISION_DEADLINE or pygame.time.get_ticks() >= deadline:
+            break
 
+    # Cuánto se pasó el trial de su plazo (latencia del timer y del bucle de eventos)
+    deadline_overshoot = pygame.time.get_ticks() - deadline
+    pygame.time.set_timer(DECISION_DEADLINE, 0)
+
+    if key_pressed is None:
+        send_marker(MARKERS['RESPONSE_OMISSION'], f"Response: Timeout after {decision_ms + deadline_overshoot}ms")
+    pygame.event.clear()
+
+    return (selected_button, key_pressed, reaction_time, deadline_overshoot)
 
-def _redraw_decision_screen_with_box(text_color, display_name, credits_number, 
-                                    effort_level, condition, work_x, rest_x, content_y,
-                                    selected_img_rect, selected_text_rect, box_padding,
-                                    standard_circle_size, test, work_key, rest_key):
-    """Helper function to redraw decision screen with selection box"""
-    screen.fill(background)
-    
-    # Redibujar título
-    font_title = pygame.font.Font(None, 72)
-    
-    # Renderizar "Créditos para" en la primera línea
-    text = font_title.render("Créditos para", True, text_color)
-    text_rect = text.get_rect(center=(resolution[0]/2, (resolution[1]/6)))
-    screen.blit(text, text_rect)
-    
-    # Renderizar el nombre de la condición en la segunda línea
-    if display_name:
-        text2 = font_title.render(display_name, True, text_color)
-        text_rect2 = text2.get_rect(center=(resolution[0]/2, (resolution[1]/6) + 80))
-        screen.blit(text2, text_rect2)
-    
-    # Redibujar todos los elementos
-    font = pygame.font.Font(None, 48)
-    
-    # Work option
-    text = font.render(f"{credits_number} créditos", True, text_color)
-    text_rect = text.get_rect(centerx=work_x, centery=content_y - 130)
-    screen.blit(text, text_rect)
-    
-    if effort_level is not None:
-        try:
-            if condition == "TI":
-                effort_image = pygame.image.load(join('media', f'{effort_level}_self.png'))
-            elif condition == "OTRO":
-                effort_image = pygame.image.load(join('media', f'{effort_level}_other.png'))
-            elif condition == "GRUPO":
-                effort_image = pygame.image.load(join('media', f'{effort_level}_group.png'))
-            
-            original_width = effort_image.get_width()
-            original_height = effort_image.get_height()
-            scale_factor = standard_circle_size / max(original_width, original_height)
-            new_width = int(original_width * scale_factor)
-            new_height = int(original_height * scale_factor)
-            
-            effort_image = pygame.transform.scale(effort_image, (new_width, new_height))
-            work_img_rect = effort_image.get_rect(centerx=work_x, centery=content_y + 20)
-            screen.blit(effort_image, work_img_rect)
-        except:
-            pass
-    
-    # Rest option
-    text = font.render("1 crédito", True, text_color)
-    text_rect = text.get_rect(centerx=rest_x, centery=content_y - 130)
-    screen.blit(text, text_rect)
-    
-    try:
-        rest_image = pygame.image.load(join('media', 'Rest.png'))
-        original_width = rest_image.get_width()
-        original_height = rest_image.get_height()
-        scale_factor = standard_circle_size / max(original_width, original_height)
-        new_width = int(original_width * scale_factor)
-        new_height = int(original_height * scale_factor)
-        
-        rest_image = pygame.transform.scale(rest_image, (new_width, new_height))
-        rest_img_rect = rest_image.get_rect(centerx=rest_x, centery=content_y + 20)
-        screen.blit(rest_image, rest_img_rect)
-    except:
-        pass
-    
-    # Add key indicators if in test mode
-    if test:
-        key_font = pygame.font.Font(None, 60)
-        text_work = key_font.render(work_key, True, text_color)
-        text_work_rect = text_work.get_rect(centerx=work_x, top=content_y + 210)
-        screen.blit(text_work, text_work_rect)
-        
-        text_rest = key_font.render(rest_key, True, text_color)
-        text_rest_rect = text_rest.get_rect(centerx=rest_x, top=content_y + 210)
-        screen.blit(text_rest, text_rest_rect)
-        
-        instruction_font = pygame.font.Font(None, 36)
-        text = instruction_font.render("Presiona N para la opción izquierda o M para la opción derecha", True, (0, 0, 0))
-        text_rect = text.get_rect(center=(resolution[0]/2, resolution[1] * 0.89))
-        screen.blit(text, text_rect)
-    
-    # Dibujar cuadro de selección
-    if selected_img_rect and selected_text_rect:
-        min_top = min(selected_text_rect.top, selected_img_rect.top)
-        max_bottom = max(selected_text_rect.bottom, selected_img_rect.bottom)
-        combined_height = max_bottom - min_top
-        
-        box_rect = pygame.Rect(
-            selected_img_rect.centerx - selected_img_rect.width//2 - box_padding,
-            min_top - box_padding,
-            selected_img_rect.width + box_padding * 2,
-            combined_height + box_padding * 2
-        )
-        pygame.draw.rect(screen, (0, 0, 0), box_rect, 5)
+
+@profiler.timed("_redraw_decision_screen_with_box")
+def _redraw_decision_screen_with_box(decision_screen, selected_option):
+    """Helper function to draw the selection box over the decision screen already
+    on display. Only the box region is copied and updated (dirty rect)"""
+    box_frame = decision_screen['box_frames'].get(selected_option)
+    if box_frame:
+        patch, area = box_frame
+        show_layers([(decision_screen['surface'], (0, 0)), (patch, area.topleft)], area)
 
 
 def show_resting(title_text, max_time = 5):
@@ -1367,12 +1738,12 @@ def show_resting(title_text, max_time = 5):
     resting_text_rect = text.get_rect(center=(resolution[0]/2, resolution[1]/2))
     screen.blit(text, resting_text_rect)
 
-    pygame.display.flip()
+    display_flip()
 
     tw = pygame.time.get_ticks()
 
     while True:
-        for event in pygame.event.get():
+        for event in get_events():
             if event.type == KEYUP and event.key == K_ESCAPE:
                 pygame_exit()
         # Check for timeout without visual timer
@@ -1381,8 +1752,96 @@ def show_resting(title_text, max_time = 5):
             return
 
 
+def build_block_schedule(self_combinations, other_combinations, group_combinations, blocks_number, block_type,
+                         repetitions_per_block = 1):
+    """Precalcula el orden de los trials de todos los bloques (lista de bloques)"""
+    schedule = []
+    for block_num in range(blocks_number):
+        if block_type == "division":
+            block_self_combinations = self_combinations * repetitions_per_block
+            block_other_combinations = other_combinations * repetitions_per_block
+            block_group_combinations = group_combinations * repetitions_per_block
+            actual_combinations_list = block_self_combinations + block_other_combinations + block_group_combinations
+        elif block_type == "total":
+            actual_combinations_list = (self_combinations + other_combinations + group_combinations) * repetitions_per_block
+        else:
+            print("Tipo de bloque no reconocido")
+            break
+
+        shuffle(actual_combinations_list)
+        schedule.append(actual_combinations_list)
+    return schedule
+
+
+def preload_task(combination, effort_table, test):
+    """idle_task para windows(): compone las pantallas del próximo trial durante el feedback"""
+    if combination is None:
+        return None
+    return lambda: preload_trial(combination, effort_table, test)
+
+
+def effort_planned_ms(target_reached, max_time):
+    """Duración planificada de show_effort_bar: max_time más el bloqueo de 3 s de la
+    barra espaciadora. Si se llega a la meta antes la duración depende del participante"""
+    if target_reached:
+        return None
+    return max_time * 1000 + 3000
+
+
+def trial_row(combination, effort_table, selection, presses_done, target_reached, earned_credits,
+              decision_reaction_time, first_press_time, last_press_time, decision_overshoot,
+              target_presses, capacity_estimate=None, capacity_anchor=None, decision_start=None,
+              effort_start=None, run="", block=None, trial=None):
+    """Fila de un trial del CSV de datos (ver la cabecera en main()).
+    decision_start, effort_start - get_ticks() del inicio de la decisión y de la barra
+    run - ejecución que escribe la fila (nombre base de sus archivos, cambia con --resume):
+          los ticks vuelven a 0 en cada una y se pasan a LSL con su <run>_clock_sync.json
+    block, trial - número de bloque y de trial (desde 1)"""
+    return "%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s\n" % (
+        effort_table[combination[0]], combination[1], 
+        condition_label(combination[2]),
+        "task" if selection == 1 else ("resting" if selection == 2 else "no decision"), 
+        presses_done if selection == 1 else 0, 
+        "True" if selection == 2 else target_reached, 
+        earned_credits, decision_reaction_time, 
+        first_press_time, last_press_time, decision_overshoot,
+        target_presses,
+        "" if capacity_estimate is None else "%.2f" % capacity_estimate,
+        "" if capacity_anchor is None else capacity_anchor,
+        decision_start, effort_start, run,
+        "" if block is None else block, "" if trial is None else trial
+    )
+
+
+def write_trial_row(file, *args, **kwargs):
+    """Escribe la fila de un trial en el CSV de datos (argumentos de trial_row)"""
+    file.write(trial_row(*args, **kwargs))
+    file.flush()
+
+
+def record_trial(block, trial, combination, effort_table, selection, presses_done, target_reached, earned_credits,
+                 decision_reaction_time, first_press_time, last_press_time, decision_overshoot, target_presses,
+                 press_log):
+    """Agrega el trial (y los ms de cada presión) a la base de resultados"""
+    results.add_trial(
+        block=block, trial=trial,
+        condition=condition_label(combination[2]),
+        effort=effort_table[combination[0]], credits=combination[1],
+        decision="task" if selection == 1 else ("resting" if selection == 2 else "no decision"),
+        presses=presses_done if selection == 1 else 0,
+        success=True if selection == 2 else bool(target_reached),
+        earned_credits=earned_credits, decision_rt=decision_reaction_time,
+        first_press_time=first_press_time, last_press_time=last_press_time,
+        decision_overshoot=decision_overshoot, target_presses=target_presses,
+        capacity_estimate=fatigue.mean if fatigue is not None else None,
+        capacity_anchor=fatigue.anchor if fatigue is not None else None)
+    results.add_presses(block, trial, press_log)
+
+
 def task(self_combinations, other_combinations, group_combinations, blocks_number, block_type, max_answer_time, 
-         test = False, decision_practice_trials = 1, file = None, effort_table = None):
+         test = False, decision_practice_trials = 1, file = None, effort_table = None, schedule = None, start = (0, 0)):
+    """Trials de práctica (test) o de la tarea. schedule - orden ya calculado (ver
+    build_block_schedule); start - (bloque, trial) desde el que se continúa"""
     # Para práctica
     if test:
         send_marker(MARKERS['PRACTICE_START'], "Practice trials start")
@@ -1392,38 +1851,47 @@ def task(self_combinations, other_combinations, group_combinations, blocks_numbe
         practice_group = random.sample(group_combinations, min(2, len(group_combinations)))
         actual_combinations_list = practice_self + practice_other + practice_group
         shuffle(actual_combinations_list)
+        preload_trial(actual_combinations_list[0], effort_table, test)
         
-        for combination in actual_combinations_list:
+        for trial_index, combination in enumerate(actual_combinations_list):
             first_button_pressed_time, last_button_pressed_time = None, None
+            next_combination = actual_combinations_list[trial_index + 1] if trial_index + 1 < len(actual_combinations_list) else None
 
             display_name = get_display_name(combination[2])
-            windows([f"Créditos para", display_name], K_SPACE, 1000)
-
+            trial_info = dict(block="practice", trial=trial_index + 1)
             effort_level = effort_table[combination[0]] if effort_table else None
-
-            selection, key_pressed, decision_reaction_time = take_decision(
-                combination[0], combination[1], f"Créditos para {display_name}", 
-                max_time = max_decision_time, test = test, effort_level = effort_level, 
-                condition = combination[2]
-            )
+            set_marker_context(block="practice", trial=trial_index + 1, effort=effort_level, credits=combination[1],
+                               condition=condition_label(combination[2]), target=combination[0])
+            with timed_phase("cue", 1000, **trial_info):
+                windows([f"Créditos para", display_name], K_SPACE, 1000)
+
+            with timed_phase("decision", max_decision_time * 1000, **trial_info):
+                selection, key_pressed, decision_reaction_time, decision_overshoot = take_decision(
+                    combination[0], combination[1], f"Créditos para {display_name}", 
+                    max_time = max_decision_time, test = test, effort_level = effort_level, 
+                    condition = combination[2]
+                )
 
             if selection not in [1, 2]:
                 while selection not in [1, 2]:
                     slide(select_slide('TestingDecision'), False, K_SPACE)
-                    selection, key_pressed, decision_reaction_time = take_decision(
+                    selection, key_pressed, decision_reaction_time, decision_overshoot = take_decision(
                         combination[0], combination[1], f"Créditos para {display_name}", 
                         max_time = max_decision_time, test = test, effort_level = effort_level,
                         condition = combination[2]
                     )
 
             if selection == 1:
-                presses_done, target_reached, first_press_time, last_press_time = show_effort_bar(
-                    target_presses=combination[0], max_time=max_answer_time, 
-                    title_text=f"Créditos para {display_name}"
-                )
+                with timed_phase("effort", **trial_info) as phase:
+                    presses_done, target_reached, first_press_time, last_press_time = show_effort_bar(
+                        target_presses=combination[0], max_time=max_answer_time, 
+                        title_text=f"Créditos para {display_name}"
+                    )
+                    phase["planned_ms"] = effort_planned_ms(target_reached, max_answer_time)
                 earned_credits = combination[1] if target_reached else 0
             elif selection == 2:
-                show_resting(f"Créditos para {display_name}", max_time = max_resting_time)
+                with timed_phase("rest", max_resting_time * 1000, **trial_info):
+                    show_resting(f"Créditos para {display_name}", max_time = max_resting_time)
                 earned_credits = 1
                 presses_done = 0
                 target_reached = True
@@ -1432,62 +1900,80 @@ def task(self_combinations, other_combinations, group_combinations, blocks_numbe
 
             # Enviar marcador de feedback
             if combination[2] == "TI":
-                send_marker(MARKERS['FEEDBACK_SELF_START'], f"Feedback self - Credits: {earned_credits}")
-                windows(["Has ganado", f"{earned_credits} créditos"], K_SPACE, 1000)
+                send_marker(MARKERS['FEEDBACK_SELF_START'], f"Feedback self - Credits: {earned_credits}", earned=earned_credits)
+                with timed_phase("feedback", 1000, **trial_info):
+                    windows(["Has ganado", f"{earned_credits} créditos"], K_SPACE, 1000, preload_task(next_combination, effort_table, test))
             elif combination[2] == "GRUPO":
-                send_marker(MARKERS['FEEDBACK_GROUP_START'], f"Feedback out-group - Credits: {earned_credits}")
-                windows([f"{DISPLAY_NAME_OUTGROUP} ha ganado", f"{earned_credits} créditos"], K_SPACE, 1000)
+                send_marker(MARKERS['FEEDBACK_GROUP_START'], f"Feedback out-group - Credits: {earned_credits}", earned=earned_credits)
+                with timed_phase("feedback", 1000, **trial_info):
+                    windows([f"{DISPLAY_NAME_OUTGROUP} ha ganado", f"{earned_credits} créditos"], K_SPACE, 1000, preload_task(next_combination, effort_table, test))
             else:
-                send_marker(MARKERS['FEEDBACK_OTHER_START'], f"Feedback in-group - Credits: {earned_credits}")
-                windows([f"{DISPLAY_NAME_INGROUP} ha ganado", f"{earned_credits} créditos"], K_SPACE, 1000)
+                send_marker(MARKERS['FEEDBACK_OTHER_START'], f"Feedback in-group - Credits: {earned_credits}", earned=earned_credits)
+                with timed_phase("feedback", 1000, **trial_info):
+                    windows([f"{DISPLAY_NAME_INGROUP} ha ganado", f"{earned_credits} créditos"], K_SPACE, 1000, preload_task(next_combination, effort_table, test))
         
+        set_marker_context()
         send_marker(MARKERS['PRACTICE_END'], "Practice trials end")
         return
     
     # Experimental trials (no práctica)
     repetitions_per_block = 1
-    
-    for block_num in range(blocks_number):
-        send_marker(MARKERS['BLOCK_START'], f"Block {block_num + 1} start")
-        
-        if block_type == "division":
-            block_self_combinations = self_combinations * repetitions_per_block
-            block_other_combinations = other_combinations * repetitions_per_block
-            block_group_combinations = group_combinations * repetitions_per_block
-            actual_combinations_list = block_self_combinations + block_other_combinations + block_group_combinations
-        elif block_type == "total":
-            actual_combinations_list = (self_combinations + other_combinations + group_combinations) * repetitions_per_block
-        else:
-            print("Tipo de bloque no reconocido")
-            break
 
-        shuffle(actual_combinations_list)
+    # Orden de todos los trials, para poder preparar cada trial durante el feedback del anterior
+    if schedule is None:
+        schedule = build_block_schedule(self_combinations, other_combinations, group_combinations, blocks_number,
+                                        block_type, repetitions_per_block)
+    start_block, start_trial = start
+    if start_block < len(schedule) and start_trial >= len(schedule[start_block]):
+        start_block, start_trial = start_block + 1, 0
+    if start_block < len(schedule):
+        preload_trial(schedule[start_block][start_trial], effort_table, test)
+    
+    for block_num, actual_combinations_list in enumerate(schedule):
+        if block_num < start_block:
+            continue
+        first_trial = start_trial if block_num == start_block else 0
+        set_marker_context(block=block_num + 1)
+        send_marker(MARKERS['BLOCK_START'], f"Block {block_num + 1} start")
         
         # DEBUG: Imprimir cantidad de trials en este bloque
         print(f"\n========== BLOQUE {block_num + 1} ==========")
         print(f"Total trials en este bloque: {len(actual_combinations_list)}")
         print(f"==========================================\n")
         
-        trial_counter = 0
-        for combination in actual_combinations_list:
+        trial_counter = first_trial
+        for combination in actual_combinations_list[first_trial:]:
             trial_counter += 1
+            if trial_counter < len(actual_combinations_list):
+                next_combination = actual_combinations_list[trial_counter]
+            elif block_num + 1 < len(schedule):
+                next_combination = schedule[block_num + 1][0]
+            else:
+                next_combination = None
             print(f"Trial {trial_counter}/{len(actual_combinations_list)} - Condición: {combination[2]}")
             
             first_button_pressed_time, last_button_pressed_time = None, None
 
             display_name = get_display_name(combination[2])
-            windows([f"Créditos para", display_name], K_SPACE, 1000)
-
+            trial_info = dict(block=block_num + 1, trial=trial_counter)
             effort_level = effort_table[combination[0]] if effort_table else None
-
-            selection, key_pressed, decision_reaction_time = take_decision(
-                combination[0], combination[1], f"Créditos para {display_name}", 
-                max_time = max_decision_time, test = test, effort_level = effort_level,
-                condition = combination[2]
-            )
+            # Con el modelo de fatiga el objetivo sale de la capacidad ancla del bloque
+            target_presses = fatigue.target(effort_level) if fatigue is not None and effort_table else combination[0]
+            set_marker_context(block=block_num + 1, trial=trial_counter, effort=effort_level, credits=combination[1],
+                               condition=condition_label(combination[2]), target=target_presses)
+            with timed_phase("cue", 1000, **trial_info):
+                windows([f"Créditos para", display_name], K_SPACE, 1000)
+
+            with timed_phase("decision", max_decision_time * 1000, **trial_info):
+                selection, key_pressed, decision_reaction_time, decision_overshoot = take_decision(
+                    combination[0], combination[1], f"Créditos para {display_name}", 
+                    max_time = max_decision_time, test = test, effort_level = effort_level,
+                    condition = combination[2]
+                )
 
             if selection not in [1, 2]:
-                show_resting(f"Créditos para {display_name}", max_time = max_resting_time)
+                with timed_phase("rest", max_resting_time * 1000, **trial_info):
+                    show_resting(f"Créditos para {display_name}", max_time = max_resting_time)
                 presses_done = 0
                 target_reached = False
                 first_press_time = None
@@ -1495,59 +1981,93 @@ def task(self_combinations, other_combinations, group_combinations, blocks_numbe
                 earned_credits = 0
 
             elif selection == 1:
-                presses_done, target_reached, first_press_time, last_press_time = show_effort_bar(
-                    target_presses=combination[0], max_time=max_answer_time, 
-                    title_text=f"Créditos para {display_name}"
-                )
+                press_log = []
+                with timed_phase("effort", **trial_info) as phase:
+                    presses_done, target_reached, first_press_time, last_press_time = show_effort_bar(
+                        target_presses=target_presses, max_time=max_answer_time, 
+                        title_text=f"Créditos para {display_name}", press_log=press_log
+                    )
+                    phase["planned_ms"] = effort_planned_ms(target_reached, max_answer_time)
                 earned_credits = combination[1] if target_reached else 0
+                if fatigue is not None and effort_table:
+                    fatigue.update(effort_level, press_log, target_reached)
 
             elif selection == 2:
-                show_resting(f"Créditos para {display_name}", max_time = max_resting_time)
+                with timed_phase("rest", max_resting_time * 1000, **trial_info):
+                    show_resting(f"Créditos para {display_name}", max_time = max_resting_time)
                 earned_credits = 1
                 presses_done = 0
                 target_reached = True
                 first_press_time = None
                 last_press_time = None
             
-            # Log data
+            # Log data. La base recibe el trial antes que el punto de control (si se repite
+            # se reemplaza), y la fila del CSV se guarda primero en el punto de control, junto
+            # con el cursor ya avanzado, y después en el CSV: si el proceso muere entre los
+            # dos, --resume la agrega al CSV (restore_row) y no se repite el trial
+            row = trial_row(combination, effort_table, selection, presses_done, target_reached,
+                            earned_credits, decision_reaction_time, first_press_time, last_press_time,
+                            decision_overshoot, target_presses,
+                            fatigue.mean if fatigue is not None else None,
+                            fatigue.anchor if fatigue is not None else None,
+                            decision_onset, effort_onset if selection == 1 else None,
+                            os.path.basename(timeline_base) if timeline_base else "",
+                            block_num + 1, trial_counter)
+            if results is not None and not test:
+                record_trial(block_num + 1, trial_counter, combination, effort_table, selection, presses_done,
+                             target_reached, earned_credits, decision_reaction_time, first_press_time,
+                             last_press_time, decision_overshoot, target_presses,
+                             press_log if selection == 1 else ())
+            if checkpoint is not None:
+                checkpoint.trial_done(block_num, trial_counter - 1,
+                                      fatigue=fatigue.to_state() if fatigue is not None else None, row=row)
             if file != None:
-                file.write("%s,%s,%s,%s,%s,%s,%s,%s,%s,%s\n" % (
-                    effort_table[combination[0]], combination[1], 
-                    "Self" if combination[2] == "TI" else ("Group" if combination[2] == "GRUPO" else "Other"), 
-                    "task" if selection == 1 else ("resting" if selection == 2 else "no decision"), 
-                    presses_done if selection == 1 else 0, 
-                    "True" if selection == 2 else target_reached, 
-                    earned_credits, decision_reaction_time, 
-                    first_press_time, last_press_time
-                ))
+                file.write(row)
                 file.flush()
             
             # Enviar marcador de feedback y mostrar créditos ganados
             if combination[2] == "TI":
-                send_marker(MARKERS['FEEDBACK_SELF_START'], f"Feedback self - Credits: {earned_credits}")
-                send_marker(MARKERS['FEEDBACK_CREDITS'] + earned_credits, f"Credits earned: {earned_credits}")
-                windows(["Has ganado", f"{earned_credits} créditos"], K_SPACE, 1000)
+                send_marker(MARKERS['FEEDBACK_SELF_START'], f"Feedback self - Credits: {earned_credits}", earned=earned_credits)
+                send_marker(MARKERS['FEEDBACK_CREDITS'] + earned_credits, f"Credits earned: {earned_credits}", earned=earned_credits)
+                with timed_phase("feedback", 1000, **trial_info):
+                    windows(["Has ganado", f"{earned_credits} créditos"], K_SPACE, 1000, preload_task(next_combination, effort_table, test))
             elif combination[2] == "GRUPO":
-                send_marker(MARKERS['FEEDBACK_GROUP_START'], f"Feedback out-group - Credits: {earned_credits}")
-                send_marker(MARKERS['FEEDBACK_CREDITS'] + earned_credits, f"Credits earned: {earned_credits}")
-                windows([f"{DISPLAY_NAME_OUTGROUP} ha ganado", f"{earned_credits} créditos"], K_SPACE, 1000)
+                send_marker(MARKERS['FEEDBACK_GROUP_START'], f"Feedback out-group - Credits: {earned_credits}", earned=earned_credits)
+                send_marker(MARKERS['FEEDBACK_CREDITS'] + earned_credits, f"Credits earned: {earned_credits}", earned=earned_credits)
+                with timed_phase("feedback", 1000, **trial_info):
+                    windows([f"{DISPLAY_NAME_OUTGROUP} ha ganado", f"{earned_credits} créditos"], K_SPACE, 1000, preload_task(next_combination, effort_table, test))
             else:
-                send_marker(MARKERS['FEEDBACK_OTHER_START'], f"Feedback in-group - Credits: {earned_credits}")
-                send_marker(MARKERS['FEEDBACK_CREDITS'] + earned_credits, f"Credits earned: {earned_credits}")
-                windows([f"{DISPLAY_NAME_INGROUP} ha ganado", f"{earned_credits} créditos"], K_SPACE, 1000)
+                send_marker(MARKERS['FEEDBACK_OTHER_START'], f"Feedback in-group - Credits: {earned_credits}", earned=earned_credits)
+                send_marker(MARKERS['FEEDBACK_CREDITS'] + earned_credits, f"Credits earned: {earned_credits}", earned=earned_credits)
+                with timed_phase("feedback", 1000, **trial_info):
+                    windows([f"{DISPLAY_NAME_INGROUP} ha ganado", f"{earned_credits} créditos"], K_SPACE, 1000, preload_task(next_combination, effort_table, test))
 
+        set_marker_context(block=block_num + 1)
         send_marker(MARKERS['BLOCK_END'], f"Block {block_num + 1} end")
+
+        if fatigue is not None and fatigue.end_block(block_num):
+            print(f"Modelo de fatiga: nueva capacidad ancla {fatigue.anchor} (índice de fatiga {fatigue.fatigue_index:.2f})")
+            if checkpoint is not None:
+                checkpoint.update(fatigue=fatigue.to_state())
         
         if block_num < blocks_number - 1:  # No mostrar break después del último bloque
-            slide(select_slide('Break'), False, K_SPACE)
+            with timed_phase("block_break", block=block_num + 1):
+                slide(select_slide('Break'), False, K_SPACE)
+
+    set_marker_context()
 
 
 # Main Function
-def main():
-    """Game's main loop"""
+def main(resume=False):
+    """Game's main loop. Con resume=True continúa la última sesión sin terminar
+    del participante desde su punto de control (ver session_checkpoint.py)"""
+    global timeline, timeline_base, fatigue, checkpoint, results, marker_validator, clock_sampler, experiment_ended
     
     # Inicializar conexión LSL
-    initialize_lsl()
+    if use_lsl:
+        initialize_lsl()
+    if check_markers:
+        marker_validator = MarkerGrammar(MARKERS).validator()
 
     # Si no existe la carpeta data se crea
     if not os.path.exists('data/'):
@@ -1565,92 +2085,167 @@ def main():
 
     pygame.init()
 
-    csv_name = join('data', date_name + "_" + subj_name + ".csv")
-    dfile = open(csv_name, 'w')
-    # condition = self/other
-    dfile.write("%s,%s,%s,%s,%s,%s,%s,%s,%s,%s\n" % ("NivelEsfuerzo", "NivelReward", "Condición", "Decisión", "PresionesHechas", "ÉxitoTarea", "CréditosGanados", "TiempoReacciónDecisión", "TiempoReacciónPrimerPresión", "TiempoReacciónÚltimaPresión"))
+    resumed = SessionCheckpoint.latest('data', subj_name) if resume else None
+    if resume and resumed is None:
+        print("No hay una sesión sin terminar de este participante, se empieza una nueva")
+    elif resumed is not None and resumed.state["stage"] == "started":
+        print("La sesión anterior se cortó durante la calibración, se empieza una nueva")
+        resumed = None
+
+    if resumed is not None:
+        # Se sigue escribiendo en el CSV y el punto de control de la sesión cortada
+        checkpoint = resumed
+        session_base = checkpoint.state["base"]
+        print(f"Reanudando la sesión {session_base} (etapa: {checkpoint.state['stage']})")
+        if checkpoint.restore_row(session_base + ".csv"):
+            print("Se agregó al CSV la fila del último trial (el corte fue antes de escribirla)")
+        dfile = open(session_base + ".csv", 'a', encoding='utf-8')
+    else:
+        session_base = join('data', date_name + "_" + subj_name)
+        checkpoint = SessionCheckpoint(checkpoint_path(session_base), {"subj_name": subj_name, "base": session_base,
+                                                                       "stage": "started"})
+        checkpoint.save()
+        dfile = open(session_base + ".csv", 'w', encoding='utf-8')
+        # condition = self/other
+        dfile.write("%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s\n" % ("NivelEsfuerzo", "NivelReward", "Condición", "Decisión", "PresionesHechas", "ÉxitoTarea", "CréditosGanados", "TiempoReacciónDecisión", "TiempoReacciónPrimerPresión", "TiempoReacciónÚltimaPresión", "DesfaseFinDecisión", "ObjetivoPresiones", "CapacidadEstimada", "CapacidadAncla", "InicioDecisión", "InicioBarra", "Ejecución", "Bloque", "Trial"))
     dfile.flush()
 
-    init()
-
-    # Enviar marcador de inicio del experimento
-    send_marker(MARKERS['EXPERIMENT_START'], "Experiment started")
-    slide(select_slide('welcome'), False, K_RIGHT)
-
-    # ------------------- calibration block ------------------------
-    send_marker(MARKERS['CALIBRATION_START'], "Calibration start")
-    calibration_slide(select_slide('Instructions_Casillas'), K_RIGHT, "testing_schema.jpg")
-
-    # Calibraciones
-    presses_count_1, _, _, _ = show_effort_bar(target_presses=50, max_time=max_answer_time, title_text="Comienza!", is_calibration=True)
-    slide(select_slide('Interlude_Casillas'), False, K_RIGHT)
-
-    target_calibration_2 = ceil(presses_count_1 * 1.1)
-    presses_count_2, _, _, _ = show_effort_bar(target_presses=target_calibration_2, max_time=max_answer_time, title_text="Comienza!", is_calibration=True)
-    slide(select_slide('Interlude_Casillas'), False, K_RIGHT)
+    # Informe de desfase de la sesión: data/<fecha>_<id>_timeline.csv, _drift.txt y _drift_hist.csv
+    # (los de una sesión reanudada no pisan los del tramo anterior)
+    timeline = SessionTimeline()
+    timeline_base = session_base if resumed is None else session_base + "_resume_" + strftime("%H-%M-%S", gmtime())
+    if profile_mode:
+        profiler.enable()
+    if clock_sync:
+        # get_ticks() vuelve a 0 en cada ejecución: una sesión reanudada tiene su propio modelo
+        clock_sampler = start_clock_sync(timeline_base)
+
+    if results_db:
+        # sqlite3 se importa sólo si se usa la base (como pylsl en initialize_lsl())
+        from results_store import ResultsStore
+        # Una sesión reanudada sigue con el mismo id (los trials repetidos y sus presiones se reemplazan)
+        results = ResultsStore(results_db)
+        results.start_session(os.path.basename(session_base), subj_name)
 
-    max_previous = max(presses_count_1, presses_count_2)
-    target_calibration_3 = ceil(max_previous * 1.1)
-    presses_count_3, _, _, _ = show_effort_bar(target_presses=target_calibration_3, max_time=max_answer_time, title_text="Comienza!", is_calibration=True)
-
-    # Usar el máximo de las tres calibraciones
-    max_presses_count = max(presses_count_1, presses_count_2, presses_count_3)
-    if max_presses_count < min_buttons:
-        max_presses_count = min_buttons
-    send_marker(MARKERS['CALIBRATION_END'], f"Calibration end - Max presses: {max_presses_count}")
+    init()
 
-    # ------------------- NEW: Loading screen and Pre-Instructions -------------------
-    # Mostrar GIF de carga por 10 segundos
-    slide(select_slide('Cargando'), False, K_RIGHT)
-    show_gif_loading(duration_ms=30000)
+    # Pre-renderizar las diapositivas de instrucciones (avanzar es sólo blit + flip)
+    compile_slides()
+
+    if resumed is None:
+        # Enviar marcador de inicio del experimento
+        send_marker(MARKERS['EXPERIMENT_START'], "Experiment started")
+        slide(select_slide('welcome'), False, K_RIGHT)
+
+        # ------------------- calibration block ------------------------
+        send_marker(MARKERS['CALIBRATION_START'], "Calibration start")
+        calibration_slide(select_slide('Instructions_Casillas'), K_RIGHT, "testing_schema.jpg")
+
+        # Calibraciones: se repiten hasta que la estimación de la cantidad máxima de
+        # presiones es estable (como antes, a lo sumo 3 intentos)
+        calibration = AdaptiveCalibration(max_answer_time * 1000, tolerance=calibration_tolerance,
+                                          min_attempts=calibration_min_attempts, max_attempts=calibration_max_attempts)
+        while not calibration.done():
+            if calibration.attempts:
+                slide(select_slide('Interlude_Casillas'), False, K_RIGHT)
+            target_calibration = calibration.next_target()
+            press_log = []
+            with timed_phase("calibration", attempt=len(calibration.attempts) + 1) as phase:
+                _, calibration_reached, _, _ = show_effort_bar(target_presses=target_calibration, max_time=max_answer_time, title_text="Comienza!", is_calibration=True, press_log=press_log)
+                phase["planned_ms"] = effort_planned_ms(calibration_reached, max_answer_time)
+            calibration.add_attempt(target_calibration, press_log, calibration_reached)
+
+        max_presses_count = calibration.max_presses(min_buttons)
+        ci_low, ci_high = calibration.interval()
+        print(f"Calibración: {max_presses_count} presiones (IC 95 %: {ci_low:.1f} - {ci_high:.1f}, {len(calibration.attempts)} intentos)")
+        calibration.write_log(timeline_base + "_calibration.csv")
+        if results is not None:
+            results.add_calibration(calibration.attempts)
+        if fatigue_mode:
+            fatigue = FatigueModel(max_presses_count, max_answer_time * 1000, capacity_sd=sqrt(calibration.variance),
+                                   reanchor=fatigue_reanchor)
+        send_marker(MARKERS['CALIBRATION_END'], f"Calibration end - Max presses: {max_presses_count} - CI95: {ci_low:.1f}-{ci_high:.1f}")
+        effort_levels_recalculated = [ceil(max_presses_count*(effort/100)) for effort in effort_levels]
+        # effort table effort_levels_recalculated: effort_levels
+        effort_table = dict(zip(effort_levels_recalculated, effort_levels))
+        checkpoint.update(stage="calibrated", max_presses_count=max_presses_count,
+                          effort_table=encode_effort_table(effort_table),
+                          fatigue=fatigue.to_state() if fatigue is not None else None)
+
+        # ------------------- NEW: Loading screen and Pre-Instructions -------------------
+        # Mostrar GIF de carga por 10 segundos
+        slide(select_slide('Cargando'), False, K_RIGHT)
+        with timed_phase("loading", 30000):
+            show_gif_loading(duration_ms=30000)
+
+        # ------------------- Decision instructions block ------------------------
+        slide(select_slide('Pre_Instructions'), False, K_RIGHT)
+        slide(select_slide('Instructions_Decision_1'), False, K_RIGHT)
+        cases_slide(select_slide('Instructions_Decision_2'), K_RIGHT, ["TI_schema.jpg"])
+        slide(select_slide('Instructions_Decision_3'), False, K_RIGHT)
+        slide(select_slide('Instructions_Decision_final'), False, K_RIGHT)
 
-    # ------------------- Decision instructions block ------------------------
-    slide(select_slide('Pre_Instructions'), False, K_RIGHT)
-    slide(select_slide('Instructions_Decision_1'), False, K_RIGHT)
-    cases_slide(select_slide('Instructions_Decision_2'), K_RIGHT, ["TI_schema.jpg"])
-    slide(select_slide('Instructions_Decision_3'), False, K_RIGHT)
-    slide(select_slide('Instructions_Decision_final'), False, K_RIGHT)
+    else:
+        # Calibración de la sesión cortada
+        max_presses_count = checkpoint.state["max_presses_count"]
+        effort_table = decode_effort_table(checkpoint.state["effort_table"])
+        if fatigue_mode and checkpoint.state.get("fatigue"):
+            fatigue = FatigueModel.from_state(checkpoint.state["fatigue"])
+        send_marker(MARKERS['SESSION_RESUMED'], f"Session resumed - Stage: {checkpoint.state['stage']}")
+        slide(select_slide('Resume'), False, K_RIGHT)
 
     # ------------------------ Training Section -----------------------------
     effort_levels_recalculated = [ceil(max_presses_count*(effort/100)) for effort in effort_levels]
-    # effort table effort_levels_recalculated: effort_levels
-    effort_table = dict(zip(effort_levels_recalculated, effort_levels))
 
-    self_combinations = list(itertools.product(effort_levels_recalculated, credits_levels, ["TI"]))
-    other_combinations = list(itertools.product(effort_levels_recalculated, credits_levels, ["OTRO"]))
-    group_combinations = list(itertools.product(effort_levels_recalculated, credits_levels, ["GRUPO"]))
-    
-    shuffle(self_combinations)
-    shuffle(other_combinations)
-    shuffle(group_combinations)
-
-    # Testing Trials for all effort levels
-    for iteration in range(practice_iterations):
-        # Agregar mensaje entre las dos rondas de práctica
-        if iteration == 1:  # Antes de la segunda ronda
-            slide(select_slide('Interlude_Practice'), False, K_RIGHT)
+    # Si se retoma durante la práctica, ésta se repite; durante la tarea se sigue en el trial siguiente
+    if checkpoint.state["stage"] == "calibrated":
+        self_combinations = list(itertools.product(effort_levels_recalculated, credits_levels, ["TI"]))
+        other_combinations = list(itertools.product(effort_levels_recalculated, credits_levels, ["OTRO"]))
+        group_combinations = list(itertools.product(effort_levels_recalculated, credits_levels, ["GRUPO"]))
+    
+        shuffle(self_combinations)
+        shuffle(other_combinations)
+        shuffle(group_combinations)
+
+        # Testing Trials for all effort levels
+        for iteration in range(practice_iterations):
+            # Agregar mensaje entre las dos rondas de práctica
+            if iteration == 1:  # Antes de la segunda ronda
+                slide(select_slide('Interlude_Practice'), False, K_RIGHT)
         
-        for i, effort_level in enumerate(effort_levels_recalculated):
-            # Show effort circle preview before each practice level
-            show_effort_preview(effort_level, effort_levels[i])
-            # Then show the practice trial
-            show_effort_bar(target_presses=effort_level, max_time=max_answer_time, title_text=f"Créditos para TI")
-
-    # Testing full block      
-    slide(select_slide('Effort_ending'), False, K_RIGHT)
-    task(self_combinations, other_combinations, group_combinations, blocks_number, block_type, max_answer_time, test = True, decision_practice_trials = decision_practice_trials, effort_table = effort_table)
-    slide(select_slide('Practice_ending'), False, K_RIGHT)
+            for i, effort_level in enumerate(effort_levels_recalculated):
+                # Show effort circle preview before each practice level
+                show_effort_preview(effort_level, effort_levels[i])
+                # Then show the practice trial
+                show_effort_bar(target_presses=effort_level, max_time=max_answer_time, title_text=f"Créditos para TI")
+
+        # Testing full block      
+        slide(select_slide('Effort_ending'), False, K_RIGHT)
+        task(self_combinations, other_combinations, group_combinations, blocks_number, block_type, max_answer_time, test = True, decision_practice_trials = decision_practice_trials, effort_table = effort_table)
+        slide(select_slide('Practice_ending'), False, K_RIGHT)
+
+        # Orden de los trials de la tarea, guardado antes de empezar para poder retomarla
+        schedule = build_block_schedule(self_combinations, other_combinations, group_combinations, blocks_number,
+                                        block_type)
+        checkpoint.update(stage="experiment", schedule=encode_schedule(schedule), cursor=[0, 0])
 
     # ------------------------ Experiment Section -----------------------------
     # Experiment Starting
-    task(self_combinations, other_combinations, group_combinations, blocks_number, block_type, max_answer_time, file = dfile, effort_table = effort_table)
+    task([], [], [], blocks_number, block_type, max_answer_time, file = dfile, effort_table = effort_table,
+         schedule = decode_schedule(checkpoint.state["schedule"]), start = tuple(checkpoint.state["cursor"]))
     dfile.flush()
+    checkpoint.update(stage="finished")
     slide(select_slide('farewell'), True, K_RIGHT)
     dfile.close()
     
     # Enviar marcador de fin del experimento
     send_marker(MARKERS['EXPERIMENT_END'], "Experiment completed")
+    experiment_ended = True
+    write_timeline_reports()
+    if results is not None:
+        results.flush()
     ends()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # python Prosocial_Effort_Task.py --resume: continúa la última sesión cortada del participante
+    main(resume="--resume" in sys.argv[1:])
\ No newline at end of file
@@ -14,7 +14,7 @@
 """
 tested in Python 3.10.18
 """
-import pygame, sys, os, cv2, math
+import pygame, sys, os, math
 from pygame.locals import FULLSCREEN, USEREVENT, KEYUP, KEYDOWN, K_SPACE, K_RETURN, K_ESCAPE, QUIT, Color, K_c, K_n, K_m, K_RIGHT
 from os.path import join
 from time import gmtime, strftime
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Paquete de recursos (imágenes y fuentes) en un único archivo indexado.
+
+Las imágenes se guardan ya decodificadas como RGBA (y opcionalmente en
+versiones pre-escaladas), de modo que al ejecutar la tarea no hay que
+descomprimir PNG/JPG: el archivo se abre con mmap y cada imagen se entrega a
+pygame.image.frombuffer sin copiar los bytes.
+
+Formato (little endian):
+    8 bytes   MAGIC
+    4 bytes   largo del índice JSON
+    N bytes   índice JSON {"version": 1, "entries": {nombre: {...}}}
+    datos     bloques alineados a ALIGNMENT bytes
+
+Las versiones pre-escaladas se guardan con el nombre "<nombre>@<ancho>x<alto>".
+
+Para generar el paquete:
+    python asset_pack.py media media/assets.pak --circle-size 550
+
+Con --circle-size los círculos se guardan sólo en su versión pre-escalada
+(salvo --keep-originals), ya que la tarea nunca los muestra a 1920x1080.
+"""
+import argparse
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+from os.path import join, relpath
+
+import pygame
+
+MAGIC = b"PETPAK01"
+PACK_VERSION = 1
+ALIGNMENT = 16
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+FONT_EXTENSIONS = (".ttf", ".otf")
+
+# Imágenes de los círculos de esfuerzo y descanso (las que se escalan en take_decision)
+CIRCLE_IMAGES = ["{}_{}.png".format(level, kind)
+                 for level in (50, 65, 80, 95) for kind in ("self", "other", "group")] + ["Rest.png"]
+
+# Recursos que usa la tarea (media/images/Previos no se empaqueta)
+TASK_ASSETS = CIRCLE_IMAGES + ["images/testing_schema.jpg", "images/TI_schema.jpg", "Arial_Rounded_MT_Bold.ttf"]
+
+
+class AssetPackError(Exception):
+    pass
+
+
+def variant_name(name, size):
+    """Nombre con el que se guarda una versión pre-escalada de una imagen"""
+    return "{}@{}x{}".format(name, int(size[0]), int(size[1]))
+
+
+def fit_size(size, max_side):
+    """Escala (ancho, alto) para que el lado mayor mida max_side, manteniendo la proporción"""
+    scale_factor = max_side / max(size)
+    return (int(size[0] * scale_factor), int(size[1] * scale_factor))
+
+
+def surface_to_rgba(surface):
+    """Devuelve los bytes RGBA de una superficie (compatible con pygame < 2.1.3)"""
+    tobytes = getattr(pygame.image, "tobytes", None) or pygame.image.tostring
+    return tobytes(surface, "RGBA")
+
+
+def write_pack(out_path, images, fonts, sources=None):
+    """Escribe un paquete.
+
+    images - dict nombre -> pygame.Surface
+    fonts - dict nombre -> bytes del archivo de fuente
+    sources - dict nombre de variante -> (nombre original, tamaño original)
+    """
+    sources = sources or {}
+    blobs = []
+    entries = {}
+    for name, surface in images.items():
+        blobs.append((name, surface_to_rgba(surface)))
+        entries[name] = {"kind": "image", "size": list(surface.get_size()), "format": "RGBA"}
+        if name in sources:
+            entries[name]["source"] = sources[name][0]
+            entries[name]["source_size"] = list(sources[name][1])
+    for name, data in fonts.items():
+        blobs.append((name, bytes(data)))
+        entries[name] = {"kind": "font"}
+
+    # El índice incluye los offsets, así que se calcula su tamaño en dos pasadas
+    def layout(index_length):
+        offset = _align(len(MAGIC) + 4 + index_length)
+        for name, data in blobs:
+            entries[name]["offset"] = offset
+            entries[name]["length"] = len(data)
+            offset = _align(offset + len(data))
+        return json.dumps({"version": PACK_VERSION, "entries": entries}, sort_keys=True).encode("utf-8")
+
+    index = layout(0)
+    while True:
+        new_index = layout(len(index))
+        if len(new_index) == len(index):
+            index = new_index
+            break
+        index = new_index
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(index)))
+        f.write(index)
+        for name, data in blobs:
+            f.write(b"\0" * (entries[name]["offset"] - f.tell()))
+            f.write(data)
+    os.replace(tmp_path, out_path)
+
+
+def build_pack(media_dir, out_path, names=None, variants=None, keep_originals=True):
+    """Empaqueta imágenes y fuentes de media_dir.
+
+    names - rutas relativas a media_dir a incluir (None incluye todo el directorio)
+    variants - dict nombre -> lista de tamaños (ancho, alto) pre-escalados a incluir
+    keep_originals - si es False, las imágenes con variantes sólo se guardan pre-escaladas
+    """
+    if names is None:
+        names = []
+        for root, _, files in os.walk(media_dir):
+            for filename in sorted(files):
+                names.append(relpath(join(root, filename), media_dir).replace(os.sep, "/"))
+
+    images = {}
+    fonts = {}
+    sources = {}
+    for name in names:
+        path = join(media_dir, *name.split("/"))
+        if not os.path.exists(path):
+            continue
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            images[name] = pygame.image.load(path)
+        elif name.lower().endswith(FONT_EXTENSIONS):
+            with open(path, "rb") as f:
+                fonts[name] = f.read()
+
+    for name, sizes in (variants or {}).items():
+        if name not in images:
+            continue
+        source = images[name]
+        if source.get_bitsize() not in (24, 32):
+            # smoothscale sólo acepta superficies de 24 o 32 bits
+            converted = pygame.Surface(source.get_size(), pygame.SRCALPHA, 32)
+            converted.blit(source, (0, 0))
+            source = converted
+        for size in sizes:
+            scaled_name = variant_name(name, size)
+            images[scaled_name] = pygame.transform.smoothscale(source, (int(size[0]), int(size[1])))
+            sources[scaled_name] = (name, source.get_size())
+        if not keep_originals:
+            del images[name]
+
+    write_pack(out_path, images, fonts, sources)
+    return len(images), len(fonts)
+
+
+class AssetPack:
+    """Lectura de un paquete mediante mmap (las imágenes no se copian)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise AssetPackError("Paquete vacío: " + path)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise AssetPackError("No es un paquete de recursos válido: " + path)
+        index_length = struct.unpack_from("<I", self._map, len(MAGIC))[0]
+        start = len(MAGIC) + 4
+        index = json.loads(bytes(self._map[start:start + index_length]).decode("utf-8"))
+        if index.get("version") != PACK_VERSION:
+            self.close()
+            raise AssetPackError("Versión de paquete no soportada: " + str(index.get("version")))
+        self.entries = index["entries"]
+        self._view = memoryview(self._map)
+
+        # Tamaño original de cada imagen, aunque sólo se hayan guardado sus variantes
+        self.source_sizes = {}
+        for name, entry in self.entries.items():
+            if entry["kind"] != "image":
+                continue
+            if "source" in entry:
+                self.source_sizes.setdefault(entry["source"], tuple(entry["source_size"]))
+            else:
+                self.source_sizes[name] = tuple(entry["size"])
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def names(self):
+        return list(self.entries)
+
+    def raw(self, name):
+        """memoryview (sin copia) de los bytes de un recurso"""
+        entry = self.entries[name]
+        return self._view[entry["offset"]:entry["offset"] + entry["length"]]
+
+    def image(self, name):
+        """Superficie que apunta directamente a los bytes del paquete"""
+        entry = self.entries[name]
+        if entry["kind"] != "image":
+            raise AssetPackError(name + " no es una imagen")
+        return pygame.image.frombuffer(self.raw(name), tuple(entry["size"]), entry["format"])
+
+    def image_size(self, name):
+        return tuple(self.entries[name]["size"])
+
+    def font(self, name, size):
+        # SDL_ttf lee la fuente de forma incremental desde el archivo, por lo que
+        # se le entrega una copia en memoria (las fuentes pesan unos pocos KB)
+        return pygame.font.Font(io.BytesIO(bytes(self.raw(name))), size)
+
+    def close(self):
+        view = getattr(self, "_view", None)
+        if view is not None:
+            view.release()
+            self._view = None
+        if not self._map.closed:
+            self._map.close()
+        self._file.close()
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el paquete de recursos de la tarea")
+    parser.add_argument("media_dir", nargs="?", default="media")
+    parser.add_argument("out_path", nargs="?", default=join("media", "assets.pak"))
+    parser.add_argument("--circle-size", type=int, action="append", default=[],
+                        help="Incluye los círculos de esfuerzo y Rest.png pre-escalados a este tamaño (repetible)")
+    parser.add_argument("--all", action="store_true", help="Empaqueta todo media_dir y no sólo TASK_ASSETS")
+    parser.add_argument("--keep-originals", action="store_true",
+                        help="Guarda también los círculos a tamaño original (1920x1080, ~8 MB cada uno)")
+    args = parser.parse_args()
+
+    variants = {}
+    for circle_size in args.circle_size:
+        for name in CIRCLE_IMAGES:
+            path = join(args.media_dir, name)
+            if os.path.exists(path):
+                size = fit_size(pygame.image.load(path).get_size(), circle_size)
+                variants.setdefault(name, []).append(size)
+
+    names = None if args.all else TASK_ASSETS
+    n_images, n_fonts = build_pack(args.media_dir, args.out_path, names, variants,
+                                   keep_originals=args.keep_originals or not variants)
+    print("{}: {} imágenes, {} fuentes, {:.1f} MB".format(
+        args.out_path, n_images, n_fonts, os.path.getsize(args.out_path) / 1e6))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
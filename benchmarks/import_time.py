@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Mide el tiempo de importación de la tarea con `python -X importtime` y lo
+compara con un presupuesto. Sale con código 1 si se excede el presupuesto o si
+se importa al arranque alguna librería pesada que debería cargarse de forma
+diferida (cv2, pylsl).
+
+Uso:
+    python benchmarks/import_time.py [--budget-ms 500] [--module Prosocial_Effort_Task]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from os.path import abspath, dirname
+
+REPO_ROOT = dirname(dirname(abspath(__file__)))
+
+# Módulos que no deben cargarse al importar la tarea. numpy no se incluye porque
+# pygame lo importa por su cuenta si está instalado (en el ejecutable se excluye
+# con --exclude-module numpy)
+FORBIDDEN_AT_STARTUP = ["cv2", "pylsl"]
+
+
+def measure_import(module, runs=3):
+    """Importa el módulo en un proceso nuevo y devuelve (total_ms, {modulo: cumulativo_ms})"""
+    env = dict(os.environ)
+    env.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    env.setdefault("SDL_VIDEODRIVER", "dummy")
+    best_total = None
+    best_modules = {}
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                                cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr)
+        modules = {}
+        total_us = 0
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            parts = line[len("import time:"):].split("|")
+            try:
+                cumulative_us = int(parts[1])
+            except ValueError:
+                continue  # Línea de encabezado
+            name = parts[2].rstrip()
+            # Sólo los módulos de primer nivel suman al total (los demás ya están incluidos)
+            if not name.startswith("  "):
+                total_us += cumulative_us
+            modules[name.strip()] = cumulative_us / 1000.0
+        total_ms = total_us / 1000.0
+        if best_total is None or total_ms < best_total:
+            best_total = total_ms
+            best_modules = modules
+    return best_total, best_modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="Prosocial_Effort_Task")
+    parser.add_argument("--budget-ms", type=float, default=500.0)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    total_ms, modules = measure_import(args.module, args.runs)
+
+    print(f"Importación de {args.module}: {total_ms:.1f} ms (presupuesto {args.budget_ms:.0f} ms)")
+    print("Módulos más lentos:")
+    for name, ms in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:10]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    failed = False
+    loaded_forbidden = [name for name in FORBIDDEN_AT_STARTUP if name in modules]
+    if loaded_forbidden:
+        print("ERROR: se importan al arranque: " + ", ".join(loaded_forbidden))
+        failed = True
+    if total_ms > args.budget_ms:
+        print("ERROR: se excede el presupuesto de tiempo de importación")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
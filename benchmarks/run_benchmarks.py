@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Benchmarks de los caminos críticos de render y de entrada de la tarea.
+
+Corre sin pantalla (SDL_VIDEODRIVER=dummy) y escribe los resultados en JSON.
+Si se indica un archivo de referencia (--baseline) compara cada benchmark con
+él y sale con código 1 ante una regresión. Los contadores (cargas de imágenes
+durante la sesión) se comparan sin tolerancia: un cambio que vuelva a cargar o
+escalar imágenes en cada trial falla de forma visible.
+
+Benchmarks:
+    decision_screen   composición de la pantalla de decisión (sin caché)
+    effort_press      manejo de una presión de la barra espaciadora (15 Hz simulados)
+    slide_compile     render de una diapositiva de instrucciones (sin caché)
+    slide_show        mostrar una diapositiva ya compilada (fill + blit + flip)
+    textrect_wrap     ajuste de texto de las diapositivas (render_textrect / wrap_text)
+    marker_push       envío de marcadores LSL de punta a punta, por marcador (y el costo de encolar
+                      en el hilo de la tarea); sólo si pylsl está instalado
+    trial_write       escritura de una fila del CSV de datos
+    session_replay    sesión completa (3 bloques, 144 trials) en tiempo virtual
+
+Uso:
+    python benchmarks/run_benchmarks.py                               # benchmarks/results.json
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --backend sdl2                # texturas SDL2
+"""
+import argparse
+import heapq
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from os.path import abspath, dirname, join
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+REPO_ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)  # la tarea busca media/ relativo al directorio actual
+
+import pygame  # noqa: E402
+from pygame.locals import KEYDOWN, KEYUP, K_SPACE, K_m, K_n, NOEVENT  # noqa: E402
+
+import Prosocial_Effort_Task as pet  # noqa: E402
+
+# Un benchmark empeora si su mediana supera la de referencia en más de este factor
+DEFAULT_TOLERANCE = 0.25
+TAPPING_HZ = 15
+# Marcadores por lote en la medición de punta a punta de marker_push
+MARKER_BATCH = 100
+
+
+def measure(function, repeat, setup=None):
+    """Mide `function` `repeat` veces; devuelve estadísticas en ms"""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    samples.sort()
+    return {
+        "n": len(samples),
+        "median_ms": samples[len(samples) // 2],
+        "p90_ms": samples[min(len(samples) - 1, int(len(samples) * 0.9))],
+        "min_ms": samples[0],
+        "max_ms": samples[-1],
+    }
+
+
+class ImageLoadCounter:
+    """Cuenta las cargas de imágenes desde disco/paquete y los re-escalados"""
+
+    def __init__(self):
+        self.counts = {"image_load": 0, "pack_image": 0, "smoothscale": 0}
+        self._originals = []
+
+    def _wrap(self, owner, name, key):
+        original = getattr(owner, name)
+
+        def wrapper(*args, **kwargs):
+            self.counts[key] += 1
+            return original(*args, **kwargs)
+        setattr(owner, name, wrapper)
+        self._originals.append((owner, name, original))
+
+    def __enter__(self):
+        self._wrap(pygame.image, "load", "image_load")
+        self._wrap(pygame.transform, "smoothscale", "smoothscale")
+        self._wrap(pet.AssetPack, "image", "pack_image")
+        return self
+
+    def __exit__(self, *exc):
+        for owner, name, original in reversed(self._originals):
+            setattr(owner, name, original)
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+class VirtualClock:
+    """Tiempo virtual para pygame.time / pygame.event: las esperas avanzan el reloj
+    en lugar de dormir, así una sesión de ~40 min se reproduce en segundos"""
+
+    def __init__(self, frame_ms=16):
+        self.now = 0
+        self.frame_ms = frame_ms
+        self.scheduled = []  # heap (tiempo, n, evento)
+        self.timers = {}     # tipo -> [evento, intervalo, vueltas restantes (0 = infinitas), próximo]
+        self.pending = []
+        self._seq = itertools.count()
+
+    # pygame.time
+    def get_ticks(self):
+        return self.now
+
+    def delay(self, ms):
+        self._advance(self.now + int(ms))
+        return int(ms)
+
+    def set_timer(self, event, millis, loops=0):
+        if isinstance(event, pygame.event.EventType):
+            event_type = event.type
+        else:
+            event_type, event = event, pygame.event.Event(event)
+        if millis <= 0:
+            self.timers.pop(event_type, None)
+        else:
+            self.timers[event_type] = [event, int(millis), loops, self.now + int(millis)]
+
+    # pygame.event
+    def post_at(self, at, event):
+        heapq.heappush(self.scheduled, (at, next(self._seq), event))
+
+    def get(self, *args, **kwargs):
+        if not self.pending:
+            upcoming = self._next_time()
+            step = self.now + self.frame_ms
+            self._advance(step if upcoming is None else min(upcoming, step))
+        events, self.pending = self.pending, []
+        return events
+
+    def wait(self, timeout=0):
+        if not self.pending:
+            upcoming = self._next_time()
+            limit = self.now + timeout if timeout else None
+            if upcoming is None or (limit is not None and upcoming > limit):
+                self._advance(limit if limit is not None else self.now + self.frame_ms)
+            else:
+                self._advance(upcoming)
+        if self.pending:
+            return self.pending.pop(0)
+        return pygame.event.Event(NOEVENT)
+
+    def clear(self, *args, **kwargs):
+        self.pending = []
+
+    def pump(self):
+        pass
+
+    def _next_time(self):
+        times = [timer[3] for timer in self.timers.values()]
+        if self.scheduled:
+            times.append(self.scheduled[0][0])
+        return min(times) if times else None
+
+    def _advance(self, until):
+        due = []
+        while self.scheduled and self.scheduled[0][0] <= until:
+            at, seq, event = heapq.heappop(self.scheduled)
+            due.append((at, seq, event))
+        for event_type, timer in list(self.timers.items()):
+            event, interval, loops, next_time = timer
+            while next_time <= until:
+                due.append((next_time, next(self._seq), event))
+                next_time += interval
+                if loops:
+                    loops -= 1
+                    if loops == 0:
+                        del self.timers[event_type]
+                        break
+            if event_type in self.timers:
+                self.timers[event_type] = [event, interval, loops, next_time]
+        due.sort(key=lambda item: (item[0], item[1]))
+        self.pending.extend(event for _, _, event in due)
+        self.now = max(self.now, until)
+
+    @contextmanager
+    def installed(self):
+        patches = [(pygame.time, "get_ticks", self.get_ticks), (pygame.time, "delay", self.delay),
+                   (pygame.time, "wait", self.delay), (pygame.time, "set_timer", self.set_timer),
+                   (pygame.event, "get", self.get), (pygame.event, "wait", self.wait),
+                   (pygame.event, "clear", self.clear), (pygame.event, "pump", self.pump)]
+        originals = [(owner, name, getattr(owner, name)) for owner, name, _ in patches]
+        for owner, name, replacement in patches:
+            setattr(owner, name, replacement)
+        try:
+            yield self
+        finally:
+            for owner, name, original in originals:
+                setattr(owner, name, original)
+
+
+class VirtualParticipant:
+    """Responde a los marcadores que envía la tarea: decide tras un TR aleatorio,
+    presiona la barra espaciadora a 15 Hz y sale de los descansos entre bloques"""
+
+    def __init__(self, clock, seed=0):
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.markers = []
+
+    def send_marker(self, marker_code, description="", **fields):
+        self.markers.append((self.clock.now, marker_code))
+        markers = pet.MARKERS
+        if marker_code in (markers['DECISION_START_SELF'], markers['DECISION_START_OTHER'],
+                           markers['DECISION_START_GROUP']):
+            key = self.random.choice([K_n, K_m])
+            self.clock.post_at(self.clock.now + self.random.randint(400, 2500), pygame.event.Event(KEYUP, key=key))
+        elif marker_code == markers['EFFORT_BAR_START']:
+            interval = 1000.0 / TAPPING_HZ
+            presses = int(pet.max_answer_time * TAPPING_HZ)
+            for i in range(presses):
+                self.clock.post_at(self.clock.now + 150 + int(i * interval), pygame.event.Event(KEYUP, key=K_SPACE))
+        elif marker_code == markers['BLOCK_END']:
+            self.clock.post_at(self.clock.now + 2000, pygame.event.Event(KEYDOWN, key=K_SPACE))
+
+
+def effort_table_for(max_presses):
+    levels = [pet.ceil(max_presses * (effort / 100)) for effort in pet.effort_levels]
+    return levels, dict(zip(levels, pet.effort_levels))
+
+
+def combinations_for(levels):
+    return [list(itertools.product(levels, pet.credits_levels, [condition])) for condition in ("TI", "OTRO", "GRUPO")]
+
+
+# ------------------------------- benchmarks -------------------------------
+
+def bench_decision_screen(repeat):
+    def compose():
+        pet.scaled_images.clear()  # incluye obtener las imágenes escaladas (paquete o smoothscale)
+        pet.compose_decision_screen(4, 80, "OTRO", "left", test=False)
+    compose()
+    result = measure(compose, repeat)
+    pet.warm_scaled_images(pet.prescaled_variants())
+    result["cached_median_ms"] = measure(lambda: pet.compose_decision_screen(4, 80, "OTRO", "left"), repeat)["median_ms"]
+    return result
+
+
+def bench_effort_press(repeat):
+    """Tiempo desde que llega una presión hasta que el cuadro está en pantalla"""
+    pet.profiler.reset()
+    pet.profiler.enable()
+    original_block = pet.block_spacebar
+    pet.block_spacebar = lambda duration_ms: None
+    clock = VirtualClock()
+    try:
+        with clock.installed():
+            for i in range(repeat):
+                clock.post_at(clock.now + 110 + int(i * 1000.0 / TAPPING_HZ), pygame.event.Event(KEYUP, key=K_SPACE))
+            pet.show_effort_bar(target_presses=repeat, max_time=3600, title_text="Créditos para TI")
+    finally:
+        pet.block_spacebar = original_block
+        pet.profiler.disable()
+    render = pet.profiler.histograms[("draw_progress_bar", "render")]
+    flip = pet.profiler.histograms[("draw_progress_bar", "flip")]
+    total = pet.profiler.histograms[("draw_progress_bar", "call")]
+    budget_ms = 1000.0 / TAPPING_HZ
+    return {
+        "n": render.count,
+        "median_ms": (render.percentile(50) + flip.percentile(50)) / 1000.0,
+        "p99_ms": (render.percentile(99) + flip.percentile(99)) / 1000.0,
+        "draw_progress_bar_median_ms": total.percentile(50) / 1000.0,
+        "budget_ms": budget_ms,
+        "budget_used": (render.percentile(99) + flip.percentile(99)) / 1000.0 / budget_ms,
+    }
+
+
+def bench_slide_compile(repeat):
+    text = pet.select_slide('Instructions_Decision_1')
+
+    def compile_uncached():
+        pet.slide_cache.clear()
+        pet.compile_slide('paragraph', text, pet.K_RIGHT)
+    return measure(compile_uncached, repeat)
+
+
+def bench_slide_show(repeat):
+    layers = pet.compile_slide('paragraph', pet.select_slide('Instructions_Decision_1'), pet.K_RIGHT)
+    return measure(lambda: pet.show_compiled_slide(layers), repeat)
+
+
+# Diapositivas de instrucciones que muestra la tarea (las más largas son las de decisión)
+SLIDE_NAMES = ['welcome', 'Instructions_Casillas', 'Interlude_Casillas', 'Cargando', 'Pre_Instructions',
+               'Instructions_Decision_1', 'Instructions_Decision_2', 'Instructions_Decision_3',
+               'Instructions_Decision_final', 'Interlude_Practice', 'Effort_ending', 'TestingDecision',
+               'Practice_ending', 'Break', 'farewell']
+
+
+def bench_textrect_wrap(repeat):
+    """Ajuste de todas las diapositivas: con render (render_textrect) y sólo el
+    corte de líneas (wrap_text) sin y con los anchos ya medidos"""
+    texts = ["\n".join(pet.select_slide(name)) for name in SLIDE_NAMES]
+    rect = pygame.Rect(0, 0, pet.resolution[0] * 3 // 4, pet.resolution[1] * 4)
+
+    def render_all():
+        for text in texts:
+            pet.render_textrect(text, pet.char, rect, (0, 0, 0), (255, 255, 255))
+
+    def wrap_all():
+        for text in texts:
+            pet.wrap_text(text, pet.char, rect.width)
+    result = measure(render_all, repeat)
+    result["wrap_cold_median_ms"] = measure(wrap_all, repeat, setup=pet.text_widths.clear)["median_ms"]
+    result["wrap_warm_median_ms"] = measure(wrap_all, repeat)["median_ms"]
+    result["justified_median_ms"] = measure(
+        lambda: [pet.render_textrect(text, pet.char, rect, (0, 0, 0), (255, 255, 255), 3) for text in texts],
+        repeat)["median_ms"]
+    result["fit_median_ms"] = measure(
+        lambda: pet.fit_textrect(texts[5], pygame.Rect(0, 0, pet.resolution[0] * 3 // 4, pet.resolution[1] * 3 // 4),
+                                 (0, 0, 0), (255, 255, 255)), max(1, repeat // 10))["median_ms"]
+    return result
+
+
+def bench_marker_push(repeat):
+    try:
+        from lsl_markers import MarkerStream
+    except ImportError:
+        return {"skipped": "pylsl no está instalado"}
+    stream = MarkerStream('PET_benchmark', 'pet_benchmark', names=pet.MARKER_NAMES, fields=pet.MARKER_FIELDS)
+    previous_stream = pet.marker_stream
+    pet.marker_stream = stream
+    pet.set_marker_context(block=1, trial=3, effort=65, credits=4, condition="Other", target=33)
+    send = lambda: pet.send_marker(pet.MARKERS['RESPONSE_WORK'], rt=812)
+
+    def send_batch():
+        for _ in range(MARKER_BATCH):
+            send()
+        stream.flush()
+
+    try:
+        # Costo en el hilo de la tarea (marca de tiempo + cola)
+        enqueue = measure(send, repeat)
+        stream.flush()
+        # De punta a punta: lotes de marcadores hasta que el hilo del stream envió todos
+        # (JSON + los dos push_sample); median_ms es el costo por marcador
+        batches = measure(send_batch, max(1, repeat // MARKER_BATCH))
+    finally:
+        pet.marker_stream = previous_stream
+        pet.set_marker_context()
+        stream.close()
+    result = {name: value / MARKER_BATCH if name.endswith("_ms") else value for name, value in batches.items()}
+    result["batch_size"] = MARKER_BATCH
+    result["enqueue_median_ms"] = enqueue["median_ms"]
+    result["enqueue_p90_ms"] = enqueue["p90_ms"]
+    result["markers_per_s"] = 1000.0 / result["median_ms"] if result["median_ms"] else None
+    return result
+
+
+def bench_trial_write(repeat):
+    levels, effort_table = effort_table_for(40)
+    combination = (levels[2], 4, "OTRO")
+    with tempfile.TemporaryDirectory() as directory:
+        with open(join(directory, "trials.csv"), "w") as f:
+            # Con flush por trial, como en la tarea
+            return measure(lambda: pet.write_trial_row(f, combination, effort_table, 1, 33, True, 4, 812, 150, 2900, 0, 33, 41.52, 42),
+                           repeat)
+
+
+def bench_session_replay(blocks=3, seed=0):
+    """Sesión completa (sin calibración ni instrucciones) en tiempo virtual"""
+    random.seed(seed)
+    levels, effort_table = effort_table_for(40)
+    self_combinations, other_combinations, group_combinations = combinations_for(levels)
+    clock = VirtualClock()
+    participant = VirtualParticipant(clock, seed)
+    original_marker = pet.send_marker
+    pet.send_marker = participant.send_marker
+    data = io.StringIO()
+    try:
+        with clock.installed():
+            # Práctica primero: a partir de aquí todas las imágenes deberían estar en memoria
+            pet.task(self_combinations, other_combinations, group_combinations, blocks, "division",
+                     pet.max_answer_time, test=True, effort_table=effort_table)
+            practice_end = clock.now
+            with ImageLoadCounter() as loads:
+                start = time.perf_counter()
+                pet.task(self_combinations, other_combinations, group_combinations, blocks, "division",
+                         pet.max_answer_time, file=data, effort_table=effort_table)
+                wall_ms = (time.perf_counter() - start) * 1000.0
+    finally:
+        pet.send_marker = original_marker
+    trials = data.getvalue().count("\n")
+    return {
+        "n": 1,
+        "trials": trials,
+        "median_ms": wall_ms,
+        "wall_ms_per_trial": wall_ms / trials if trials else None,
+        "virtual_session_s": (clock.now - practice_end) / 1000.0,
+        "markers": len(participant.markers),
+        "counters": {"image_loads": loads.total, "image_loads_detail": loads.counts},
+    }
+
+
+BENCHMARKS = [
+    ("decision_screen", lambda quick: bench_decision_screen(10 if quick else 50)),
+    ("effort_press", lambda quick: bench_effort_press(75 if quick else 300)),
+    ("slide_compile", lambda quick: bench_slide_compile(10 if quick else 50)),
+    ("slide_show", lambda quick: bench_slide_show(50 if quick else 300)),
+    ("textrect_wrap", lambda quick: bench_textrect_wrap(5 if quick else 30)),
+    ("marker_push", lambda quick: bench_marker_push(1000 if quick else 10000)),
+    ("trial_write", lambda quick: bench_trial_write(200 if quick else 2000)),
+    ("session_replay", lambda quick: bench_session_replay(1 if quick else 3)),
+]
+
+
+def compare(results, baseline, tolerance):
+    """Lista de regresiones respecto a la referencia"""
+    failures = []
+    # Con distinta cantidad de repeticiones (--quick) u otro backend sólo se comparan los contadores
+    same_mode = (results.get("quick") == baseline.get("quick")
+                 and results.get("backend", "software") == baseline.get("backend", "software"))
+    for name, result in results["benchmarks"].items():
+        reference = baseline.get("benchmarks", {}).get(name)
+        if not reference or "skipped" in result or "skipped" in reference:
+            continue
+        if same_mode and result["median_ms"] > reference["median_ms"] * (1 + tolerance):
+            failures.append("{}: mediana {:.3f} ms > referencia {:.3f} ms (+{:.0f} %)".format(
+                name, result["median_ms"], reference["median_ms"],
+                (result["median_ms"] / reference["median_ms"] - 1) * 100))
+        for counter, value in result.get("counters", {}).items():
+            reference_value = reference.get("counters", {}).get(counter)
+            if isinstance(value, (int, float)) and reference_value is not None and value > reference_value:
+                failures.append("{}: {} = {} > referencia {}".format(name, counter, value, reference_value))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=join("benchmarks", "results.json"))
+    parser.add_argument("--baseline", help="Resultados de referencia con los que comparar")
+    parser.add_argument("--save-baseline", help="Guarda además los resultados como referencia en este archivo")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--quick", action="store_true", help="Menos repeticiones y un solo bloque en la sesión")
+    parser.add_argument("--only", action="append", default=[], help="Corre sólo este benchmark (repetible)")
+    parser.add_argument("--backend", default="software", choices=["software", "sdl2"],
+                        help="Backend de render de la tarea (ver render_backend.py)")
+    args = parser.parse_args()
+
+    pet.FullScreenShow = False
+    pet.debug_mode = False
+    pet.render_backend = args.backend
+    pet.init()
+    pet.compile_slides()
+
+    results = {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "resolution": list(pet.resolution),
+        "quick": args.quick,
+        "backend": pet.backend.name,
+        "benchmarks": {},
+    }
+    for name, run in BENCHMARKS:
+        if args.only and name not in args.only:
+            continue
+        result = run(args.quick)
+        results["benchmarks"][name] = result
+        if "skipped" in result:
+            print("{:<16} omitido: {}".format(name, result["skipped"]))
+        else:
+            print("{:<16} mediana {:9.3f} ms  (n={})".format(name, result["median_ms"], result["n"]))
+
+    failed = False
+    replay = results["benchmarks"].get("session_replay")
+    if replay and replay["counters"]["image_loads"]:
+        print("ERROR: se cargaron/escalaron {} imágenes durante la sesión ({})".format(
+            replay["counters"]["image_loads"], replay["counters"]["image_loads_detail"]))
+        failed = True
+
+    for path in [args.output, args.save_baseline]:
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=1, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        failures = compare(results, baseline, args.tolerance)
+        for failure in failures:
+            print("REGRESIÓN: " + failure)
+        failed = failed or bool(failures)
+
+    pygame.quit()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Calibración adaptativa de la cantidad máxima de presiones.
+
+Antes la calibración eran siempre tres barras de esfuerzo (objetivo 50, luego
+1.1 x la anterior y 1.1 x el máximo) y se usaba el máximo de las tres. Aquí cada
+intento se usa para actualizar una estimación bayesiana de la capacidad del
+participante, es decir, cuántas presiones logra en la ventana de max_time
+segundos:
+
+    - De los tiempos de cada presión (press_log) se obtiene el intervalo entre
+      presiones (mediana, robusta a pausas) y su variabilidad.
+    - Si el participante llegó al objetivo antes del plazo, la cantidad se
+      extrapola al resto de la ventana con su ritmo; si no, la observación es la
+      cantidad de presiones hechas.
+    - La incertidumbre de cada observación sale de la variabilidad de los
+      intervalos (proceso de renovación: Var(N) ~ T * sd² / media³) más una
+      variabilidad entre intentos (fatiga, aprendizaje).
+    - Con un prior normal la posterior es normal (actualización conjugada).
+
+El objetivo de cada intento sigue siendo una escalera: ceil(1.1 x estimación
+actual), para que el participante siempre tenga que esforzarse. La calibración
+termina cuando, tras al menos `min_attempts` intentos, el intervalo de confianza
+del 95 % es más angosto que ±`tolerance` (relativo a la estimación) y las
+observaciones de los intentos no difieren entre sí en más de 2 x tolerance, o
+al llegar a `max_attempts`.
+
+Uso:
+    calibration = AdaptiveCalibration(window_ms=5000)
+    while not calibration.done():
+        target = calibration.next_target()
+        press_log = []
+        presses, reached, _, _ = show_effort_bar(target, ..., press_log=press_log)
+        calibration.add_attempt(target, press_log, reached)
+    max_presses = calibration.max_presses()
+    calibration.write_log("data/sesion_calibration.csv")
+"""
+import csv
+import os
+from math import ceil, sqrt
+from statistics import median, pstdev
+
+# z del intervalo de confianza del 95 %
+Z_95 = 1.96
+
+
+class AdaptiveCalibration:
+    """Estimación en línea de la cantidad máxima de presiones en window_ms"""
+
+    def __init__(self, window_ms, first_target=50, prior_mean=50.0, prior_sd=20.0,
+                 between_sd=0.05, tolerance=0.08, min_attempts=2, max_attempts=3, step=1.1):
+        self.window_ms = window_ms
+        self.first_target = first_target
+        self.mean = float(prior_mean)
+        self.variance = float(prior_sd) ** 2
+        self.between_sd = between_sd  # relativo a la observación
+        self.tolerance = tolerance
+        self.min_attempts = min_attempts
+        self.max_attempts = max_attempts
+        self.step = step
+        self.attempts = []
+
+    def next_target(self):
+        if not self.attempts:
+            return self.first_target
+        return ceil(self.step * self.mean)
+
+    def observe(self, press_log, reached):
+        """(observación, desvío estándar, mediana del intervalo en ms) de un intento"""
+        observation, counting_sd, interval = window_presses(press_log, reached, self.window_ms)
+        if interval is None:
+            # Muy pocas presiones para estimar el ritmo: sólo cuenta la cantidad
+            return observation, max(1.0, observation * self.between_sd), None
+        between_variance = (self.between_sd * observation) ** 2
+        return observation, sqrt(counting_sd ** 2 + between_variance), interval
+
+    def add_attempt(self, target, press_log, reached):
+        """Actualiza la estimación con un intento (press_log: ms de cada presión)"""
+        observation, sd, interval = self.observe(press_log, reached)
+        precision = 1.0 / self.variance + 1.0 / sd ** 2
+        self.mean = (self.mean / self.variance + observation / sd ** 2) / precision
+        self.variance = 1.0 / precision
+        low, high = self.interval()
+        self.attempts.append({
+            "attempt": len(self.attempts) + 1,
+            "target": target,
+            "presses": len(press_log),
+            "reached": bool(reached),
+            "median_interval_ms": interval,
+            "observation": observation,
+            "observation_sd": sd,
+            "estimate": self.mean,
+            "ci_low": low,
+            "ci_high": high,
+        })
+        return self.attempts[-1]
+
+    def interval(self):
+        """Intervalo de confianza del 95 % de la estimación"""
+        half = Z_95 * sqrt(self.variance)
+        return self.mean - half, self.mean + half
+
+    def stable(self):
+        low, high = self.interval()
+        scale = self.tolerance * max(self.mean, 1.0)
+        observations = [attempt["observation"] for attempt in self.attempts]
+        return (high - low) / 2 <= scale and max(observations) - min(observations) <= 2 * scale
+
+    def done(self):
+        if len(self.attempts) >= self.max_attempts:
+            return True
+        return len(self.attempts) >= self.min_attempts and self.stable()
+
+    def max_presses(self, minimum=1):
+        return max(minimum, int(round(self.mean)))
+
+    def write_log(self, path):
+        """Un renglón por intento con la estimación y su intervalo de confianza"""
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        columns = ["attempt", "target", "presses", "reached", "median_interval_ms",
+                   "observation", "observation_sd", "estimate", "ci_low", "ci_high"]
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for attempt in self.attempts:
+                writer.writerow([_fmt(attempt[column]) for column in columns])
+
+
+def window_presses(press_log, reached, window_ms):
+    """Presiones que se habrían hecho en toda la ventana de window_ms.
+
+    Devuelve (presiones, desvío estándar del conteo, mediana del intervalo en ms).
+    Si se llegó al objetivo antes del plazo se extrapola con la mediana del
+    intervalo entre presiones. Con menos de 3 presiones no hay ritmo que estimar:
+    se devuelve la cantidad con desvío 0 e intervalo None"""
+    presses = float(len(press_log))
+    intervals = [b - a for a, b in zip(press_log, press_log[1:]) if b > a]
+    if len(intervals) < 2:
+        return presses, 0.0, None
+    interval = median(intervals)
+    interval_sd = max(pstdev(intervals), 1.0)
+    if reached:
+        presses += max(0.0, window_ms - press_log[-1]) / interval
+    # Proceso de renovación: Var(N) ~ T * sd² / media³ (+ cuantización del conteo)
+    counting_variance = window_ms * interval_sd ** 2 / interval ** 3 + 0.25
+    return presses, sqrt(counting_variance), interval
+
+
+def _fmt(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return "{:.2f}".format(value)
+    return value
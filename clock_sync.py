@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Sincronización de los relojes de la tarea con el de LSL.
+
+Los tiempos del CSV (TR, presiones) salen de pygame.time.get_ticks() (ms enteros
+desde pygame.init()), la línea de tiempo y el perfil de time.perf_counter(), y los
+marcadores de local_clock() de LSL. ClockSync lee todos los relojes cada
+`interval` s desde un hilo de fondo y ajusta en línea, por mínimos cuadrados,
+
+    referencia_s = offset_s + slope * (valor + midpoint) * unit_s
+
+para cada uno (slope - 1 es la deriva). Cada muestra se toma READS veces como
+[referencia, relojes, referencia] y se usa la de menor intervalo entre las dos
+lecturas de la referencia (la que menos interrumpieron el sistema o el otro hilo);
+los relojes se comparan con el punto medio. get_ticks() trunca a ms, así que los
+relojes enteros se ajustan al centro de la unidad (midpoint = 0.5).
+
+Además, en SDL2 para Linux get_ticks() redondea hacia cero la diferencia de
+nanosegundos con el inicio, y durante una parte fija de cada segundo (que depende
+de cuándo se inició SDL) devuelve 1 ms de más. Para los relojes enteros se guarda
+el residuo medio del ajuste en PHASE_BINS tramos de la fase dentro del segundo
+(phase_s) y se suma al convertir; donde no pasa esto (Windows) los tramos quedan ~0.
+
+Las muestras se agregan a <base>_clock_sync.csv a medida que se toman y el modelo
+se reescribe en <base>_clock_sync.json cada SAVE_EVERY muestras y al cerrar. Para
+pasar los tiempos de un CSV de la sesión al reloj de LSL (cada fila con el modelo
+de la ejecución que la escribió, columna Ejecución):
+
+    python clock_sync.py data/<sesión>.csv
+"""
+import csv
+import json
+import math
+import os
+import sys
+import threading
+
+# Lecturas por muestra (se usa la de menor intervalo de la referencia)
+READS = 5
+# Muestras cuyo mejor intervalo de lectura supera esto (s) no entran al ajuste
+MAX_SPREAD = 0.001
+# Cada cuántas muestras se reescribe el modelo en disco
+SAVE_EVERY = 30
+# Tramos de la fase dentro del segundo para la corrección de los relojes enteros
+PHASE_BINS = 20
+
+
+class LinearFit:
+    """Ajuste y = offset + slope * x actualizado muestra a muestra (sumas centradas
+    de Welford, estables aunque x e y sean grandes y casi iguales)"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean_x = self.mean_y = 0.0
+        self.sxx = self.sxy = self.syy = 0.0
+
+    def add(self, x, y):
+        self.n += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.n
+        self.mean_y += dy / self.n
+        self.sxx += dx * (x - self.mean_x)
+        self.sxy += dx * (y - self.mean_y)
+        self.syy += dy * (y - self.mean_y)
+
+    @property
+    def slope(self):
+        return self.sxy / self.sxx if self.sxx > 0 else 1.0
+
+    @property
+    def offset(self):
+        return self.mean_y - self.slope * self.mean_x
+
+    @property
+    def residual(self):
+        """Desvío estándar de los residuos (s), o None con menos de 3 muestras"""
+        if self.n < 3 or self.sxx <= 0:
+            return None
+        return math.sqrt(max(self.syy - self.sxy ** 2 / self.sxx, 0.0) / (self.n - 2))
+
+
+class ClockSync:
+    """Muestrea los relojes desde un hilo de fondo y mantiene el ajuste de cada uno.
+
+    clocks - {nombre: (función, segundos por unidad)}, p. ej.
+             {"ticks": (pygame.time.get_ticks, 0.001), "perf_counter": (time.perf_counter, 1.0)}
+    reference - (nombre, función en s), p. ej. ("lsl", pylsl.local_clock)
+    base - prefijo de <base>_clock_sync.csv/.json (None: no se escribe nada)"""
+
+    def __init__(self, clocks, reference, interval=1.0, base=None):
+        self.clocks = clocks
+        self.reference_name, self.reference = reference
+        self.interval = interval
+        self.base = base
+        self.fits = {name: LinearFit() for name in clocks}
+        self.midpoints = {}
+        self.phases = {}  # nombre -> por tramo [muestras, suma de (y - x), suma de x]
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._log = None
+        if base is not None:
+            self._log = open(base + "_clock_sync.csv", "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._log)
+            self._writer.writerow([self.reference_name, "spread"] + list(clocks))
+        self._stop = threading.Event()
+        self.sample()
+        if base is not None:
+            # Para que una ejecución cortada antes de SAVE_EVERY muestras también tenga modelo
+            self.save()
+        self._thread = threading.Thread(target=self._run, name="clock-sync", daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        best = None
+        for _ in range(READS):
+            before = self.reference()
+            values = [function() for function, _ in self.clocks.values()]
+            after = self.reference()
+            if best is None or after - before < best[1] - best[0]:
+                best = (before, after, values)
+        return best
+
+    def sample(self):
+        """Toma una muestra y actualiza los ajustes"""
+        before, after, values = self._read()
+        spread = after - before
+        with self._lock:
+            if self._log is not None:
+                self._writer.writerow(["%.9f" % ((before + after) / 2), "%.9f" % spread] + values)
+                self._log.flush()
+            if spread > MAX_SPREAD:
+                self.rejected += 1
+                return
+            reference = (before + after) / 2
+            for (name, (_, unit)), value in zip(self.clocks.items(), values):
+                if name not in self.midpoints:
+                    self.midpoints[name] = 0.5 if isinstance(value, int) else 0.0
+                    if isinstance(value, int):
+                        self.phases[name] = [[0, 0.0, 0.0] for _ in range(PHASE_BINS)]
+                x = (value + self.midpoints[name]) * unit
+                self.fits[name].add(x, reference)
+                if name in self.phases:
+                    phase = self.phases[name][_phase_bin(value, unit, PHASE_BINS)]
+                    phase[0] += 1
+                    phase[1] += reference - x
+                    phase[2] += x
+            samples = self.fits[next(iter(self.fits))].n if self.fits else 0
+        if self.base is not None and samples % SAVE_EVERY == 0:
+            self.save()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Error sincronizando relojes: {e}")
+
+    def model(self):
+        """Modelo actual: por reloj, offset_s y slope de referencia = offset_s + slope * (valor + midpoint) * unit_s"""
+        with self._lock:
+            clocks = {}
+            for name, fit in self.fits.items():
+                clocks[name] = {
+                    "unit_s": self.clocks[name][1],
+                    "midpoint": self.midpoints.get(name, 0.0),
+                    "offset_s": fit.offset,
+                    "slope": fit.slope,
+                    "drift_ppm": (fit.slope - 1.0) * 1e6,
+                    "residual_us": None if fit.residual is None else fit.residual * 1e6,
+                    "samples": fit.n,
+                    # Residuo medio de cada tramo respecto del ajuste (s)
+                    "phase_s": None if name not in self.phases else [
+                        total / n - fit.offset - (fit.slope - 1.0) * x_total / n if n else 0.0
+                        for n, total, x_total in self.phases[name]],
+                }
+            return {"reference": self.reference_name, "interval_s": self.interval, "rejected": self.rejected,
+                    "formula": "reference_s = offset_s + slope * (value + midpoint) * unit_s + phase_s[tramo]",
+                    "clocks": clocks}
+
+    def save(self):
+        """Escribe el modelo en <base>_clock_sync.json (reemplazo atómico)"""
+        path = self.base + "_clock_sync.json"
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.model(), f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        """Última muestra, modelo final en disco y fin del hilo"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        if self.base is not None:
+            self.save()
+            self._log.close()
+
+
+def load_model(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _phase_bin(value, unit, bins):
+    """Tramo de la fase dentro del segundo de una lectura del reloj"""
+    return min(int(value * unit % 1.0 * bins), bins - 1)
+
+
+def to_reference(model, clock, value):
+    """Tiempo de `value` (en unidades del reloj `clock`) en el reloj de referencia (s)"""
+    fit = model["clocks"][clock]
+    time = fit["offset_s"] + fit["slope"] * (value + fit["midpoint"]) * fit["unit_s"]
+    if fit.get("phase_s"):
+        time += fit["phase_s"][_phase_bin(value, fit["unit_s"], len(fit["phase_s"]))]
+    return time
+
+
+# Columnas con tiempos absolutos (ticks) de los CSV de la tarea y las relativas a cada una
+CSV_TIMES = {
+    "InicioDecisión": {"decision_onset": None, "response": "TiempoReacciónDecisión"},
+    "InicioBarra": {"effort_onset": None, "first_press": "TiempoReacciónPrimerPresión",
+                    "last_press": "TiempoReacciónÚltimaPresión"},
+}
+
+
+# Columna con la ejecución del programa que escribió cada fila: get_ticks() vuelve a 0
+# en cada proceso, así que al reanudar una sesión (--resume) las filas nuevas siguen
+# en el mismo CSV pero necesitan el modelo de esa ejecución, <ejecución>_clock_sync.json
+RUN_COLUMN = "Ejecución"
+
+
+def run_models(path):
+    """{ejecución: modelo} para las ejecuciones de un CSV de la sesión (los modelos
+    se buscan junto al CSV)"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if RUN_COLUMN not in header:
+            raise ValueError("{} no tiene la columna {}: indicar el modelo con --model".format(path, RUN_COLUMN))
+        column = header.index(RUN_COLUMN)
+        runs = dict.fromkeys(row[column] for row in reader)
+    folder = os.path.dirname(path)
+    models = {}
+    for run in runs:
+        model_path = os.path.join(folder, run + "_clock_sync.json")
+        models[run] = load_model(model_path)
+        if not models[run]["clocks"]["ticks"]["samples"]:
+            raise ValueError("{} no tiene muestras válidas".format(model_path))
+    return models
+
+
+def convert_csv(models, path, output, clock="ticks"):
+    """Copia el CSV de la sesión agregando los tiempos en el reloj de referencia
+    (<referencia>_decision_onset, _response, _effort_onset, _first_press, _last_press)
+
+    models - {ejecución: modelo} (ver run_models), o un solo modelo para todas las
+             filas. Si los ticks retroceden dentro de una ejecución (filas de otra
+             ejecución sin la columna Ejecución) no se convierte nada."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    header, trials = rows[0], rows[1:]
+    index = {name: i for i, name in enumerate(header)}
+    missing = [name for name in CSV_TIMES if name not in index]
+    if missing:
+        raise ValueError("{} no tiene las columnas {} (CSV de una versión anterior)".format(path, ", ".join(missing)))
+    single = "clocks" in models
+    run_index = index.get(RUN_COLUMN)
+    if not single and run_index is None:
+        raise ValueError("{} no tiene la columna {}: indicar un solo modelo".format(path, RUN_COLUMN))
+    names = [(onset, name, relative) for onset, columns in CSV_TIMES.items() for name, relative in columns.items()]
+    references = {model["reference"] for model in ([models] if single else models.values())}
+    if len(references) != 1:
+        raise ValueError("los modelos usan relojes de referencia distintos: {}".format(", ".join(sorted(references))))
+    reference = references.pop()
+
+    converted_rows = []
+    last = {}
+    for number, row in enumerate(trials, start=2):
+        run = None if single or run_index is None else row[run_index]
+        if single:
+            model = models
+        elif run in models:
+            model = models[run]
+        else:
+            raise ValueError("{}:{}: no hay modelo para la ejecución {!r}".format(path, number, run))
+        decision = _number(row[index["InicioDecisión"]])
+        if decision is not None:
+            if decision < last.get(run, decision):
+                raise ValueError("{}:{}: los ticks retroceden ({:.0f} < {:.0f}); las filas son de otra "
+                                 "ejecución y necesitan su propio modelo".format(path, number, decision, last[run]))
+            last[run] = decision
+        converted = []
+        for onset, _, relative in names:
+            start = _number(row[index[onset]])
+            delta = 0.0 if relative is None else _number(row[index[relative]])
+            if start is None or delta is None:
+                converted.append("")
+            else:
+                converted.append("%.6f" % to_reference(model, clock, start + delta))
+        converted_rows.append(row + converted)
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header + ["{}_{}".format(reference, name) for _, name, _ in names])
+        writer.writerows(converted_rows)
+    return len(trials)
+
+
+def _number(text):
+    return None if text in ("", "None") else float(text)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pasa los tiempos de un CSV de la sesión al reloj de LSL")
+    parser.add_argument("csv", help="CSV de datos de la sesión")
+    parser.add_argument("-m", "--model", help="un solo modelo para todas las filas (por defecto, el "
+                                              "<ejecución>_clock_sync.json de cada fila)")
+    parser.add_argument("-o", "--output", help="CSV de salida (por defecto <csv>_lsl.csv)")
+    args = parser.parse_args()
+
+    try:
+        models = load_model(args.model) if args.model else run_models(args.csv)
+        for run, model in ([(args.model, models)] if args.model else models.items()):
+            fit = model["clocks"]["ticks"]
+            print("{}: ticks -> {}: deriva {:.1f} ppm, residuo {} µs ({} muestras)".format(
+                run, model["reference"], fit["drift_ppm"],
+                "-" if fit["residual_us"] is None else "{:.0f}".format(fit["residual_us"]), fit["samples"]))
+        output = args.output or os.path.splitext(args.csv)[0] + "_lsl.csv"
+        print("{} trials -> {}".format(convert_csv(models, args.csv, output), output))
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Épocas de EEG alrededor de los marcadores de Prosocial_Effort_Task.py.
+
+Las sesiones se graban con LabRecorder en XDF (EEG + ProsocialTaskMarkers +
+ProsocialTaskMarkersEvents). Un EEG de 64 canales a 1 kHz durante 40 minutos son
+~600 MB en float32, así que nada aquí carga la señal entera en memoria:
+
+  convert   Lee el XDF por chunks (dos pasadas: primero cuenta las muestras, luego
+            copia cada chunk de EEG directo a un .npy que se abre mapeado en memoria) y deja
+            una grabación local: eeg.npy (muestras x canales), eeg_times.npy,
+            markers.csv, events.jsonl e info.json. Los tiempos se corrigen con los
+            ClockOffset de cada stream (ajuste lineal, como pyxdf) y los del EEG se
+            des-jitterean con un ajuste lineal por segmento (cortes > 1 s).
+  epochs    Para cada marcador de los códigos pedidos toma la muestra más cercana,
+            junta las ventanas por lotes con indexado vectorizado sobre el memmap,
+            resta la línea de base y escribe <salida>.npy (épocas x canales x
+            muestras), <salida>_meta.csv (una fila por época con los datos del
+            trial del stream de metadatos y, con --session, las columnas del CSV
+            de la sesión por bloque y trial) y <salida>_info.json.
+  synthetic Escribe un XDF sintético (EEG con ruido y un potencial evocado a los
+            300 ms de cada decisión, con deriva de reloj del amplificador) y el
+            CSV de la sesión, para probar todo sin datos reales.
+
+Uso:
+    python epoching.py synthetic data/synthetic.xdf --minutes 40 --channels 64
+    python epoching.py convert data/synthetic.xdf data/synthetic
+    python epoching.py epochs data/synthetic -o data/synthetic/decision --codes 100 101 102 \\
+        --session data/synthetic.csv
+"""
+import csv
+import json
+import mmap
+import os
+import struct
+import sys
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+MARKER_STREAM = "ProsocialTaskMarkers"
+EVENTS_STREAM = MARKER_STREAM + "Events"
+
+DTYPES = {"float32": "<f4", "double64": "<f8", "int8": "<i1", "int16": "<i2", "int32": "<i4", "int64": "<i8"}
+
+# Cortes del EEG (p. ej. amplificador desconectado) en los que se reinicia el ajuste de tiempos
+JITTER_BREAK_S = 1.0
+
+# Épocas que se copian juntas del memmap (acota la memoria usada)
+EPOCH_BATCH = 64
+
+
+# ------------------------------ Lectura de XDF ------------------------------
+
+def _read_varlen(f):
+    size = f.read(1)
+    if not size:
+        raise EOFError()
+    if size[0] == 1:
+        return f.read(1)[0]
+    if size[0] == 4:
+        return struct.unpack("<I", f.read(4))[0]
+    if size[0] == 8:
+        return struct.unpack("<Q", f.read(8))[0]
+    raise ValueError("Entero de longitud variable inválido en el XDF")
+
+
+def _varlen(value):
+    if value < 256:
+        return bytes((1, value))
+    if value < 2 ** 32:
+        return b"\x04" + struct.pack("<I", value)
+    return b"\x08" + struct.pack("<Q", value)
+
+
+def _stream_header(xml):
+    root = ElementTree.fromstring(xml)
+    labels = [channel.findtext("label") or "" for channel in root.iter("channel")]
+    count = int(root.findtext("channel_count"))
+    return {
+        "name": root.findtext("name"),
+        "type": root.findtext("type") or "",
+        "channel_count": count,
+        "srate": float(root.findtext("nominal_srate") or 0),
+        "format": root.findtext("channel_format"),
+        "channels": labels if len(labels) == count else ["ch{}".format(i + 1) for i in range(count)],
+    }
+
+
+def scan_xdf(path):
+    """Primera pasada: cabeceras, posición de cada chunk de muestras, cantidad de
+    muestras y ClockOffsets de cada stream, sin leer las muestras"""
+    streams = {}
+    with open(path, "rb") as f:
+        if f.read(4) != b"XDF:":
+            raise ValueError("{} no es un archivo XDF".format(path))
+        while True:
+            try:
+                length = _read_varlen(f)
+            except EOFError:
+                break
+            tag = struct.unpack("<H", f.read(2))[0]
+            content_start = f.tell()
+            end = content_start + length - 2
+            if tag in (2, 3, 4):
+                stream_id = struct.unpack("<I", f.read(4))[0]
+                if tag == 2:
+                    streams[stream_id] = dict(_stream_header(f.read(end - f.tell())),
+                                              samples=0, chunks=[], offsets=[])
+                elif tag == 3 and stream_id in streams:
+                    count = _read_varlen(f)
+                    streams[stream_id]["samples"] += count
+                    streams[stream_id]["chunks"].append((f.tell(), end - f.tell(), count))
+                elif tag == 4 and stream_id in streams:
+                    streams[stream_id]["offsets"].append(struct.unpack("<dd", f.read(16)))
+            f.seek(end)
+    return streams
+
+
+def _fill_times(stamps, has_stamp, tdiff, last):
+    """Tiempos de las muestras sin marca: la anterior + 1/srate (vectorizado)"""
+    n = len(stamps)
+    index = np.where(has_stamp, np.arange(n), -1)
+    np.maximum.accumulate(index, out=index)
+    known = index >= 0
+    times = np.empty(n)
+    times[known] = stamps[index[known]] + (np.arange(n)[known] - index[known]) * tdiff
+    times[~known] = last + (np.arange(n)[~known] + 1) * tdiff
+    return times
+
+
+def parse_numeric_chunk(data, count, channels, dtype, tdiff, last):
+    """(tiempos, valores) de un chunk de muestras numéricas.
+
+    Cada muestra es [bytes de marca (0 u 8)][marca double][valores]. Si todas las
+    muestras tienen (o no tienen) marca el chunk es una matriz de paso fijo y se
+    lee sin bucles; si no, sólo se recorren las banderas para hallar las posiciones"""
+    dtype = np.dtype(dtype)
+    sample_bytes = channels * dtype.itemsize
+    raw = np.frombuffer(data, dtype=np.uint8)
+    for stamp_bytes in (8, 0):
+        stride = 1 + stamp_bytes + sample_bytes
+        if len(raw) == count * stride and np.all(raw[::stride] == stamp_bytes):
+            rows = raw.reshape(count, stride)
+            values = np.ascontiguousarray(rows[:, 1 + stamp_bytes:]).view(dtype).reshape(count, channels)
+            if stamp_bytes:
+                times = np.ascontiguousarray(rows[:, 1:9]).view("<f8").ravel()
+            else:
+                times = last + np.arange(1, count + 1) * tdiff
+            return times, values
+    starts = np.empty(count, dtype=np.int64)
+    has_stamp = np.zeros(count, dtype=bool)
+    position = 0
+    for k in range(count):
+        has_stamp[k] = raw[position] == 8
+        position += 9 if has_stamp[k] else 1
+        starts[k] = position
+        position += sample_bytes
+    stamps = np.zeros(count)
+    if has_stamp.any():
+        stamp_index = starts[has_stamp][:, None] - 8 + np.arange(8)
+        stamps[has_stamp] = np.ascontiguousarray(raw[stamp_index]).view("<f8").ravel()
+    values = np.ascontiguousarray(raw[starts[:, None] + np.arange(sample_bytes)]).view(dtype).reshape(count, channels)
+    return _fill_times(stamps, has_stamp, tdiff, last), values
+
+
+def parse_string_chunk(data, count, channels, tdiff, last):
+    """(tiempos, valores) de un chunk de un stream de texto (pocos marcadores)"""
+    view = memoryview(data)
+    times, values = [], []
+    position = 0
+    for _ in range(count):
+        if view[position] == 8:
+            last = struct.unpack_from("<d", view, position + 1)[0]
+            position += 9
+        else:
+            last += tdiff
+            position += 1
+        sample = []
+        for _ in range(channels):
+            size_bytes = view[position]
+            if size_bytes == 1:
+                size = view[position + 1]
+            else:
+                size = struct.unpack_from("<I" if size_bytes == 4 else "<Q", view, position + 1)[0]
+            position += 1 + size_bytes
+            sample.append(bytes(view[position:position + size]).decode("utf-8", errors="replace"))
+            position += size
+        times.append(last)
+        values.append(sample)
+    return np.array(times), values
+
+
+def read_stream_chunks(path, stream):
+    """Itera (tiempos, valores) por chunk de un stream (de scan_xdf)"""
+    tdiff = 1.0 / stream["srate"] if stream["srate"] else 0.0
+    last = 0.0
+    with open(path, "rb") as f:
+        for position, size, count in stream["chunks"]:
+            f.seek(position)
+            data = f.read(size)
+            if stream["format"] == "string":
+                times, values = parse_string_chunk(data, count, stream["channel_count"], tdiff, last)
+            else:
+                times, values = parse_numeric_chunk(data, count, stream["channel_count"],
+                                                    DTYPES[stream["format"]], tdiff, last)
+            if count:
+                last = times[-1]
+            yield times, values
+
+
+def clock_correction(offsets):
+    """(a, b) de offset = a + b * t, ajustado a los ClockOffset del stream"""
+    if not offsets:
+        return 0.0, 0.0
+    collected = np.array(offsets)
+    if len(collected) == 1 or np.ptp(collected[:, 0]) == 0:
+        return float(np.median(collected[:, 1])), 0.0
+    slope, intercept = np.polyfit(collected[:, 0], collected[:, 1], 1)
+    return float(intercept), float(slope)
+
+
+def dejitter(times, srate, break_s=JITTER_BREAK_S):
+    """Reemplaza los tiempos por un ajuste lineal (en su lugar) por segmento sin cortes.
+    Devuelve la frecuencia de muestreo efectiva del segmento más largo"""
+    breaks = np.flatnonzero(np.abs(np.diff(times)) > max(break_s, 2.0 / srate)) + 1
+    bounds = np.concatenate([[0], breaks, [len(times)]])
+    effective, longest = srate, 0
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if stop - start < 2:
+            continue
+        # Mínimos cuadrados de tiempo ~ índice, sin la matriz de polyfit
+        index = np.arange(stop - start, dtype=np.float64)
+        index -= index[-1] / 2
+        segment = times[start:stop]
+        intercept = segment.mean()
+        slope = np.dot(index, segment - intercept) / np.dot(index, index)
+        segment[:] = intercept + slope * index
+        if stop - start > longest:
+            effective, longest = 1.0 / slope, stop - start
+    return effective
+
+
+def _select_eeg(streams, name=None):
+    numeric = {sid: s for sid, s in streams.items() if s["format"] != "string" and s["srate"] > 0}
+    if name:
+        matches = [sid for sid, s in numeric.items() if s["name"] == name]
+    else:
+        matches = [sid for sid, s in numeric.items() if s["type"].upper() == "EEG"]
+        matches = matches or sorted(numeric, key=lambda sid: -numeric[sid]["srate"])
+    if not matches:
+        raise ValueError("No hay un stream de EEG en el XDF")
+    return matches[0]
+
+
+def _find_stream(streams, name):
+    for sid, stream in streams.items():
+        if stream["name"] == name:
+            return sid
+    return None
+
+
+def convert_xdf(path, directory, eeg_name=None, marker_name=MARKER_STREAM, events_name=EVENTS_STREAM):
+    """Convierte el XDF en una grabación local (ver Recording). Devuelve su info"""
+    streams = scan_xdf(path)
+    eeg_id = _select_eeg(streams, eeg_name)
+    eeg = streams[eeg_id]
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # El EEG se copia chunk a chunk a un .npy (sin mapearlo, para que las páginas escritas no
+    # queden en el proceso); los tiempos (8 bytes por muestra) sí se tienen enteros
+    times = np.empty(eeg["samples"])
+    filled = 0
+    with open(os.path.join(directory, "eeg.npy"), "wb") as f:
+        np.lib.format.write_array_header_1_0(f, {"descr": "<f4", "fortran_order": False,
+                                                 "shape": (eeg["samples"], eeg["channel_count"])})
+        for chunk_times, values in read_stream_chunks(path, eeg):
+            f.write(values.astype("<f4", copy=False).tobytes())
+            times[filled:filled + len(chunk_times)] = chunk_times
+            filled += len(chunk_times)
+
+    intercept, slope = clock_correction(eeg["offsets"])
+    times += intercept + slope * times
+    effective_srate = dejitter(times, eeg["srate"]) if eeg["samples"] > 1 else eeg["srate"]
+    np.save(os.path.join(directory, "eeg_times.npy"), times)
+
+    markers = []
+    marker_id = _find_stream(streams, marker_name)
+    if marker_id is not None:
+        intercept, slope = clock_correction(streams[marker_id]["offsets"])
+        for chunk_times, values in read_stream_chunks(path, streams[marker_id]):
+            for timestamp, sample in zip(chunk_times + intercept + slope * chunk_times, np.asarray(values)):
+                markers.append((float(timestamp), int(sample[0])))
+    with open(os.path.join(directory, "markers.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "code"])
+        writer.writerows(("{:.6f}".format(timestamp), code) for timestamp, code in markers)
+
+    events = 0
+    events_id = _find_stream(streams, events_name)
+    with open(os.path.join(directory, "events.jsonl"), "w", encoding="utf-8") as f:
+        if events_id is not None:
+            intercept, slope = clock_correction(streams[events_id]["offsets"])
+            for chunk_times, values in read_stream_chunks(path, streams[events_id]):
+                for timestamp, sample in zip(chunk_times + intercept + slope * chunk_times, values):
+                    try:
+                        payload = json.loads(sample[0])
+                    except ValueError:
+                        payload = {"text": sample[0]}
+                    f.write(json.dumps(dict(payload, timestamp=round(float(timestamp), 6))) + "\n")
+                    events += 1
+
+    info = {
+        "source": os.path.abspath(path),
+        "stream": eeg["name"],
+        "srate": eeg["srate"],
+        "effective_srate": effective_srate,
+        "channels": eeg["channels"],
+        "samples": eeg["samples"],
+        "markers": len(markers),
+        "events": events,
+    }
+    with open(os.path.join(directory, "info.json"), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=1)
+    return info
+
+
+# --------------------------------- Épocas ---------------------------------
+
+class Recording:
+    """Grabación local escrita por convert_xdf (el EEG queda mapeado en memoria)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "info.json"), encoding="utf-8") as f:
+            self.info = json.load(f)
+        self.srate = self.info["effective_srate"] or self.info["srate"]
+        self.channels = self.info["channels"]
+        self.data = np.load(os.path.join(directory, "eeg.npy"), mmap_mode="r")
+        _random_access(self.data)
+        self.times = np.load(os.path.join(directory, "eeg_times.npy"), mmap_mode="r")
+        marker_times, codes = [], []
+        with open(os.path.join(directory, "markers.csv"), newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                marker_times.append(float(row["timestamp"]))
+                codes.append(int(row["code"]))
+        self.marker_times = np.array(marker_times)
+        self.codes = np.array(codes, dtype=np.int32)
+        self.events = []
+        events_path = os.path.join(directory, "events.jsonl")
+        if os.path.exists(events_path):
+            with open(events_path, encoding="utf-8") as f:
+                self.events = [json.loads(line) for line in f if line.strip()]
+
+    def nearest_samples(self, timestamps):
+        """Índice de la muestra de EEG más cercana a cada tiempo"""
+        after = np.searchsorted(self.times, timestamps).clip(1, len(self.times) - 1)
+        before = after - 1
+        return np.where(np.abs(self.times[after] - timestamps) < np.abs(timestamps - self.times[before]),
+                        after, before)
+
+    def event_payloads(self, timestamps, tolerance=0.001):
+        """Metadatos del stream de eventos con la misma marca de tiempo que cada marcador"""
+        if not self.events:
+            return [{} for _ in timestamps]
+        event_times = np.array([event["timestamp"] for event in self.events])
+        index = np.searchsorted(event_times, timestamps).clip(0, len(event_times) - 1)
+        previous = (index - 1).clip(0)
+        index = np.where(np.abs(event_times[previous] - timestamps) < np.abs(event_times[index] - timestamps),
+                         previous, index)
+        return [self.events[i] if abs(event_times[i] - t) <= tolerance else {} for i, t in zip(index, timestamps)]
+
+
+def _random_access(array):
+    """Sin read-ahead del kernel sobre el memmap: cada época mapea sólo sus páginas y
+    no ~2 MB alrededor (madvise no existe en Windows; ahí no se hace nada)"""
+    handle = getattr(array, "_mmap", None)
+    if handle is not None and hasattr(mmap, "MADV_RANDOM"):
+        handle.madvise(mmap.MADV_RANDOM)
+
+
+def extract_epochs(recording, output, codes=None, tmin=-0.2, tmax=0.8, baseline=(None, 0.0), session=None):
+    """Escribe las épocas alrededor de los marcadores `codes` (todos si es None).
+
+    output - prefijo: <output>.npy, <output>_meta.csv y <output>_info.json.
+    baseline - (inicio, fin) en s relativos al marcador (None = borde de la época),
+    o None para no corregir. session - filas del CSV de la sesión (read_session de
+    export_sessions.py) que se unen por bloque y trial. Devuelve la cantidad de épocas"""
+    selected = np.ones(len(recording.codes), dtype=bool) if codes is None else np.isin(recording.codes, codes)
+    marker_times = recording.marker_times[selected]
+    marker_codes = recording.codes[selected]
+    onsets = recording.nearest_samples(marker_times) if len(marker_times) else np.zeros(0, dtype=np.int64)
+
+    start, stop = int(round(tmin * recording.srate)), int(round(tmax * recording.srate))
+    inside = (onsets + start >= 0) & (onsets + stop <= len(recording.times))
+    onsets, marker_times, marker_codes = onsets[inside], marker_times[inside], marker_codes[inside]
+    offsets = np.arange(start, stop)
+    if baseline is not None:
+        low = offsets[0] if baseline[0] is None else int(round(baseline[0] * recording.srate))
+        high = offsets[-1] + 1 if baseline[1] is None else int(round(baseline[1] * recording.srate))
+        baseline_mask = (offsets >= low) & (offsets < high)
+
+    directory = os.path.dirname(output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    epochs = np.lib.format.open_memmap(output + ".npy", mode="w+", dtype=np.float32,
+                                       shape=(len(onsets), len(recording.channels), len(offsets)))
+    for first in range(0, len(onsets), EPOCH_BATCH):
+        window = onsets[first:first + EPOCH_BATCH, None] + offsets  # (épocas, muestras)
+        batch = recording.data[window].transpose(0, 2, 1)  # (épocas, canales, muestras)
+        if baseline is not None and baseline_mask.any():
+            batch = batch - batch[:, :, baseline_mask].mean(axis=2, keepdims=True)
+        epochs[first:first + len(window)] = batch
+    epochs.flush()
+    del epochs
+
+    _write_metadata(output + "_meta.csv", recording, marker_times, marker_codes, onsets, session)
+    with open(output + "_info.json", "w", encoding="utf-8") as f:
+        json.dump({"srate": recording.srate, "tmin": start / recording.srate, "tmax": stop / recording.srate,
+                   "baseline": baseline, "channels": recording.channels, "epochs": int(len(onsets)),
+                   "codes": None if codes is None else [int(code) for code in codes],
+                   "shape": ["epoch", "channel", "sample"]}, f, indent=1)
+    return len(onsets)
+
+
+def _write_metadata(path, recording, marker_times, marker_codes, onsets, session):
+    payloads = recording.event_payloads(marker_times)
+    trial_fields = ["event", "block", "trial", "effort", "credits", "condition", "target", "rt", "presses", "earned"]
+    session_rows = {}
+    session_columns = []
+    if session:
+        session_columns = [name for name in session if name not in ("session", "participant", "block", "trial")]
+        for i, (block, trial) in enumerate(zip(session["block"], session["trial"])):
+            session_rows[(block, trial)] = {name: session[name][i] for name in session_columns}
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["epoch", "code", "timestamp", "sample"] + trial_fields
+                        + ["session_" + name for name in session_columns])
+        for i, (timestamp, code, onset, payload) in enumerate(zip(marker_times, marker_codes, onsets, payloads)):
+            row = session_rows.get((payload.get("block"), payload.get("trial")), {})
+            writer.writerow([i, int(code), "{:.6f}".format(timestamp), int(onset)]
+                            + [_cell(payload.get(name)) for name in trial_fields]
+                            + [_cell(row.get(name)) for name in session_columns])
+
+
+def _cell(value):
+    return "" if value is None else value
+
+
+# ------------------------------ XDF sintético ------------------------------
+
+def _chunk(tag, content):
+    return _varlen(len(content) + 2) + struct.pack("<H", tag) + content
+
+
+def _header_xml(name, kind, channels, srate, channel_format, source_id):
+    labels = "".join("<channel><label>{}</label><unit>microvolts</unit><type>EEG</type></channel>".format(label)
+                     for label in channels) if kind == "EEG" else ""
+    return ("<?xml version=\"1.0\"?><info><name>{}</name><type>{}</type><channel_count>{}</channel_count>"
+            "<nominal_srate>{}</nominal_srate><channel_format>{}</channel_format><source_id>{}</source_id>"
+            "<desc><channels>{}</channels></desc></info>").format(
+        name, kind, len(channels), srate, channel_format, source_id, labels).encode()
+
+
+def _string_samples(stream_id, samples):
+    content = struct.pack("<I", stream_id) + _varlen(len(samples))
+    for timestamp, text in samples:
+        data = text.encode("utf-8")
+        content += b"\x08" + struct.pack("<d", timestamp) + _varlen(len(data)) + data
+    return _chunk(3, content)
+
+
+def synthetic_session(minutes, seed=0, start=10.0):
+    """Marcadores (tiempo, código, datos del trial) de una sesión con la gramática
+    de la tarea, y las filas del CSV de la sesión"""
+    rng = np.random.default_rng(seed)
+    conditions = [("TI", "Self", 0), ("OTRO", "Other", 1), ("GRUPO", "Group", 2)]
+    efforts, credits_levels = (50, 65, 80, 95), (2, 3, 4, 5)
+    end = minutes * 60 - 5
+    t = start
+    markers = [(t, 250, {})]
+    rows = []
+    block = 0
+    while t < end:
+        block += 1
+        t += 1.0
+        markers.append((t, 200, {"block": block}))
+        for trial in range(1, 49):
+            if t + 14 > end:
+                break
+            code, label, offset = conditions[rng.integers(3)]
+            effort, credits = int(rng.choice(efforts)), int(rng.choice(credits_levels))
+            context = {"block": block, "trial": trial, "effort": effort, "credits": credits, "condition": label}
+            t += 1.0  # aviso
+            markers.append((t, 100 + offset, dict(context)))
+            rt = int(rng.uniform(400, 2500))
+            choice = rng.choice(["task", "resting", "no decision"], p=[0.6, 0.35, 0.05])
+            if choice == "no decision":
+                markers.append((t + 4.0, 112, dict(context)))
+                earned, presses, success = 0, 0, False
+                t += 4.0 + 5.0
+            else:
+                markers.append((t + rt / 1000, 110 if choice == "task" else 111, dict(context, rt=rt)))
+                t += 4.0
+                if choice == "task":
+                    presses = int(rng.integers(20, 60))
+                    success = bool(rng.random() < 0.8)
+                    markers.append((t, 120, dict(context)))
+                    t += rng.uniform(3.0, 5.0)
+                    markers.append((t, 121 if success else 122, dict(context, presses=presses)))
+                    earned = credits if success else 0
+                    t += 3.0
+                else:
+                    earned, presses, success = 1, 0, True
+                    t += 5.0
+            markers.append((t, 130 + offset, dict(context, earned=earned)))
+            markers.append((t, 140 + earned, dict(context, earned=earned)))
+            t += 1.0
+            rows.append([effort, credits, label, choice, presses, success, earned,
+                         rt if choice != "no decision" else None, None, None, 0, None, None, None])
+        markers.append((t, 201, {"block": block}))
+    markers.append((t + 1.0, 251, {}))
+    return markers, rows
+
+
+def write_synthetic(path, minutes=40.0, channels=64, srate=1000, seed=0, chunk_s=1.0, erp_uv=8.0):
+    """XDF sintético y su CSV de sesión (<path sin extensión>.csv). El EEG es ruido
+    de ~10 µV con un potencial evocado (gaussiana a 300 ms) tras cada decisión, y
+    sus marcas de tiempo están en el reloj del amplificador, con deriva respecto
+    del de los marcadores (los ClockOffset permiten corregirla)"""
+    rng = np.random.default_rng(seed)
+    markers, rows = synthetic_session(minutes, seed)
+    labels = ["ch{}".format(i + 1) for i in range(channels)]
+    gain = np.linspace(1.0, 0.2, channels, dtype=np.float32)  # el potencial es mayor en los primeros canales
+    decisions = np.array([t for t, code, _ in markers if code in (100, 101, 102)])
+    names = {code: name for name, code in _marker_names().items()}
+
+    def amplifier_offset(t):
+        # Reloj del amplificador = reloj de la PC - offset
+        return 0.0025 + 2e-5 * t
+
+    total = int(minutes * 60 * srate)
+    sample_dtype = np.dtype([("flag", "u1"), ("time", "<f8"), ("value", "<f4", (channels,))])
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, "wb") as f:
+        f.write(b"XDF:")
+        f.write(_chunk(1, b"<?xml version=\"1.0\"?><info><version>1.0</version></info>"))
+        f.write(_chunk(2, struct.pack("<I", 1) + _header_xml("SyntheticEEG", "EEG", labels, srate, "float32",
+                                                              "synthetic_eeg")))
+        f.write(_chunk(2, struct.pack("<I", 2) + _header_xml(MARKER_STREAM, "Markers", ["code"], 0, "int32",
+                                                              "ProsocialTask")))
+        f.write(_chunk(2, struct.pack("<I", 3) + _header_xml(EVENTS_STREAM, "Markers", ["event"], 0, "string",
+                                                              "ProsocialTask_events")))
+        next_marker = 0
+        chunk = int(chunk_s * srate)
+        for first in range(0, total, chunk):
+            count = min(chunk, total - first)
+            true_times = (first + np.arange(count)) / srate
+            values = rng.normal(0.0, 10.0, size=(count, channels)).astype(np.float32)
+            near = decisions[(decisions > true_times[0] - 1.0) & (decisions < true_times[-1] + 1.0)]
+            for onset in near:
+                bump = erp_uv * np.exp(-0.5 * ((true_times - onset - 0.3) / 0.05) ** 2)
+                values += bump[:, None].astype(np.float32) * gain
+            samples = np.zeros(count, dtype=sample_dtype)
+            samples["flag"] = 8
+            samples["time"] = true_times - amplifier_offset(true_times) + rng.normal(0, 2e-4, count)
+            samples["value"] = values
+            f.write(_chunk(3, struct.pack("<I", 1) + _varlen(count) + samples.tobytes()))
+            if first % (5 * srate) == 0:
+                now = true_times[0]
+                f.write(_chunk(4, struct.pack("<Idd", 1, now, amplifier_offset(now))))
+                f.write(_chunk(4, struct.pack("<Idd", 2, now, 0.0)))
+                f.write(_chunk(4, struct.pack("<Idd", 3, now, 0.0)))
+            pending = []
+            while next_marker < len(markers) and (markers[next_marker][0] < true_times[-1] or first + count == total):
+                pending.append(markers[next_marker])
+                next_marker += 1
+            if pending:
+                content = struct.pack("<I", 2) + _varlen(len(pending)) + b"".join(
+                    b"\x08" + struct.pack("<di", t, code) for t, code, _ in pending)
+                f.write(_chunk(3, content))
+                f.write(_string_samples(3, [(t, json.dumps(dict({"code": code, "event": names.get(code, "")},
+                                                                **context), separators=(",", ":")))
+                                            for t, code, context in pending]))
+        for stream_id in (1, 2, 3):
+            f.write(_chunk(6, struct.pack("<I", stream_id) + b"<?xml version=\"1.0\"?><info></info>"))
+
+    csv_path = os.path.splitext(path)[0] + ".csv"
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["NivelEsfuerzo", "NivelReward", "Condición", "Decisión", "PresionesHechas", "ÉxitoTarea",
+                         "CréditosGanados", "TiempoReacciónDecisión", "TiempoReacciónPrimerPresión",
+                         "TiempoReacciónÚltimaPresión", "DesfaseFinDecisión", "ObjetivoPresiones",
+                         "CapacidadEstimada", "CapacidadAncla"])
+        writer.writerows([["" if value is None else value for value in row] for row in rows])
+    return len(markers), len(rows)
+
+
+def _marker_names():
+    from marker_grammar import PET_MARKERS
+    return PET_MARKERS
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="XDF -> grabación local mapeable en memoria")
+    convert.add_argument("xdf")
+    convert.add_argument("directory")
+    convert.add_argument("--eeg", help="Nombre del stream de EEG (por defecto el de tipo EEG)")
+    epochs = commands.add_parser("epochs", help="Épocas alrededor de los marcadores")
+    epochs.add_argument("directory", help="Grabación local (de convert)")
+    epochs.add_argument("-o", "--output", required=True, help="Prefijo de los archivos de salida")
+    epochs.add_argument("--codes", type=int, nargs="+", help="Códigos de los marcadores (por defecto todos)")
+    epochs.add_argument("--tmin", type=float, default=-0.2)
+    epochs.add_argument("--tmax", type=float, default=0.8)
+    epochs.add_argument("--baseline", type=float, nargs=2, default=(None, 0.0), metavar=("INICIO", "FIN"))
+    epochs.add_argument("--no-baseline", action="store_true")
+    epochs.add_argument("--session", help="CSV de la sesión para unir por bloque y trial")
+    synthetic = commands.add_parser("synthetic", help="XDF sintético para pruebas")
+    synthetic.add_argument("xdf")
+    synthetic.add_argument("--minutes", type=float, default=40.0)
+    synthetic.add_argument("--channels", type=int, default=64)
+    synthetic.add_argument("--srate", type=int, default=1000)
+    synthetic.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "convert":
+        info = convert_xdf(args.xdf, args.directory, args.eeg)
+        print("{} muestras x {} canales a {:.3f} Hz, {} marcadores, {} eventos -> {}".format(
+            info["samples"], len(info["channels"]), info["effective_srate"], info["markers"], info["events"],
+            args.directory))
+    elif args.command == "epochs":
+        session = None
+        if args.session:
+            from export_sessions import read_session
+            session = read_session(args.session)
+        recording = Recording(args.directory)
+        count = extract_epochs(recording, args.output, args.codes, args.tmin, args.tmax,
+                               None if args.no_baseline else tuple(args.baseline), session)
+        print("{} épocas -> {}.npy".format(count, args.output))
+    else:
+        markers, trials = write_synthetic(args.xdf, args.minutes, args.channels, args.srate, args.seed)
+        print("{} marcadores, {} trials -> {}".format(markers, trials, args.xdf))
+    print("{:.1f} s".format(time.perf_counter() - start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
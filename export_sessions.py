@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Exporta los CSV de sesión de Prosocial_Effort_Task.py a Parquet o Arrow con tipos.
+
+El CSV de task() es fácil de abrir pero incómodo para el análisis: los
+encabezados tienen acentos (y los archivos viejos están en cp1252), los tiempos
+que faltan se escriben "None" y todo es texto. Este script junta todas las
+sesiones en una tabla con un esquema fijo:
+
+    - enteros con nulos para los tiempos de reacción y las presiones,
+    - booleanos para el éxito,
+    - condición, decisión, sesión y participante codificados como diccionario,
+    - la versión del esquema en los metadatos ("pet_schema_version"), para que
+      el análisis sepa qué columnas esperar si el CSV cambia.
+
+Las columnas se leen por posición: los CSV viejos (10 columnas) y los que tienen
+las columnas agregadas después (desfase, objetivo, capacidad) se exportan igual,
+con nulos en las que no tienen. block y trial salen de las columnas Bloque y
+Trial (en los CSV sin ellas, de la posición de la fila); si un trial se repite
+porque la sesión se reanudó, queda la última fila.
+
+Con .arrow (Arrow IPC sin compresión) load_trials() mapea el archivo en memoria
+y to_numpy() devuelve las columnas sin copiarlas; .parquet es más chico y
+también carga mucho más rápido que el CSV.
+
+Uso:
+    python export_sessions.py data/*.csv -o data/pet_trials.parquet
+    python export_sessions.py data/*.csv -o data/pet_trials.arrow --compare
+
+    table = load_trials("data/pet_trials.arrow")
+    arrays, categories = to_numpy(table)
+    arrays["decision_rt"], categories["condition"]
+"""
+import argparse
+import csv
+import glob
+import io
+import os
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+SCHEMA_VERSION = 3
+
+# Trials por bloque de la tarea, para numerar los CSV sin columnas Bloque y Trial
+TRIALS_PER_BLOCK = 48
+
+# Columnas del CSV en orden (la cabecera se escribe en main() de la tarea)
+CSV_COLUMNS = [
+    ("effort", pa.int8()),
+    ("credits", pa.int8()),
+    ("condition", pa.dictionary(pa.int8(), pa.string())),
+    ("decision", pa.dictionary(pa.int8(), pa.string())),
+    ("presses", pa.int16()),
+    ("success", pa.bool_()),
+    ("earned_credits", pa.int8()),
+    ("decision_rt", pa.int32()),
+    ("first_press_time", pa.int32()),
+    ("last_press_time", pa.int32()),
+    ("decision_overshoot", pa.int32()),
+    ("target_presses", pa.int16()),
+    ("capacity_estimate", pa.float32()),
+    ("capacity_anchor", pa.int16()),
+    ("decision_onset", pa.int64()),
+    ("effort_onset", pa.int64()),
+    ("run", pa.dictionary(pa.int32(), pa.string())),
+]
+
+# Después de CSV_COLUMNS el CSV tiene Bloque y Trial (los de versiones anteriores no)
+BLOCK_INDEX = len(CSV_COLUMNS)
+TRIAL_INDEX = BLOCK_INDEX + 1
+
+SCHEMA = pa.schema(
+    [("session", pa.dictionary(pa.int32(), pa.string())),
+     ("participant", pa.dictionary(pa.int32(), pa.string())),
+     ("block", pa.int16()),
+     ("trial", pa.int16())]
+    + CSV_COLUMNS,
+    metadata={"pet_schema_version": str(SCHEMA_VERSION)})
+
+# Primera columna de la cabecera de los CSV de datos de la tarea
+HEADER_FIRST = "NivelEsfuerzo"
+
+
+def read_text(path):
+    """Contenido del CSV: utf-8, o cp1252 para los archivos de antes"""
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1252")
+
+
+def session_names(path):
+    """(sesión, participante) de data/<fecha>_<hora>_<id>.csv"""
+    session = os.path.splitext(os.path.basename(path))[0]
+    parts = session.split("_", 2)
+    return session, parts[2] if len(parts) == 3 else session
+
+
+def _value(text, kind):
+    if text in ("", "None"):
+        return None
+    if kind == pa.bool_():
+        return text == "True"
+    if pa.types.is_floating(kind):
+        return float(text)
+    if pa.types.is_integer(kind):
+        return int(float(text))
+    return text
+
+
+def read_session(path):
+    """Filas del CSV como dict de columnas (listas), o None si no es un CSV de datos"""
+    rows = list(csv.reader(io.StringIO(read_text(path))))
+    if not rows or rows[0][:1] != [HEADER_FIRST]:
+        return None
+    session, participant = session_names(path)
+    # (bloque, trial) -> fila. Un trial repetido al reanudar (--resume) se queda con la
+    # última fila; sin las columnas Bloque y Trial se numeran por posición
+    by_trial = {}
+    for i, row in enumerate(rows[1:]):
+        if len(row) > TRIAL_INDEX and row[BLOCK_INDEX] and row[TRIAL_INDEX]:
+            key = (int(row[BLOCK_INDEX]), int(row[TRIAL_INDEX]))
+        else:
+            key = (i // TRIALS_PER_BLOCK + 1, i % TRIALS_PER_BLOCK + 1)
+        by_trial[key] = row
+    trials = list(by_trial.values())
+    columns = {
+        "session": [session] * len(trials),
+        "participant": [participant] * len(trials),
+        "block": [block for block, _ in by_trial],
+        "trial": [trial for _, trial in by_trial],
+    }
+    for index, (name, kind) in enumerate(CSV_COLUMNS):
+        value_kind = kind.value_type if pa.types.is_dictionary(kind) else kind
+        columns[name] = [_value(row[index], value_kind) if index < len(row) else None for row in trials]
+    return columns
+
+
+def build_table(paths):
+    """Tabla con todas las sesiones (se saltean los CSV que no son de datos de la tarea)"""
+    columns = {field.name: [] for field in SCHEMA}
+    sessions = 0
+    for path in paths:
+        session = read_session(path)
+        if session is None:
+            continue
+        sessions += 1
+        for name, values in session.items():
+            columns[name].extend(values)
+    arrays = []
+    for field in SCHEMA:
+        if pa.types.is_dictionary(field.type):
+            array = pa.array(columns[field.name], type=field.type.value_type).dictionary_encode()
+            arrays.append(array.cast(field.type))
+        else:
+            arrays.append(pa.array(columns[field.name], type=field.type))
+    return pa.Table.from_arrays(arrays, schema=SCHEMA), sessions
+
+
+def write_table(table, path):
+    """.arrow: Arrow IPC sin compresión (se mapea en memoria); si no, Parquet"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    if path.endswith(".arrow"):
+        feather.write_feather(table, path, compression="uncompressed")
+    else:
+        pq.write_table(table, path)
+
+
+def load_trials(path):
+    """Tabla exportada. Falla si la versión del esquema no es la de este script"""
+    if path.endswith(".arrow"):
+        table = feather.read_table(path, memory_map=True)
+    else:
+        table = pq.read_table(path)
+    version = (table.schema.metadata or {}).get(b"pet_schema_version")
+    if version != str(SCHEMA_VERSION).encode():
+        raise ValueError("{}: versión de esquema {} (se esperaba {})".format(
+            path, version.decode() if version else "desconocida", SCHEMA_VERSION))
+    return table
+
+
+def to_numpy(table):
+    """(arrays, categorías) de NumPy.
+
+    Las columnas sin nulos se devuelven sin copiar (vistas sobre el archivo
+    mapeado si es .arrow); las enteras con nulos pasan a float con NaN. Las de
+    diccionario se devuelven como códigos, con sus valores en categorías"""
+    table = table.combine_chunks()
+    arrays, categories = {}, {}
+    for name, column in zip(table.column_names, table.columns):
+        chunk = column.chunk(0) if column.num_chunks else pa.array([], type=column.type)
+        if pa.types.is_dictionary(chunk.type):
+            categories[name] = chunk.dictionary.to_pylist()
+            chunk = chunk.indices
+        arrays[name] = chunk.to_numpy(zero_copy_only=chunk.null_count == 0 and not pa.types.is_boolean(chunk.type))
+    return arrays, categories
+
+
+def compare_loads(paths, output, repeat=3):
+    """Mejor tiempo de leer los CSV con tipos (read_session) contra cargar la exportación"""
+    def best(function):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    csv_time = best(lambda: [read_session(path) for path in paths])
+    export_time = best(lambda: to_numpy(load_trials(output)))
+    print("CSV {:.2f} ms, {} {:.2f} ms ({:.0f}x)".format(
+        csv_time * 1000, os.path.splitext(output)[1], export_time * 1000, csv_time / max(export_time, 1e-9)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="CSV de sesión (por defecto data/*.csv)")
+    parser.add_argument("-o", "--output", default=os.path.join("data", "pet_trials.parquet"),
+                        help=".parquet o .arrow")
+    parser.add_argument("--compare", action="store_true", help="Compara el tiempo de carga con el de los CSV")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join("data", "*.csv")))
+    table, sessions = build_table(paths)
+    if not sessions:
+        print("No hay CSV de datos de la tarea en los archivos indicados")
+        return 1
+    write_table(table, args.output)
+    print("{} sesiones, {} trials -> {} (esquema v{})".format(sessions, table.num_rows, args.output, SCHEMA_VERSION))
+    if args.compare:
+        compare_loads(paths, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
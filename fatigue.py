@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Modelo de fatiga en línea (opcional, fatigue_mode en Prosocial_Effort_Task.py).
+
+La tabla de esfuerzos se calcula una vez con la capacidad calibrada y se usa en
+los 144 trials, así que con la fatiga aumentan los fracasos al final de la
+sesión. Este modelo sigue la capacidad del participante (presiones en la
+ventana de max_answer_time) a lo largo de los trials de trabajo con un filtro
+de Kalman de nivel local:
+
+    predicción    var += (drift_sd * capacidad)²       (la capacidad puede cambiar)
+    observación   presiones en la ventana (window_presses de calibration.py)
+    actualización ganancia = var / (var + var_obs), costo constante por trial
+
+Entre bloques, si la capacidad estimada se alejó de la usada para calcular los
+objetivos (el ancla) más de `reanchor_threshold` y el intervalo del 95 % no la
+incluye, los objetivos del bloque siguiente se recalculan con la estimación
+(ceil(capacidad x esfuerzo / 100), igual que tras la calibración).
+
+Los trials de esfuerzo bajo no siempre se hacen a máxima velocidad, por lo que
+sólo se usan como observación los trials con objetivo >= `min_effort` % de la
+capacidad.
+"""
+from math import ceil, sqrt
+
+from calibration import Z_95, window_presses
+
+
+class FatigueModel:
+    """Capacidad corregida por fatiga y objetivos de esfuerzo re-anclados"""
+
+    def __init__(self, capacity, window_ms, capacity_sd=2.0, drift_sd=0.02, between_sd=0.05,
+                 reanchor_threshold=0.1, min_effort=65, reanchor=False):
+        self.window_ms = window_ms
+        self.initial = float(capacity)
+        self.anchor = int(capacity)
+        self.mean = float(capacity)
+        self.variance = float(capacity_sd) ** 2
+        self.drift_sd = drift_sd  # relativo, por trial de trabajo
+        self.between_sd = between_sd  # relativo, variabilidad de cada trial
+        self.reanchor_threshold = reanchor_threshold
+        self.min_effort = min_effort
+        self.reanchor = reanchor
+        self.observations = 0
+        self.anchors = [(0, self.anchor)]  # (bloque desde el que rige, capacidad)
+
+    def to_state(self):
+        """Estado del modelo en tipos de JSON (para el punto de control de la sesión)"""
+        state = dict(vars(self))
+        state["anchors"] = [list(anchor) for anchor in self.anchors]
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        model = cls(state["initial"], state["window_ms"])
+        model.__dict__.update(state)
+        model.anchors = [tuple(anchor) for anchor in state["anchors"]]
+        return model
+
+    def target(self, effort_percent):
+        """Cantidad de presiones del nivel de esfuerzo con la capacidad ancla actual"""
+        return max(1, ceil(self.anchor * (effort_percent / 100)))
+
+    def update(self, effort_percent, press_log, reached):
+        """Actualiza la capacidad con un trial de trabajo. Devuelve la estimación"""
+        if effort_percent < self.min_effort:
+            return self.mean
+        observation, counting_sd, interval = window_presses(press_log, reached, self.window_ms)
+        if interval is None:
+            return self.mean
+        self.variance += (self.drift_sd * self.mean) ** 2
+        observation_variance = counting_sd ** 2 + (self.between_sd * observation) ** 2
+        gain = self.variance / (self.variance + observation_variance)
+        self.mean += gain * (observation - self.mean)
+        self.variance *= 1 - gain
+        self.observations += 1
+        return self.mean
+
+    def interval(self):
+        half = Z_95 * sqrt(self.variance)
+        return self.mean - half, self.mean + half
+
+    @property
+    def fatigue_index(self):
+        """Capacidad estimada / capacidad calibrada (1 = sin fatiga)"""
+        return self.mean / self.initial
+
+    def end_block(self, block_num):
+        """Decide el ancla del bloque siguiente. Devuelve True si se re-ancló"""
+        if not self.reanchor or not self.observations:
+            return False
+        low, high = self.interval()
+        if abs(self.mean - self.anchor) <= self.reanchor_threshold * self.anchor or low <= self.anchor <= high:
+            return False
+        self.anchor = max(1, int(round(self.mean)))
+        self.anchors.append((block_num + 1, self.anchor))
+        return True
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Marcadores LSL enviados desde un hilo aparte, con un segundo stream de metadatos.
+
+Antes send_marker() hacía push_sample() en el hilo de la tarea, y el único dato
+era el código int32: para sacar épocas había que volver a unir los marcadores con
+las filas del CSV por orden, lo que falla si falta un marcador o un trial.
+
+MarkerStream crea dos outlets:
+
+    <name>         int32, el código del marcador (igual que antes)
+    <name>Events   string, un JSON compacto por marcador con el código, el nombre
+                   del evento y los datos del trial (bloque, trial, esfuerzo,
+                   créditos, condición, TR, presiones, ...)
+
+send() toma la marca de tiempo con local_clock() en el momento de la llamada y
+deja el marcador en una cola; el hilo de fondo lo envía a ambos outlets con esa
+misma marca de tiempo, así que el retraso del hilo no cambia el tiempo del
+evento y los dos streams se pueden unir por marca de tiempo.
+
+Uso:
+    stream = MarkerStream("ProsocialTaskMarkers", "ProsocialTask", names={110: "RESPONSE_WORK"})
+    stream.send(110, "Response: Work", {"block": 1, "trial": 3, "rt": 812})
+    stream.close()
+"""
+import json
+import queue
+import threading
+
+from pylsl import StreamInfo, StreamOutlet, local_clock
+
+_STOP = object()
+
+
+class MarkerStream:
+    """Outlets de marcadores y de metadatos, alimentados por un hilo de fondo"""
+
+    def __init__(self, name, source_id, names=None, fields=(), debug=False):
+        self.names = names or {}
+        self.debug = debug
+        self.outlet = StreamOutlet(StreamInfo(name, "Markers", 1, 0, "int32", source_id))
+        info = StreamInfo(name + "Events", "Markers", 1, 0, "string", source_id + "_events")
+        info.desc().append_child_value("payload", "json")
+        info.desc().append_child_value("fields", ",".join(("code", "event") + tuple(fields)))
+        self.events = StreamOutlet(info)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._pusher, name="lsl-markers", daemon=True)
+        self._thread.start()
+
+    def send(self, code, description="", fields=None):
+        """Encola el marcador con la marca de tiempo de ahora (no bloquea)"""
+        self._queue.put((code, local_clock(), description, fields))
+
+    def _pusher(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            code, timestamp, description, fields = item
+            try:
+                self.outlet.push_sample([code], timestamp)
+                payload = {"code": code, "event": self.names.get(code, "")}
+                if fields:
+                    payload.update(fields)
+                self.events.push_sample([json.dumps(payload, separators=(",", ":"))], timestamp)
+                if self.debug:
+                    print(f"[EEG Marker] {code} - {description}")
+            except Exception as e:
+                print(f"Error enviando marcador: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Espera a que el hilo de fondo envíe los marcadores pendientes"""
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Envía los marcadores pendientes y termina el hilo"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Validación de la secuencia de marcadores LSL de Prosocial_Effort_Task.py.
+
+El protocolo define una gramática estricta de marcadores:
+
+    250 (o 256 al reanudar)
+    252, (120, 121|122)..., 253                         calibración
+    (120, 121|122)...                                   práctica de esfuerzos
+    254, [10c, 110, 120, 121|122 | 10c, 111 | (10c, 112)..., 10c ...], 13c ..., 255
+    200, [10c, 110, 120, 121, 13c, 140+n (n >= 2)       trabajo con éxito
+          | 10c, 110, 120, 122, 13c, 140               trabajo sin éxito
+          | 10c, 111, 13c, 141                          descanso
+          | 10c, 112, 13c, 140] ..., 201                sin respuesta
+    251 (en cualquier momento: ESC o fin; una sola vez)
+    250 o 256 en cualquier momento (otro proceso tras un corte)
+
+con c la condición (0 TI, 1 OTRO, 2 GRUPO), que debe ser la misma en la decisión
+y en el feedback. En la práctica no hay FEEDBACK_CREDITS y una omisión repite la
+decisión.
+
+La gramática se compila a un autómata: una tabla plana de transiciones
+(estado x símbolo) y cada marcador cuesta dos búsquedas en listas, O(1). Tras
+una violación el autómata se re-sincroniza con el marcador recibido (el primer
+estado de la misma sección que lo acepta), así que un marcador perdido produce
+una o dos violaciones y no invalida el resto de la sesión.
+
+En línea (check_markers en Prosocial_Effort_Task.py) se valida cada marcador al
+enviarlo. Fuera de línea se validan grabaciones XDF (stream ProsocialTaskMarkers,
+requiere pyxdf), bases de results_store.py (una sesión por fuente) o CSV/TXT
+con un código por línea o una columna "code":
+
+    python marker_grammar.py data/*.xdf data/results.sqlite -o data/marker_check.csv --jobs 8
+"""
+import csv
+import os
+import sys
+from collections import Counter
+
+# Códigos de los marcadores (los mismos que MARKERS en Prosocial_Effort_Task.py)
+PET_MARKERS = {
+    'DECISION_START_SELF': 100, 'DECISION_START_OTHER': 101, 'DECISION_START_GROUP': 102,
+    'RESPONSE_WORK': 110, 'RESPONSE_REST': 111, 'RESPONSE_OMISSION': 112,
+    'EFFORT_BAR_START': 120, 'EFFORT_BAR_SUCCESS': 121, 'EFFORT_BAR_FAIL': 122,
+    'FEEDBACK_SELF_START': 130, 'FEEDBACK_OTHER_START': 131, 'FEEDBACK_GROUP_START': 132,
+    'FEEDBACK_CREDITS': 140,
+    'BLOCK_START': 200, 'BLOCK_END': 201,
+    'EXPERIMENT_START': 250, 'EXPERIMENT_END': 251, 'CALIBRATION_START': 252, 'CALIBRATION_END': 253,
+    'PRACTICE_START': 254, 'PRACTICE_END': 255, 'SESSION_RESUMED': 256,
+}
+
+STREAM_NAME = "ProsocialTaskMarkers"
+
+CONDITIONS = ("SELF", "OTHER", "GROUP")
+# Créditos del feedback: 0 (fracaso u omisión), 1 (descanso), 2 o más (trabajo con éxito)
+CREDITS = ("0", "1", "N")
+
+SYMBOLS = (["EXPERIMENT_START", "EXPERIMENT_END", "CALIBRATION_START", "CALIBRATION_END", "PRACTICE_START",
+            "PRACTICE_END", "SESSION_RESUMED", "BLOCK_START", "BLOCK_END", "RESPONSE_WORK", "RESPONSE_REST",
+            "RESPONSE_OMISSION", "EFFORT_BAR_START", "EFFORT_BAR_SUCCESS", "EFFORT_BAR_FAIL"]
+           + ["DECISION_" + c for c in CONDITIONS] + ["FEEDBACK_" + c for c in CONDITIONS]
+           + ["CREDITS_" + k for k in CREDITS] + ["UNKNOWN"])
+SYMBOL = {name: i for i, name in enumerate(SYMBOLS)}
+
+
+def grammar_rules():
+    """Transiciones válidas: lista de (estado, símbolo, estado siguiente).
+    Los estados son "sección:nombre"; la sección se usa para re-sincronizar"""
+    rules = [
+        ("session:idle", "CALIBRATION_START", "session:calibration"),
+        ("session:idle", "EFFORT_BAR_START", "session:effort"),
+        ("session:idle", "PRACTICE_START", "practice:idle"),
+        ("session:idle", "BLOCK_START", "block:idle"),
+        ("session:effort", "EFFORT_BAR_SUCCESS", "session:idle"),
+        ("session:effort", "EFFORT_BAR_FAIL", "session:idle"),
+        ("session:calibration", "EFFORT_BAR_START", "session:calibration_effort"),
+        ("session:calibration", "CALIBRATION_END", "session:idle"),
+        ("session:calibration_effort", "EFFORT_BAR_SUCCESS", "session:calibration"),
+        ("session:calibration_effort", "EFFORT_BAR_FAIL", "session:calibration"),
+        ("session:between_blocks", "BLOCK_START", "block:idle"),
+        ("practice:idle", "PRACTICE_END", "session:between_blocks"),
+        ("block:idle", "BLOCK_END", "session:between_blocks"),
+    ]
+    for c in CONDITIONS:
+        # Práctica: sin FEEDBACK_CREDITS, la omisión repite la decisión
+        rules += [
+            ("practice:idle", "DECISION_" + c, "practice:decision_" + c),
+            ("practice:decision_" + c, "RESPONSE_WORK", "practice:work_" + c),
+            ("practice:decision_" + c, "RESPONSE_REST", "practice:feedback_" + c),
+            ("practice:decision_" + c, "RESPONSE_OMISSION", "practice:omission_" + c),
+            ("practice:omission_" + c, "DECISION_" + c, "practice:decision_" + c),
+            ("practice:work_" + c, "EFFORT_BAR_START", "practice:effort_" + c),
+            ("practice:effort_" + c, "EFFORT_BAR_SUCCESS", "practice:feedback_" + c),
+            ("practice:effort_" + c, "EFFORT_BAR_FAIL", "practice:feedback_" + c),
+            ("practice:feedback_" + c, "FEEDBACK_" + c, "practice:idle"),
+        ]
+        # Tarea: el feedback lleva los créditos ganados
+        rules += [
+            ("block:idle", "DECISION_" + c, "block:decision_" + c),
+            ("block:decision_" + c, "RESPONSE_WORK", "block:work_" + c),
+            ("block:decision_" + c, "RESPONSE_REST", "block:feedback_1_" + c),
+            ("block:decision_" + c, "RESPONSE_OMISSION", "block:feedback_0_" + c),
+            ("block:work_" + c, "EFFORT_BAR_START", "block:effort_" + c),
+            ("block:effort_" + c, "EFFORT_BAR_SUCCESS", "block:feedback_N_" + c),
+            ("block:effort_" + c, "EFFORT_BAR_FAIL", "block:feedback_0_" + c),
+        ]
+        for k in CREDITS:
+            rules += [
+                ("block:feedback_{}_{}".format(k, c), "FEEDBACK_" + c, "block:credits_" + k),
+                ("block:credits_" + k, "CREDITS_" + k, "block:idle"),
+            ]
+    return rules
+
+
+class MarkerGrammar:
+    """Autómata compilado: tablas planas de transición y validez"""
+
+    def __init__(self, markers=None, rules=None):
+        markers = markers or PET_MARKERS
+        rules = rules or grammar_rules()
+        self.states = []
+        for state, _, following in rules:
+            for name in (state, following):
+                if name not in self.states:
+                    self.states.append(name)
+        # Aceptados en cualquier estado: EXPERIMENT_END (ESC o fin; salvo después de
+        # otro EXPERIMENT_END, que es una violación) y el inicio de otro proceso (la
+        # sesión anterior pudo cortarse en cualquier punto)
+        anywhere = [("EXPERIMENT_END", "session:end"), ("EXPERIMENT_START", "session:idle"),
+                    ("SESSION_RESUMED", "session:idle")]
+        self.states = ["session:start"] + self.states + [following for _, following in anywhere]
+        self.states = list(dict.fromkeys(self.states))
+        index = {name: i for i, name in enumerate(self.states)}
+        self.start = index["session:start"]
+
+        # Código -> símbolo (lista indexada por código)
+        by_code = {
+            markers['EXPERIMENT_START']: "EXPERIMENT_START", markers['EXPERIMENT_END']: "EXPERIMENT_END",
+            markers['CALIBRATION_START']: "CALIBRATION_START", markers['CALIBRATION_END']: "CALIBRATION_END",
+            markers['PRACTICE_START']: "PRACTICE_START", markers['PRACTICE_END']: "PRACTICE_END",
+            markers['SESSION_RESUMED']: "SESSION_RESUMED",
+            markers['BLOCK_START']: "BLOCK_START", markers['BLOCK_END']: "BLOCK_END",
+            markers['RESPONSE_WORK']: "RESPONSE_WORK", markers['RESPONSE_REST']: "RESPONSE_REST",
+            markers['RESPONSE_OMISSION']: "RESPONSE_OMISSION", markers['EFFORT_BAR_START']: "EFFORT_BAR_START",
+            markers['EFFORT_BAR_SUCCESS']: "EFFORT_BAR_SUCCESS", markers['EFFORT_BAR_FAIL']: "EFFORT_BAR_FAIL",
+            markers['DECISION_START_SELF']: "DECISION_SELF", markers['DECISION_START_OTHER']: "DECISION_OTHER",
+            markers['DECISION_START_GROUP']: "DECISION_GROUP",
+            markers['FEEDBACK_SELF_START']: "FEEDBACK_SELF", markers['FEEDBACK_OTHER_START']: "FEEDBACK_OTHER",
+            markers['FEEDBACK_GROUP_START']: "FEEDBACK_GROUP",
+            markers['FEEDBACK_CREDITS']: "CREDITS_0", markers['FEEDBACK_CREDITS'] + 1: "CREDITS_1",
+        }
+        by_code.update({markers['FEEDBACK_CREDITS'] + n: "CREDITS_N" for n in range(2, 10)})
+        self.symbols = [SYMBOL["UNKNOWN"]] * (max(by_code) + 1)
+        for code, name in by_code.items():
+            self.symbols[code] = SYMBOL[name]
+
+        width = len(SYMBOLS)
+        self.width = width
+        self.next = [-1] * (len(self.states) * width)
+        self.valid = [False] * len(self.next)
+        for state, symbol, following in rules:
+            position = index[state] * width + SYMBOL[symbol]
+            self.next[position] = index[following]
+            self.valid[position] = True
+        for symbol, following in anywhere:
+            for state in range(len(self.states)):
+                if symbol == "EXPERIMENT_END" and state == index["session:end"]:
+                    continue
+                position = state * width + SYMBOL[symbol]
+                self.next[position] = index[following]
+                self.valid[position] = True
+
+        # Re-sincronización: el primer estado de la misma sección (y si no, de
+        # cualquiera) que acepta el símbolo; si ninguno lo acepta se queda igual
+        sections = [name.split(":")[0] for name in self.states]
+        for state in range(len(self.states)):
+            order = ([s for s in range(len(self.states)) if sections[s] == sections[state]]
+                     + list(range(len(self.states))))
+            for symbol in range(width):
+                position = state * width + symbol
+                if self.valid[position]:
+                    continue
+                self.next[position] = state
+                for candidate in order:
+                    if self.valid[candidate * width + symbol]:
+                        self.next[position] = self.next[candidate * width + symbol]
+                        break
+
+    def expected(self, state):
+        """Símbolos válidos en un estado (para el informe)"""
+        row = state * self.width
+        return [SYMBOLS[s] for s in range(self.width)
+                if self.valid[row + s] and SYMBOLS[s] not in ("EXPERIMENT_END", "EXPERIMENT_START", "SESSION_RESUMED")]
+
+    def validator(self):
+        return MarkerValidator(self)
+
+
+class MarkerValidator:
+    """Valida una secuencia de marcadores, uno a la vez (O(1) por marcador)"""
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.state = grammar.start
+        self.count = 0
+        self.violations = []
+
+    def feed(self, code, timestamp=None):
+        """Procesa un marcador. Devuelve la violación (dict) o None"""
+        grammar = self.grammar
+        symbol = grammar.symbols[code] if 0 <= code < len(grammar.symbols) else SYMBOL["UNKNOWN"]
+        position = self.state * grammar.width + symbol
+        previous = self.state
+        self.state = grammar.next[position]
+        self.count += 1
+        if grammar.valid[position]:
+            return None
+        state_name = grammar.states[previous]
+        violation = {
+            "index": self.count - 1,
+            "timestamp": timestamp,
+            "code": code,
+            "state": state_name,
+            "rule": "{} -> {}".format(_family(state_name), SYMBOLS[symbol]),
+            "expected": " | ".join(grammar.expected(previous)),
+        }
+        self.violations.append(violation)
+        return violation
+
+    def feed_all(self, codes, timestamps=None):
+        for i, code in enumerate(codes):
+            self.feed(int(code), None if timestamps is None else timestamps[i])
+        return self.violations
+
+    def rule_counts(self):
+        return Counter(violation["rule"] for violation in self.violations)
+
+    def write_report(self, path, source=""):
+        write_violations([(source, violation) for violation in self.violations], path)
+
+
+def _family(state_name):
+    """Nombre del estado sin la condición ni los créditos (agrupa las reglas)"""
+    section, name = state_name.split(":")
+    parts = [part for part in name.split("_") if part not in CONDITIONS and part not in CREDITS]
+    return "{}:{}".format(section, "_".join(parts))
+
+
+def write_violations(rows, path):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    columns = ["index", "timestamp", "code", "state", "rule", "expected"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["source"] + columns)
+        for source, violation in rows:
+            writer.writerow([source] + ["" if violation[column] is None else violation[column]
+                                        for column in columns])
+
+
+# ------------------------- Fuentes fuera de línea -------------------------
+
+def read_xdf(path, stream_name=STREAM_NAME):
+    import pyxdf
+    streams, _ = pyxdf.load_xdf(path, select_streams=[{"name": stream_name}], dejitter_timestamps=False)
+    if not streams:
+        return []
+    stream = streams[0]
+    codes = [int(sample[0]) for sample in stream["time_series"]]
+    return [(path, codes, list(stream["time_stamps"]))]
+
+
+def read_results_db(path):
+    """Una secuencia por sesión de la base de results_store.py"""
+    import sqlite3
+    try:
+        connection = sqlite3.connect("file:{}?mode=ro".format(path), uri=True)
+        try:
+            rows = connection.execute("SELECT session, code, time_ms FROM markers ORDER BY rowid").fetchall()
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        raise ValueError("{}: {}".format(path, e)) from e
+    sessions = {}
+    for session, code, time_ms in rows:
+        codes, times = sessions.setdefault(session, ([], []))
+        codes.append(code)
+        times.append(time_ms)
+    return [("{}#{}".format(path, session), codes, times) for session, (codes, times) in sessions.items()]
+
+
+def read_marker_log(path):
+    """CSV con columna "code" (y opcionalmente "timestamp"), o un código por línea"""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [row for row in csv.reader(f) if row and not row[0].startswith("#")]
+    if not rows:
+        return []
+    header = [name.strip().lower() for name in rows[0]]
+    if "code" in header:
+        code_column = header.index("code")
+        time_column = header.index("timestamp") if "timestamp" in header else None
+        body = rows[1:]
+        codes = [int(float(row[code_column])) for row in body]
+        times = [float(row[time_column]) for row in body] if time_column is not None else None
+        return [(path, codes, times)]
+    return [(path, [int(float(row[0])) for row in rows], None)]
+
+
+def read_sources(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xdf", ".xdfz"):
+        return read_xdf(path)
+    if extension in (".sqlite", ".db"):
+        return read_results_db(path)
+    return read_marker_log(path)
+
+
+def validate_files(paths):
+    """Valida los archivos (se corre en un proceso). Devuelve [(fuente, marcadores, violaciones)]"""
+    grammar = MarkerGrammar()
+    results = []
+    for path in paths:
+        try:
+            sources = read_sources(path)
+        except (OSError, ValueError) as e:
+            results.append((path, 0, [{"index": "", "timestamp": None, "code": "", "state": "",
+                                       "rule": "error de lectura", "expected": str(e)}]))
+            continue
+        for source, codes, times in sources:
+            validator = grammar.validator()
+            validator.feed_all(codes, times)
+            results.append((source, validator.count, validator.violations))
+    return results
+
+
+def main():
+    # Sólo para la línea de comandos: la tarea importa este módulo y no los necesita
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Grabaciones .xdf, bases .sqlite o registros .csv/.txt")
+    parser.add_argument("-o", "--output", default=os.path.join("data", "marker_check.csv"),
+                        help="CSV con una fila por violación")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if args.jobs > 1 and len(args.paths) > 1:
+        chunks = [args.paths[i::args.jobs] for i in range(min(args.jobs, len(args.paths)))]
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            results = [result for chunk in executor.map(validate_files, chunks) for result in chunk]
+        results.sort(key=lambda result: result[0])
+    else:
+        results = validate_files(args.paths)
+
+    totals = Counter()
+    rows = []
+    for source, count, violations in results:
+        totals.update(violation["rule"] for violation in violations)
+        rows.extend((source, violation) for violation in violations)
+        if violations:
+            print("{}: {} marcadores, {} violaciones".format(source, count, len(violations)))
+    write_violations(rows, args.output)
+    print("{} secuencias, {} marcadores, {} violaciones -> {}".format(
+        len(results), sum(count for _, count, _ in results), len(rows), args.output))
+    for rule, count in totals.most_common():
+        print("  {:>6}  {}".format(count, rule))
+    return 1 if rows else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
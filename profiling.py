@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Profiler opcional de la tarea: histogramas de latencia por fase.
+
+Las funciones decoradas con @profiler.timed("nombre") definen la fase actual
+(la más interna si se anidan). Dentro de cada fase se registran:
+
+    call    duración total de la llamada
+    render  tiempo desde la última marca (inicio de la fase, último flip o
+            último evento recibido) hasta el flip, es decir, lo que se tarda
+            en componer el cuadro
+    flip    duración de pygame.display.flip() / update()
+    events  duración de cada lectura de la cola de eventos
+
+Los histogramas son logarítmico-lineales al estilo HdrHistogram (error relativo
+menor a 1/2**SUB_BUCKET_BITS), en microsegundos y con memoria acotada, por lo que
+el profiler puede quedar activo en sesiones reales. Desactivado, cada llamada
+decorada cuesta sólo la comprobación de `enabled`.
+
+Uso:
+    from profiling import profiler
+    profiler.enable()
+    ...
+    profiler.dump("data/sesion_profile.json")
+"""
+import functools
+import json
+import os
+import time
+
+import pygame
+
+# 5 bits de sub-intervalos: 32 intervalos por potencia de 2 (~3 % de error)
+SUB_BUCKET_BITS = 5
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    """Histograma de latencias en µs con intervalos logarítmico-lineales"""
+
+    def __init__(self, sub_bucket_bits=SUB_BUCKET_BITS):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.buckets = {}  # valor mínimo del intervalo -> cantidad
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _shift(self, value):
+        return max(0, value.bit_length() - self.sub_bucket_bits - 1)
+
+    def record(self, value_us):
+        value = max(0, int(value_us))
+        shift = self._shift(value)
+        bucket = (value >> shift) << shift
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """Valor (µs) bajo el cual queda el p % de las muestras (cota superior del intervalo)"""
+        if not self.count:
+            return None
+        threshold = self.count * p / 100.0
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= threshold:
+                return min(self.max, bucket + (1 << self._shift(bucket)) - 1)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "min_us": self.min,
+            "mean_us": round(self.mean(), 1) if self.count else None,
+            "max_us": self.max,
+            "percentiles_us": {str(p): self.percentile(p) for p in PERCENTILES},
+            "buckets_us": {str(bucket): count for bucket, count in sorted(self.buckets.items())},
+        }
+
+
+class Profiler:
+    """Registro de latencias por fase (desactivado hasta llamar a enable())"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.enabled = False
+        self.histograms = {}  # (fase, métrica) -> LatencyHistogram
+        self._phases = []
+        self._mark = None
+
+    def enable(self):
+        self.enabled = True
+        self._mark = self.clock()
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.histograms = {}
+        self._phases = []
+        self._mark = self.clock()
+
+    @property
+    def phase(self):
+        return self._phases[-1] if self._phases else "other"
+
+    def record(self, phase, metric, seconds):
+        key = (phase, metric)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        histogram.record(seconds * 1e6)
+
+    def mark(self):
+        """Marca desde la que se mide el render del próximo flip"""
+        if self.enabled:
+            self._mark = self.clock()
+
+    def timed(self, name):
+        """Decorador: la función define una fase y se registra su duración total"""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = self.clock()
+                if not self._phases:
+                    self._mark = start
+                self._phases.append(name)
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self._phases.pop()
+                    self.record(name, "call", self.clock() - start)
+            return wrapper
+        return decorator
+
+    def flip(self, rect=None, present=None):
+        """pygame.display.flip() (o update(rect)) registrando render y flip.
+        present - función que muestra el cuadro en lugar de pygame.display (recibe rect)"""
+        if not self.enabled:
+            _present(rect, present)
+            return
+        start = self.clock()
+        if self._mark is not None:
+            self.record(self.phase, "render", start - self._mark)
+        _present(rect, present)
+        self._mark = self.clock()
+        self.record(self.phase, "flip", self._mark - start)
+
+    def events(self):
+        """pygame.event.get() registrando el tiempo de lectura de la cola"""
+        if not self.enabled:
+            return pygame.event.get()
+        start = self.clock()
+        events = pygame.event.get()
+        end = self.clock()
+        self.record(self.phase, "events", end - start)
+        if events:
+            self._mark = end
+        return events
+
+    def summary_lines(self):
+        lines = ["{:<44} {:>8} {:>10} {:>10} {:>10} {:>10}".format(
+            "fase / métrica", "n", "p50 ms", "p99 ms", "p99.9 ms", "máx ms")]
+        for (phase, metric), histogram in sorted(self.histograms.items()):
+            lines.append("{:<44} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                phase + " / " + metric, histogram.count, histogram.percentile(50) / 1000.0,
+                histogram.percentile(99) / 1000.0, histogram.percentile(99.9) / 1000.0, histogram.max / 1000.0))
+        return lines
+
+    def dump(self, path):
+        """Escribe los histogramas en JSON y devuelve el resumen en texto"""
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        data = {
+            "unit": "us",
+            "sub_bucket_bits": SUB_BUCKET_BITS,
+            "phases": {},
+        }
+        for (phase, metric), histogram in sorted(self.histograms.items()):
+            data["phases"].setdefault(phase, {})[metric] = histogram.to_dict()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+        return self.summary_lines()
+
+
+def _present(rect, present):
+    if present is not None:
+        present(rect)
+    elif rect is None:
+        pygame.display.flip()
+    else:
+        pygame.display.update(rect)
+
+
+# Profiler de la tarea (se activa con profile_mode en Prosocial_Effort_Task.py)
+profiler = Profiler()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Backends de presentación de la tarea.
+
+    software  (por defecto) se dibuja en la superficie de pygame.display y se
+              muestra con display.flip() / display.update(rect)
+    sdl2      SDL_Renderer mediante pygame._sdl2.video: las pantallas ya
+              compuestas (diapositivas, pantallas de decisión con sus círculos,
+              textos) se suben una vez como texturas y cada cuadro es una sola
+              tanda de copias de texturas + present, sin blits de pantalla
+              completa en la CPU. Lo que se sigue dibujando en `screen` (barra de
+              esfuerzo, descanso, ...) se sube a una textura de streaming.
+
+Con el backend sdl2 se intenta primero un renderer acelerado y, si no hay GPU
+(por ejemplo con SDL_VIDEODRIVER=dummy/offscreen), se usa el renderer por
+software de SDL. Si pygame._sdl2 no está disponible se vuelve al backend software.
+"""
+import weakref
+
+import pygame
+from pygame.locals import FULLSCREEN
+
+
+class SoftwareBackend:
+    """Dibujo en la superficie de la ventana (comportamiento original)"""
+
+    name = "software"
+
+    def __init__(self, resolution, fullscreen=False, caption=""):
+        pygame.display.set_caption(caption)
+        self.screen = pygame.display.set_mode(resolution, FULLSCREEN if fullscreen else 0)
+
+    def present(self, rect=None):
+        """Muestra `screen` (completa o sólo la región rect)"""
+        if rect is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rect)
+
+    def show_layers(self, layers, background, rect=None):
+        """Muestra capas (superficie, posición) sobre el color de fondo. Con rect sólo
+        se compone y actualiza esa región (la pantalla ya muestra el resto)"""
+        if rect is None:
+            self.screen.fill(background)
+        else:
+            self.screen.set_clip(rect)
+        for surface, position in layers:
+            self.screen.blit(surface, position)
+        self.screen.set_clip(None)
+        self.present(rect)
+
+    def prepare(self, surface):
+        """Prepara una superficie que se mostrará pronto (nada que hacer por software)"""
+
+    def close(self):
+        pass
+
+
+class TextureBackend:
+    """Presentación con SDL_Renderer y texturas (pygame._sdl2)"""
+
+    name = "sdl2"
+
+    def __init__(self, resolution, fullscreen=False, caption="", vsync=True):
+        from pygame._sdl2.sdl2 import error as sdl_error
+        from pygame._sdl2.video import Renderer, Texture, Window
+
+        self._texture_class = Texture
+        # Ventana oculta del módulo display: sólo para que convert() tenga formato de pixeles
+        pygame.display.set_mode((1, 1), pygame.HIDDEN)
+        self.window = Window(caption, size=resolution, fullscreen_desktop=fullscreen)
+        try:
+            self.renderer = Renderer(self.window, accelerated=1, vsync=vsync)
+            self.accelerated = True
+        except sdl_error:
+            self.renderer = Renderer(self.window, accelerated=0, vsync=False)
+            self.accelerated = False
+        self.renderer.logical_size = tuple(resolution)
+        self.screen = pygame.Surface(resolution).convert()
+        self.screen_texture = Texture(self.renderer, tuple(resolution), streaming=True)
+        # Textura de cada superficie ya subida; se libera junto con la superficie
+        self.textures = weakref.WeakKeyDictionary()
+
+    def texture(self, surface):
+        texture = self.textures.get(surface)
+        if texture is None:
+            texture = self.textures[surface] = self._texture_class.from_surface(self.renderer, surface)
+        return texture
+
+    def prepare(self, surface):
+        """Sube la superficie a la GPU de antemano (p. ej. durante el feedback)"""
+        self.texture(surface)
+
+    def present(self, rect=None):
+        if rect is None:
+            self.screen_texture.update(self.screen)
+        else:
+            rect = pygame.Rect(rect).clip(self.screen.get_rect())
+            self.screen_texture.update(self.screen.subsurface(rect), area=rect)
+        self.renderer.clear()
+        self.screen_texture.draw()
+        self.renderer.present()
+
+    def show_layers(self, layers, background, rect=None):
+        # Con texturas redibujar el cuadro completo es barato: rect no hace falta
+        self.renderer.draw_color = tuple(pygame.Color(background))
+        self.renderer.clear()
+        for surface, position in layers:
+            self.texture(surface).draw(dstrect=pygame.Rect(position[0], position[1], *surface.get_size()))
+        self.renderer.present()
+
+    def close(self):
+        self.textures.clear()
+        self.window.destroy()
+
+
+def create_backend(name, resolution, fullscreen=False, caption=""):
+    """Crea el backend `name` ("software" o "sdl2"); si sdl2 no está disponible usa software"""
+    if name == "sdl2":
+        try:
+            return TextureBackend(resolution, fullscreen, caption)
+        except (ImportError, RuntimeError) as e:  # pygame.error y el error de _sdl2 son RuntimeError
+            print(f"Backend sdl2 no disponible ({e}), se usa el backend software")
+    elif name != "software":
+        raise ValueError("Backend de render desconocido: " + str(name))
+    return SoftwareBackend(resolution, fullscreen, caption)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Base de datos de resultados opcional (results_db en Prosocial_Effort_Task.py).
+
+Además del CSV de cada sesión, los trials, las presiones de la barra, los
+marcadores y la calibración se guardan en una base SQLite compartida por todas
+las sesiones, con índices por participante, condición, esfuerzo y créditos,
+para consultar miles de sesiones sin abrir cada CSV.
+
+La base está en modo WAL: las consultas (análisis, monitor en vivo) no bloquean
+a la tarea ni al revés. La tarea no escribe directamente: cada add_* deja la
+fila en una cola (~1 µs) y un hilo de fondo la escribe en lotes, una transacción
+por lote, así que el disco nunca demora un cuadro.
+
+Uso:
+    store = ResultsStore("data/results.sqlite")
+    store.start_session("2025-06-13_01-11-43_P01", "P01")
+    store.add_trial(block=1, trial=1, condition="Self", effort=50, credits=3, ...)
+    store.close()   # escribe lo pendiente
+
+    rows = query("data/results.sqlite",
+                 "SELECT condition, AVG(decision = 'task') FROM trials GROUP BY condition")
+"""
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session TEXT PRIMARY KEY,
+    participant TEXT NOT NULL,
+    task TEXT,
+    started_at TEXT
+);
+CREATE TABLE IF NOT EXISTS trials (
+    session TEXT NOT NULL,
+    participant TEXT NOT NULL,
+    block INTEGER,
+    trial INTEGER,
+    condition TEXT,
+    effort INTEGER,
+    credits INTEGER,
+    decision TEXT,
+    presses INTEGER,
+    success INTEGER,
+    earned_credits INTEGER,
+    decision_rt INTEGER,
+    first_press_time INTEGER,
+    last_press_time INTEGER,
+    decision_overshoot INTEGER,
+    target_presses INTEGER,
+    capacity_estimate REAL,
+    capacity_anchor INTEGER,
+    PRIMARY KEY (session, block, trial)
+);
+CREATE INDEX IF NOT EXISTS trials_participant ON trials (participant);
+CREATE INDEX IF NOT EXISTS trials_condition ON trials (condition);
+CREATE INDEX IF NOT EXISTS trials_effort ON trials (effort);
+CREATE INDEX IF NOT EXISTS trials_credits ON trials (credits);
+CREATE TABLE IF NOT EXISTS presses (
+    session TEXT NOT NULL,
+    block INTEGER,
+    trial INTEGER,
+    press INTEGER,
+    time_ms INTEGER,
+    PRIMARY KEY (session, block, trial, press)
+);
+CREATE TABLE IF NOT EXISTS markers (
+    session TEXT NOT NULL,
+    code INTEGER,
+    description TEXT,
+    time_ms INTEGER
+);
+CREATE INDEX IF NOT EXISTS markers_session ON markers (session, code);
+CREATE TABLE IF NOT EXISTS calibration (
+    session TEXT NOT NULL,
+    attempt INTEGER,
+    target INTEGER,
+    presses INTEGER,
+    reached INTEGER,
+    median_interval_ms REAL,
+    observation REAL,
+    estimate REAL,
+    ci_low REAL,
+    ci_high REAL,
+    PRIMARY KEY (session, attempt)
+);
+"""
+
+TRIAL_COLUMNS = ("session", "participant", "block", "trial", "condition", "effort", "credits", "decision",
+                 "presses", "success", "earned_credits", "decision_rt", "first_press_time", "last_press_time",
+                 "decision_overshoot", "target_presses", "capacity_estimate", "capacity_anchor")
+
+CALIBRATION_COLUMNS = ("session", "attempt", "target", "presses", "reached", "median_interval_ms",
+                       "observation", "estimate", "ci_low", "ci_high")
+
+# Filas que el hilo de fondo escribe como máximo por transacción
+BATCH_SIZE = 500
+
+_STOP = object()
+
+
+def connect(path, timeout=5.0):
+    """Conexión en modo WAL (escrituras rápidas y lecturas concurrentes)"""
+    connection = sqlite3.connect(path, timeout=timeout)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def query(path, sql, parameters=()):
+    """Consulta de sólo lectura (se puede hacer mientras la tarea escribe)"""
+    connection = sqlite3.connect("file:{}?mode=ro".format(path), uri=True, timeout=5.0)
+    try:
+        return connection.execute(sql, parameters).fetchall()
+    finally:
+        connection.close()
+
+
+class ResultsStore:
+    """Escritura por lotes en SQLite desde un hilo de fondo"""
+
+    def __init__(self, path):
+        self.path = path
+        self.session = None
+        self.participant = None
+        self._queue = queue.Queue()
+        self._error = None
+        # El esquema se crea antes de devolver, así los errores de la base se ven al inicio
+        connection = connect(path)
+        connection.executescript(SCHEMA)
+        connection.close()
+        self._thread = threading.Thread(target=self._writer, name="results-store", daemon=True)
+        self._thread.start()
+        # Si la tarea termina por una excepción igual se escribe lo que quedó en la cola
+        atexit.register(self.close)
+
+    def _writer(self):
+        connection = connect(self.path)
+        try:
+            stop = False
+            while not stop:
+                batch = [self._queue.get()]
+                while len(batch) < BATCH_SIZE:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if batch[-1] is _STOP:
+                    batch.pop()
+                    stop = True
+                try:
+                    with connection:
+                        for sql, rows in _group(batch):
+                            connection.executemany(sql, rows)
+                except sqlite3.Error as e:
+                    # No se corta la sesión por la base: el CSV sigue siendo el registro principal
+                    self._error = e
+                    print(f"Error escribiendo en {self.path}: {e}")
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+        finally:
+            connection.close()
+
+    def _put(self, sql, row):
+        self._queue.put((sql, row))
+
+    def start_session(self, session, participant, task="Prosocial_Effort_Task"):
+        self.session = session
+        self.participant = participant
+        self._put("INSERT OR IGNORE INTO sessions (session, participant, task, started_at) VALUES (?, ?, ?, ?)",
+                  (session, participant, task, time.strftime("%Y-%m-%d %H:%M:%S")))
+
+    def add_trial(self, **values):
+        values.setdefault("session", self.session)
+        values.setdefault("participant", self.participant)
+        self._put("INSERT OR REPLACE INTO trials ({}) VALUES ({})".format(
+            ", ".join(TRIAL_COLUMNS), ", ".join("?" * len(TRIAL_COLUMNS))),
+            tuple(values.get(column) for column in TRIAL_COLUMNS))
+
+    def add_presses(self, block, trial, press_log):
+        """Presiones del trial; reemplazan las de una ejecución anterior del mismo
+        trial (--resume), aunque ésta haya tenido más presiones"""
+        self._put("DELETE FROM presses WHERE session = ? AND block = ? AND trial = ?", (self.session, block, trial))
+        for press, time_ms in enumerate(press_log):
+            self._put("INSERT INTO presses (session, block, trial, press, time_ms) VALUES (?, ?, ?, ?, ?)",
+                      (self.session, block, trial, press + 1, time_ms))
+
+    def add_marker(self, code, description, time_ms):
+        self._put("INSERT INTO markers (session, code, description, time_ms) VALUES (?, ?, ?, ?)",
+                  (self.session, code, description, time_ms))
+
+    def add_calibration(self, attempts):
+        """Intentos de AdaptiveCalibration (ver calibration.py)"""
+        for attempt in attempts:
+            values = dict(attempt, session=self.session)
+            self._put("INSERT OR REPLACE INTO calibration ({}) VALUES ({})".format(
+                ", ".join(CALIBRATION_COLUMNS), ", ".join("?" * len(CALIBRATION_COLUMNS))),
+                tuple(values.get(column) for column in CALIBRATION_COLUMNS))
+
+    def flush(self):
+        """Espera a que el hilo de fondo escriba lo pendiente"""
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Escribe lo pendiente y termina el hilo de fondo"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+
+def _group(batch):
+    """Agrupa las filas consecutivas con la misma sentencia (para executemany)"""
+    groups = []
+    for sql, row in batch:
+        if groups and groups[-1][0] == sql:
+            groups[-1][1].append(row)
+        else:
+            groups.append((sql, [row]))
+    return groups
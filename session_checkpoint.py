@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Punto de control de la sesión, para continuar tras un corte (--resume).
+
+Después de la calibración, al empezar la tarea y después de cada trial se
+guarda en data/<fecha>_<id>_checkpoint.json todo lo necesario para seguir:
+la calibración (max_presses_count, effort_table), el orden de los trials ya
+calculado, el cursor (bloque y trial siguientes) y la fila del CSV del último
+trial, que se guarda antes que en el CSV para que un trial nunca se repita. La
+escritura es atómica (archivo temporal + fsync + os.replace): si el proceso
+muere a mitad de la escritura queda el punto de control anterior, nunca uno a
+medias.
+
+Etapas:
+    calibrated   calibración terminada: se retoma desde la práctica
+    experiment   tarea en curso: se retoma en el trial del cursor
+    finished     sesión terminada: no hay nada que retomar
+"""
+import glob
+import json
+import os
+
+CHECKPOINT_SUFFIX = "_checkpoint.json"
+
+
+class SessionCheckpoint:
+    """Estado de la sesión que se guarda en disco en cada cambio"""
+
+    def __init__(self, path, state=None):
+        self.path = path
+        self.state = state if state is not None else {}
+
+    def update(self, **values):
+        """Actualiza el estado y lo guarda"""
+        self.state.update(values)
+        self.save()
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def trial_done(self, block, trial, **values):
+        """Registra que terminó el trial `trial` (desde 0) del bloque `block`.
+        Con row= (la fila del CSV) se guarda antes de escribirla en el CSV"""
+        self.update(cursor=[block, trial + 1], **values)
+
+    def restore_row(self, csv_path):
+        """Agrega al CSV la fila del último trial terminado si no llegó a escribirse
+        (el proceso murió entre el punto de control y el CSV). True si la agregó"""
+        row = self.state.get("row")
+        if not row:
+            return False
+        with open(csv_path, encoding="utf-8", newline="") as f:
+            text = f.read()
+        if text.endswith(row):
+            return False
+        # Si el corte fue a mitad de la línea se completa; si no, se agrega entera
+        partial = text[text.rfind("\n") + 1:]
+        with open(csv_path, "a", encoding="utf-8", newline="") as f:
+            f.write(row[len(partial):] if row.startswith(partial) else "\n" + row)
+        return True
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(path, json.load(f))
+
+    @classmethod
+    def latest(cls, directory, subj_name):
+        """Último punto de control sin terminar del participante, o None"""
+        paths = sorted(glob.glob(os.path.join(glob.escape(directory), "*_" + glob.escape(subj_name) + CHECKPOINT_SUFFIX)))
+        for path in reversed(paths):
+            checkpoint = cls.load(path)
+            if checkpoint.state.get("subj_name") == subj_name and checkpoint.state.get("stage") != "finished":
+                return checkpoint
+        return None
+
+
+def checkpoint_path(base):
+    """Ruta del punto de control para data/<fecha>_<id>"""
+    return base + CHECKPOINT_SUFFIX
+
+
+def encode_effort_table(effort_table):
+    """effort_table {presiones: porcentaje} en JSON (las claves deben ser str)"""
+    return [[presses, effort] for presses, effort in effort_table.items()]
+
+
+def decode_effort_table(pairs):
+    return {presses: effort for presses, effort in pairs}
+
+
+def encode_schedule(schedule):
+    return [[list(combination) for combination in block] for block in schedule]
+
+
+def decode_schedule(blocks):
+    return [[tuple(combination) for combination in block] for block in blocks]
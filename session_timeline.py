@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Línea de tiempo de la sesión: registra el inicio y la duración real de cada fase
+(aviso, decisión, esfuerzo/descanso, feedback, descanso entre bloques, ...) con
+un reloj monótono y la compara con la duración planificada.
+
+Cada fase mide su propio tiempo, así que el desfase acumulado a lo largo de la
+sesión (30-40 min) no se ve en los datos de los trials. Con esta línea de tiempo
+se puede ver en qué fases se van los minutos extra.
+
+Uso:
+    timeline = SessionTimeline()
+    with timeline.phase("decision", planned_ms=4000, trial=12):
+        ...
+    timeline.write_timeline("data/sesion_timeline.csv")
+    timeline.write_report("data/sesion_drift.txt")
+    timeline.write_histogram("data/sesion_drift_hist.csv")
+
+Las fases sin duración planificada (diapositivas que esperan una tecla) se
+registran igual, pero no suman al desfase.
+"""
+import csv
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Ancho de los intervalos del histograma de desfase (ms)
+DRIFT_BIN_MS = 5
+
+
+class SessionTimeline:
+    """Registro monótono de las fases de una sesión"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.start = clock()
+        self.entries = []
+
+    def _ms(self, t):
+        return (t - self.start) * 1000.0
+
+    @contextmanager
+    def phase(self, name, planned_ms=None, **info):
+        """Registra la fase `name` mientras dura el bloque with.
+
+        Entrega un dict con "planned_ms" e "info" que se puede modificar dentro
+        del bloque (p. ej. si la duración planificada depende del resultado)"""
+        record = {"planned_ms": planned_ms, "info": info}
+        begin = self.clock()
+        try:
+            yield record
+        finally:
+            self.add(name, begin, self.clock(), record["planned_ms"], **record["info"])
+
+    def add(self, name, begin, end, planned_ms=None, **info):
+        """Agrega una fase ya medida (begin y end en segundos de self.clock)"""
+        actual_ms = (end - begin) * 1000.0
+        drift_ms = actual_ms - planned_ms if planned_ms is not None else None
+        self.entries.append({
+            "phase": name,
+            "start_ms": self._ms(begin),
+            "end_ms": self._ms(end),
+            "planned_ms": planned_ms,
+            "actual_ms": actual_ms,
+            "drift_ms": drift_ms,
+            "info": info,
+        })
+
+    def summary(self):
+        """Resumen por fase: n, total planificado, total real, desfase total/medio/máximo"""
+        phases = OrderedDict()
+        for entry in self.entries:
+            stats = phases.setdefault(entry["phase"], {"n": 0, "planned_ms": 0.0, "actual_ms": 0.0,
+                                                       "drifts": []})
+            stats["n"] += 1
+            stats["actual_ms"] += entry["actual_ms"]
+            if entry["drift_ms"] is not None:
+                stats["planned_ms"] += entry["planned_ms"]
+                stats["drifts"].append(entry["drift_ms"])
+        for stats in phases.values():
+            drifts = sorted(stats.pop("drifts"))
+            stats["timed"] = len(drifts)
+            stats["drift_total_ms"] = sum(drifts)
+            stats["drift_mean_ms"] = sum(drifts) / len(drifts) if drifts else None
+            stats["drift_p95_ms"] = drifts[min(len(drifts) - 1, int(0.95 * len(drifts)))] if drifts else None
+            stats["drift_max_ms"] = drifts[-1] if drifts else None
+        return phases
+
+    def untracked_ms(self):
+        """Tiempo de la sesión que no cae dentro de ninguna fase registrada"""
+        covered = 0.0
+        last_end = 0.0
+        for entry in sorted(self.entries, key=lambda e: e["start_ms"]):
+            start = max(entry["start_ms"], last_end)
+            if entry["end_ms"] > start:
+                covered += entry["end_ms"] - start
+                last_end = entry["end_ms"]
+        return self._ms(self.clock()) - covered
+
+    def histogram(self, bin_ms=DRIFT_BIN_MS):
+        """Cantidad de fases por intervalo de desfase: {fase: {inicio_intervalo_ms: n}}"""
+        histograms = OrderedDict()
+        for entry in self.entries:
+            if entry["drift_ms"] is None:
+                continue
+            bin_start = int(entry["drift_ms"] // bin_ms) * bin_ms
+            bins = histograms.setdefault(entry["phase"], {})
+            bins[bin_start] = bins.get(bin_start, 0) + 1
+        return histograms
+
+    def write_timeline(self, path):
+        """Una fila por fase, en orden, con el desfase acumulado de la sesión"""
+        cumulative = 0.0
+        with _open_csv(path) as f:
+            writer = csv.writer(f)
+            writer.writerow(["index", "phase", "start_ms", "end_ms", "planned_ms", "actual_ms",
+                             "drift_ms", "cumulative_drift_ms", "info"])
+            for index, entry in enumerate(self.entries):
+                if entry["drift_ms"] is not None:
+                    cumulative += entry["drift_ms"]
+                writer.writerow([index, entry["phase"], _fmt(entry["start_ms"]), _fmt(entry["end_ms"]),
+                                 _fmt(entry["planned_ms"]), _fmt(entry["actual_ms"]), _fmt(entry["drift_ms"]),
+                                 _fmt(cumulative),
+                                 ";".join("{}={}".format(k, v) for k, v in entry["info"].items())])
+
+    def write_report(self, path):
+        """Informe de desfase de la sesión, por fase"""
+        phases = self.summary()
+        session_ms = self._ms(self.clock())
+        planned_total = sum(stats["planned_ms"] for stats in phases.values())
+        drift_total = sum(stats["drift_total_ms"] for stats in phases.values())
+        lines = [
+            "Duración de la sesión: {:.1f} s".format(session_ms / 1000.0),
+            "Fases con duración planificada: {:.1f} s planificados, {:+.1f} s de desfase".format(
+                planned_total / 1000.0, drift_total / 1000.0),
+            "Tiempo fuera de las fases registradas: {:.1f} s".format(self.untracked_ms() / 1000.0),
+            "",
+            "{:<20} {:>6} {:>12} {:>12} {:>12} {:>10} {:>10} {:>10}".format(
+                "fase", "n", "plan (s)", "real (s)", "desfase (s)", "medio ms", "p95 ms", "máx ms"),
+        ]
+        for name, stats in sorted(phases.items(), key=lambda item: item[1]["drift_total_ms"], reverse=True):
+            lines.append("{:<20} {:>6} {:>12} {:>12.1f} {:>12} {:>10} {:>10} {:>10}".format(
+                name, stats["n"],
+                "{:.1f}".format(stats["planned_ms"] / 1000.0) if stats["timed"] else "-",
+                stats["actual_ms"] / 1000.0,
+                "{:+.2f}".format(stats["drift_total_ms"] / 1000.0) if stats["timed"] else "-",
+                _fmt(stats["drift_mean_ms"], "-"), _fmt(stats["drift_p95_ms"], "-"), _fmt(stats["drift_max_ms"], "-")))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return lines
+
+    def write_histogram(self, path, bin_ms=DRIFT_BIN_MS):
+        """Histograma del desfase por fase (phase, bin_start_ms, bin_end_ms, count)"""
+        with _open_csv(path) as f:
+            writer = csv.writer(f)
+            writer.writerow(["phase", "bin_start_ms", "bin_end_ms", "count"])
+            for name, bins in self.histogram(bin_ms).items():
+                for bin_start in sorted(bins):
+                    writer.writerow([name, bin_start, bin_start + bin_ms, bins[bin_start]])
+
+    def write_all(self, base_path):
+        """Escribe <base>_timeline.csv, <base>_drift.txt y <base>_drift_hist.csv"""
+        self.write_timeline(base_path + "_timeline.csv")
+        self.write_report(base_path + "_drift.txt")
+        self.write_histogram(base_path + "_drift_hist.csv")
+
+
+def _open_csv(path):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    return open(path, "w", newline="", encoding="utf-8")
+
+
+def _fmt(value, empty=""):
+    return empty if value is None else "{:.1f}".format(value)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Ajuste del modelo de decisión moral a los datos de shock_decision_task_modified.py.
+
+En cada trial se elige entre la opción fija (2 descargas por $1) y una opción con
+más descargas y más dinero. El modelo estándar de aversión al daño es
+
+    ΔV = (1 - κ) · Δdinero - κ · Δdescargas
+    P(opción alta) = 1 / (1 + exp(-β · ΔV))
+
+con κ en [0, 1] (aversión al daño) y β > 0 (consistencia de las elecciones). Se
+ajusta por máxima verosimilitud, por participante y por condición (TI / OTRO),
+con intervalos de confianza por bootstrap de los trials.
+
+El ajuste es una búsqueda en una grilla de (β, κ) vectorizada con numpy. Las
+ofertas son pocas (4 x 4 celdas), así que cada sesión se resume en cuántas veces
+se eligió cada opción en cada celda y la log-verosimilitud de todas las sesiones
+y réplicas bootstrap para toda la grilla es un único producto de matrices:
+
+    conteos (sesiones, 2 x celdas) @ log P (2 x celdas, grilla)
+
+Ese producto se hace por tramos de filas (FIT_BYTES por tramo), y el bootstrap se
+reparte en tareas de a lo sumo SESSION_BLOCK sesiones x BOOTSTRAP_CHUNK réplicas,
+así que la memoria de cada proceso no crece con la cantidad de sesiones. Cada
+tarea tiene su propia semilla derivada de --seed, así que los resultados no
+dependen de la cantidad de procesos (--jobs), que se limita además por la memoria
+disponible.
+
+Uso:
+    python shock_choice_model.py data/*.csv -o data/kappa_fits.csv
+    python shock_choice_model.py data/*.csv --bootstrap 1000 --jobs 8
+    python shock_choice_model.py --simulate 500      # recuperación de parámetros
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Opción fija de la tarea (low_shock_option / low_reward_option en shock_decision_task_modified.py)
+LOW_SHOCKS = 2
+LOW_REWARD = 1
+
+# Niveles de la tarea (shock_levels / reward_levels), sólo para --simulate
+SHOCK_LEVELS = (4, 6, 8, 10)
+REWARD_LEVELS = (3, 6, 9, 12)
+
+KAPPA_POINTS = 101
+BETA_POINTS = 48
+BETA_RANGE = (0.01, 30.0)
+
+# Réplicas bootstrap y sesiones por tarea enviada a cada proceso
+BOOTSTRAP_CHUNK = 100
+SESSION_BLOCK = 50
+
+# Memoria de la matriz de log-verosimilitud de cada tramo de fit_counts
+FIT_BYTES = 64 * 2 ** 20
+
+# Memoria de un proceso sin contar la de su tarea (intérprete + numpy)
+WORKER_BYTES = 60 * 2 ** 20
+
+
+class ModelGrid:
+    """Grilla de (β, κ) y log-probabilidades de cada celda de oferta"""
+
+    def __init__(self, offers, kappa_points=KAPPA_POINTS, beta_points=BETA_POINTS, beta_range=BETA_RANGE):
+        self.offers = np.asarray(offers, dtype=float)  # (celdas, 2): Δdinero, Δdescargas
+        self.kappas = np.linspace(0.0, 1.0, kappa_points)
+        self.betas = np.geomspace(beta_range[0], beta_range[1], beta_points)
+        beta, kappa = np.meshgrid(self.betas, self.kappas, indexing="ij")
+        beta, kappa = beta.ravel(), kappa.ravel()
+        value = ((1 - kappa)[None, :] * self.offers[:, 0:1]
+                 - kappa[None, :] * self.offers[:, 1:2])  # (celdas, grilla)
+        logit = beta[None, :] * value
+        # log P(alta) y log P(baja), estables para |logit| grande
+        log_high = -np.logaddexp(0.0, -logit)
+        log_low = -np.logaddexp(0.0, logit)
+        self.log_prob = np.vstack([log_high, log_low])  # (2 x celdas, grilla)
+        self.beta = beta
+        self.kappa = kappa
+
+    @property
+    def fit_rows(self):
+        """Filas por tramo de fit_counts (la matriz de cada tramo ocupa ~FIT_BYTES)"""
+        return max(1, FIT_BYTES // (8 * self.log_prob.shape[1]))
+
+    def fit_counts(self, counts):
+        """(β, κ, log-verosimilitud) de cada fila de conteos (n, 2 x celdas)"""
+        counts = np.asarray(counts, dtype=float)
+        best = np.empty(len(counts), dtype=np.int64)
+        best_loglik = np.empty(len(counts))
+        for start in range(0, len(counts), self.fit_rows):
+            loglik = counts[start:start + self.fit_rows] @ self.log_prob
+            rows = loglik.argmax(axis=1)
+            best[start:start + len(rows)] = rows
+            best_loglik[start:start + len(rows)] = loglik[np.arange(len(rows)), rows]
+        return self.beta[best], self.kappa[best], best_loglik
+
+    def task_bytes(self, sessions, replicates):
+        """Memoria aproximada de _bootstrap_chunk para ese tamaño de tarea"""
+        rows = min(sessions * replicates, self.fit_rows)
+        return 8 * (rows * self.log_prob.shape[1] + 2 * sessions * replicates * self.log_prob.shape[0])
+
+
+def offer_cells(trials):
+    """Celdas de oferta distintas (Δdinero, Δdescargas) de una lista de trials"""
+    return sorted({(reward - LOW_REWARD, shocks - LOW_SHOCKS) for shocks, reward, _ in trials})
+
+
+def count_choices(trials, cells):
+    """Conteos [elecciones altas por celda..., elecciones bajas por celda...]"""
+    index = {cell: i for i, cell in enumerate(cells)}
+    counts = np.zeros(2 * len(cells))
+    for shocks, reward, high in trials:
+        cell = index[(reward - LOW_REWARD, shocks - LOW_SHOCKS)]
+        counts[cell if high else len(cells) + cell] += 1
+    return counts
+
+
+def read_sessions(paths):
+    """dict (sesión, condición) -> lista de (descargas, dinero, eligió_alta).
+    Los trials sin decisión no se usan; las líneas # de la cabecera se saltean"""
+    groups = {}
+    for path in paths:
+        session = os.path.splitext(os.path.basename(path))[0]
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = csv.DictReader(line for line in f if not line.startswith("#"))
+            for row in rows:
+                if row["Decision"] not in ("high", "low"):
+                    continue
+                key = (session, row["Condition"])
+                groups.setdefault(key, []).append(
+                    (int(row["Shocks_Option"]), int(row["Reward_Option"]), row["Decision"] == "high"))
+    return groups
+
+
+def _bootstrap_chunk(args):
+    """Ajusta `replicates` réplicas bootstrap de cada sesión (se corre en un proceso)"""
+    grid, counts, replicates, seed = args
+    rng = np.random.default_rng(seed)
+    totals = counts.sum(axis=1)
+    frequencies = counts / np.maximum(totals, 1)[:, None]
+    # Remuestrear los trials de una sesión = multinomial sobre sus (celda, elección)
+    resampled = rng.multinomial(totals.astype(np.int64)[:, None], frequencies[:, None, :],
+                                size=(len(counts), replicates))
+    beta, kappa, _ = grid.fit_counts(resampled.reshape(-1, counts.shape[1]))
+    return beta.reshape(len(counts), replicates), kappa.reshape(len(counts), replicates)
+
+
+def available_memory():
+    """Memoria disponible en bytes, o None si no se puede saber (p. ej. en Windows)"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def memory_jobs(jobs, task_bytes):
+    """jobs, limitado a los procesos que entran en la mitad de la memoria disponible"""
+    memory = available_memory()
+    if memory is None:
+        return jobs
+    return max(1, min(jobs, int(memory // 2 // (task_bytes + WORKER_BYTES))))
+
+
+def bootstrap(grid, counts, replicates, seed=0, jobs=1):
+    """Réplicas bootstrap de (β, κ): dos arrays (sesiones, replicates)"""
+    chunks = [min(BOOTSTRAP_CHUNK, replicates - start) for start in range(0, replicates, BOOTSTRAP_CHUNK)]
+    blocks = list(range(0, len(counts), SESSION_BLOCK))
+    seeds = np.random.SeedSequence(seed).spawn(len(blocks) * len(chunks))
+    tasks = [(grid, counts[start:start + SESSION_BLOCK], size, seeds[i * len(chunks) + j])
+             for i, start in enumerate(blocks) for j, size in enumerate(chunks)]
+    jobs = memory_jobs(jobs, grid.task_bytes(min(SESSION_BLOCK, len(counts)), BOOTSTRAP_CHUNK))
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_bootstrap_chunk, tasks))
+    else:
+        results = [_bootstrap_chunk(task) for task in tasks]
+    # Tareas en orden (bloque, réplicas): se juntan las réplicas de cada bloque y luego los bloques
+    beta = [np.hstack([results[i * len(chunks) + j][0] for j in range(len(chunks))]) for i in range(len(blocks))]
+    kappa = [np.hstack([results[i * len(chunks) + j][1] for j in range(len(chunks))]) for i in range(len(blocks))]
+    return np.vstack(beta), np.vstack(kappa)
+
+
+def fit_groups(groups, replicates=200, seed=0, jobs=1, level=95):
+    """Lista de dicts con el ajuste e intervalos de cada (sesión, condición)"""
+    keys = sorted(groups)
+    cells = offer_cells(trial for key in keys for trial in groups[key])
+    grid = ModelGrid(cells)
+    counts = np.array([count_choices(groups[key], cells) for key in keys])
+    beta, kappa, loglik = grid.fit_counts(counts)
+
+    tail = (100 - level) / 2
+    if replicates:
+        beta_boot, kappa_boot = bootstrap(grid, counts, replicates, seed, jobs)
+        kappa_ci = np.percentile(kappa_boot, [tail, 100 - tail], axis=1)
+        beta_ci = np.percentile(beta_boot, [tail, 100 - tail], axis=1)
+
+    results = []
+    for i, (session, condition) in enumerate(keys):
+        result = {
+            "session": session,
+            "condition": condition,
+            "n_trials": int(counts[i].sum()),
+            "p_high": counts[i, :len(cells)].sum() / max(counts[i].sum(), 1),
+            "kappa": kappa[i],
+            "beta": beta[i],
+            "loglik": loglik[i],
+        }
+        if replicates:
+            result.update(kappa_ci_low=kappa_ci[0, i], kappa_ci_high=kappa_ci[1, i],
+                          beta_ci_low=beta_ci[0, i], beta_ci_high=beta_ci[1, i])
+        results.append(result)
+    return results
+
+
+def simulate(sessions, kappa, beta, trials_per_cell=2, seed=0):
+    """Sesiones sintéticas con la grilla de ofertas de la tarea (para probar el ajuste)"""
+    rng = np.random.default_rng(seed)
+    groups = {}
+    for session in range(sessions):
+        for condition in ("TI", "OTRO"):
+            trials = []
+            for shocks in SHOCK_LEVELS:
+                for reward in REWARD_LEVELS:
+                    value = (1 - kappa) * (reward - LOW_REWARD) - kappa * (shocks - LOW_SHOCKS)
+                    p_high = 1 / (1 + np.exp(-beta * value))
+                    for _ in range(trials_per_cell):
+                        trials.append((shocks, reward, bool(rng.random() < p_high)))
+            groups[("sim{:04d}".format(session), condition)] = trials
+    return groups
+
+
+def write_results(results, path):
+    columns = ["session", "condition", "n_trials", "p_high", "kappa", "beta", "loglik",
+               "kappa_ci_low", "kappa_ci_high", "beta_ci_low", "beta_ci_high"]
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for result in results:
+            writer.writerow([_fmt(result.get(column)) for column in columns])
+
+
+def _fmt(value):
+    if value is None:
+        return ""
+    if isinstance(value, (float, np.floating)):
+        return "{:.4f}".format(value)
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="CSV de datos de la tarea de descargas")
+    parser.add_argument("-o", "--output", default=os.path.join("data", "kappa_fits.csv"))
+    parser.add_argument("--bootstrap", type=int, default=200, help="Réplicas bootstrap (0 = sin intervalos)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Procesos para el bootstrap")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--simulate", type=int, metavar="N", help="Ajusta N sesiones sintéticas en lugar de archivos")
+    parser.add_argument("--kappa", type=float, default=0.4, help="κ de las sesiones sintéticas")
+    parser.add_argument("--beta", type=float, default=1.0, help="β de las sesiones sintéticas")
+    args = parser.parse_args()
+
+    if args.simulate:
+        groups = simulate(args.simulate, args.kappa, args.beta, seed=args.seed)
+    elif args.paths:
+        groups = read_sessions(args.paths)
+    else:
+        parser.error("Indique archivos de datos o --simulate N")
+    if not groups:
+        print("No hay trials con decisión en los archivos indicados")
+        return 1
+
+    start = time.perf_counter()
+    results = fit_groups(groups, args.bootstrap, args.seed, args.jobs)
+    elapsed = time.perf_counter() - start
+    write_results(results, args.output)
+
+    for result in results[:20]:
+        ci = ""
+        if "kappa_ci_low" in result:
+            ci = " [{:.2f}, {:.2f}]".format(result["kappa_ci_low"], result["kappa_ci_high"])
+        print("{:<32} {:<5} n={:<3} κ={:.2f}{} β={:.2f}".format(
+            result["session"], result["condition"], result["n_trials"], result["kappa"], ci, result["beta"]))
+    if len(results) > 20:
+        print("... ({} ajustes en total)".format(len(results)))
+    print("{} ajustes en {:.2f} s -> {}".format(len(results), elapsed, args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,7 +10,7 @@ from pygame.locals import FULLSCREEN, USEREVENT, KEYUP, K_SPACE, K_RETURN, K_ESC
 from os.path import join
 from time import gmtime, strftime
 import itertools
-from random import shuffle
+from random import shuffle, Random, SystemRandom
 
 # Configurations:
 FullScreenShow = True  # Pantalla completa automáticamente al iniciar el experimento
@@ -21,11 +21,72 @@ reward_levels = [3, 6, 9, 12]  # Money rewards
 max_decision_time = 5  # Tiempo máximo para decidir en segundos
 fixation_duration = 2  # Duration of fixation cross in seconds (EASY TO CHANGE)
 trials_per_condition = 35  # 35 trials for self, 35 for other
+schedule_seed = None  # Semilla del orden de los trials (None = nueva en cada sesión; queda en el CSV)
+max_condition_run = 3  # Máximo de trials seguidos de la misma condición (TI / OTRO)
 
 # Fixed low option (always 2 shocks for 1 peso)
 low_shock_option = 2
 low_reward_option = 1
 
+# Marcadores LSL para sesiones combinadas con EEG. pylsl se importa sólo si se usa
+use_lsl = True  # False para sesiones sin EEG
+debug_mode = False  # Muestra en consola los marcadores enviados
+
+# MARCADORES LSL PARA EEG (desde 300, para no chocar con los de Prosocial_Effort_Task)
+MARKERS = {
+    'CUE_SELF': 300,                  # Aviso "Decisión para TI"
+    'CUE_OTHER': 301,                 # Aviso "Decisión para OTRO"
+    'FIXATION_START': 310,            # Cruz de fijación
+    'DECISION_START_SELF': 320,       # Inicio decisión para TI
+    'DECISION_START_OTHER': 321,      # Inicio decisión para OTRO
+    'RESPONSE_HIGH': 330,             # Respuesta: más descargas por más dinero
+    'RESPONSE_LOW': 331,              # Respuesta: opción fija (2 descargas por $1)
+    'RESPONSE_OMISSION': 332,         # Sin respuesta (timeout)
+    'FEEDBACK_START': 340,            # Feedback de la elección
+    'NO_DECISION_START': 341,         # Aviso de decisión no tomada
+    'EXPERIMENT_START': 350,          # Inicio del experimento
+    'EXPERIMENT_END': 351,            # Fin del experimento
+}
+
+# Variable global para LSL outlet
+lsl_outlet = None
+
+# True cuando la sesión terminó normalmente (EXPERIMENT_END ya enviado)
+experiment_ended = False
+
+def initialize_lsl():
+    """Inicializa la conexión LSL para enviar marcadores al EEG"""
+    global lsl_outlet
+    from pylsl import StreamInfo, StreamOutlet
+
+    print("\n" + "="*50)
+    print("INICIALIZANDO CONEXIÓN LSL PARA EEG")
+    print("="*50)
+
+    info = StreamInfo(name='ShockTaskMarkers',
+                      type='Markers',
+                      channel_count=1,
+                      channel_format='int32',
+                      source_id='ShockDecisionTask')
+
+    lsl_outlet = StreamOutlet(info)
+    print("✓ Stream LSL creado exitosamente")
+    print("  Por favor, conecte la aplicación de EEG ahora...")
+    input("  Presione ENTER cuando el EEG esté conectado...")
+    print("="*50 + "\n")
+
+    return lsl_outlet
+
+def send_marker(marker_code, description=""):
+    """Envía un marcador al sistema EEG via LSL"""
+    if lsl_outlet:
+        try:
+            lsl_outlet.push_sample([marker_code])
+            if debug_mode:
+                print(f"[EEG Marker] {marker_code} - {description}")
+        except Exception as e:
+            print(f"Error enviando marcador: {e}")
+
 # buttons configuration
 base_button_color = (255, 255, 255)
 
@@ -155,7 +216,29 @@ def blackscreen(blacktime=0):
     """Erases the screen"""
     screen.fill(background)
     pygame.display.flip()
-    pygame.time.delay(blacktime)
+    hold(blacktime)
+
+def hold(duration_ms):
+    """Mantiene la pantalla actual duration_ms sin bloquear los eventos (ESC sale).
+    Un timer de una sola vez marca el plazo y se espera con pygame.event.wait, así
+    que el plazo se cumple con precisión de ms. Las teclas presionadas mientras
+    tanto se descartan. Devuelve cuánto se pasó del plazo (ms)"""
+    if duration_ms <= 0:
+        return 0
+    HOLD_DEADLINE = USEREVENT + 2
+    deadline = pygame.time.get_ticks() + duration_ms
+    pygame.time.set_timer(HOLD_DEADLINE, duration_ms, loops=1)
+
+    while True:
+        event = pygame.event.wait(max(1, deadline - pygame.time.get_ticks()))
+        if event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE):
+            pygame_exit()
+        if event.type == HOLD_DEADLINE or pygame.time.get_ticks() >= deadline:
+            break
+
+    overshoot = pygame.time.get_ticks() - deadline
+    pygame.time.set_timer(HOLD_DEADLINE, 0)
+    return overshoot
 
 def wait(key, limit_time):
     """Hold a bit"""
@@ -193,8 +276,9 @@ def ends():
             if evento.type == KEYUP and evento.key == K_ESCAPE:
                 pygame_exit()
 
-def windows(text, key=None, limit_time=0): 
-    """Organizes a text into a paragraph"""
+def windows(text, key=None, limit_time=0, marker=None): 
+    """Organizes a text into a paragraph.
+    marker - (código, descripción) que se envía apenas se muestra la pantalla"""
     screen.fill(background)
     row = center[1] - 120
 
@@ -220,15 +304,17 @@ def windows(text, key=None, limit_time=0):
             row += 120
 
     pygame.display.flip()
+    if marker is not None:
+        send_marker(*marker)
     
     # If no key specified, just wait for the time limit
     if key is None and limit_time > 0:
-        pygame.time.delay(limit_time)
+        return hold(limit_time)
     else:
         wait(key, limit_time)
 
 def show_fixation_cross(duration):
-    """Display a fixation cross for specified duration"""
+    """Display a fixation cross for specified duration (s). Returns the overshoot (ms)"""
     screen.fill(background)
     
     # Draw fixation cross
@@ -248,7 +334,8 @@ def show_fixation_cross(duration):
                     cross_width)
     
     pygame.display.flip()
-    pygame.time.delay(duration * 1000)  # Convert to milliseconds
+    send_marker(MARKERS['FIXATION_START'], f"Fixation cross - {duration}s")
+    return hold(int(duration * 1000))  # Convert to milliseconds
 
 # Program Functions
 def init():
@@ -277,6 +364,9 @@ def init():
     pygame.display.flip()
 
 def pygame_exit():
+    # Sólo si se sale antes de terminar (ESC); si no, EXPERIMENT_END ya se envió en main()
+    if not experiment_ended:
+        send_marker(MARKERS['EXPERIMENT_END'], "Experiment ended")
     pygame.quit()
     sys.exit()
 
@@ -369,82 +459,139 @@ def take_decision(shock_number, reward_number, title_text, max_time=5):
         screen.blit(text_n, text_n_rect)
 
     pygame.display.flip()
+    if "TI" in title_text:
+        send_marker(MARKERS['DECISION_START_SELF'], f"Decision start - Self - {shock_number} shocks for ${reward_number}")
+    else:
+        send_marker(MARKERS['DECISION_START_OTHER'], f"Decision start - Other - {shock_number} shocks for ${reward_number}")
+
+    # Plazo con un timer de una sola vez; se espera con pygame.event.wait hasta el
+    # próximo evento o el plazo, así que la ventana de max_time dura lo pedido (ms)
+    DECISION_DEADLINE = USEREVENT + 3
+    decision_ms = int(round(max_time * 1000))
+    tw = pygame.time.get_ticks()
+    deadline = tw + decision_ms
+    pygame.time.set_timer(DECISION_DEADLINE, decision_ms, loops=1)
 
-    done = False
     selected_button = 0
     key_pressed = None
-
-    seconds = USEREVENT + 3
-    pygame.time.set_timer(seconds, 1000)
-
-    tw = pygame.time.get_ticks()
-    rt = 0
     reaction_time = None
+    deadline_overshoot = None
+
+    while key_pressed is None:
+        event = pygame.event.wait(max(1, deadline - pygame.time.get_ticks()))
+        if event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE):
+            pygame_exit()
+
+        elif event.type == KEYUP and event.key in (K_n, K_m):
+            reaction_time = pygame.time.get_ticks() - tw
+            key_pressed = "left" if event.key == K_n else "right"
+            if (button_positions[0] == "left") == (key_pressed == "left"):
+                selected_button = 1  # High option
+                send_marker(MARKERS['RESPONSE_HIGH'], f"Response: High - RT: {reaction_time}ms")
+            else:
+                selected_button = 2  # Low option
+                send_marker(MARKERS['RESPONSE_LOW'], f"Response: Low - RT: {reaction_time}ms")
 
-    while not done:
-        for event in pygame.event.get():
-            if event.type == KEYUP and event.key == K_ESCAPE:
-                pygame_exit()
-            
-            elif event.type == KEYUP and event.key == K_n:
-                reaction_time = pygame.time.get_ticks() - tw
-                key_pressed = "left"
-                if button_positions[0] == "left":
-                    selected_button = 1  # High option
-                else:
-                    selected_button = 2  # Low option
-                done = True
-                
-            elif event.type == KEYUP and event.key == K_m:
-                reaction_time = pygame.time.get_ticks() - tw
-                key_pressed = "right"
-                if button_positions[0] == "left":
-                    selected_button = 2  # Low option
-                else:
-                    selected_button = 1  # High option
-                done = True
-
-            elif event.type == seconds:
-                rt = pygame.time.get_ticks() - tw
-                if rt >= max_time * 1000:
-                    pygame.time.set_timer(seconds, 0)
-                    done = True
-
-    pygame.time.set_timer(seconds, 0)
-    pygame.event.clear()
+        elif event.type == DECISION_DEADLINE or pygame.time.get_ticks() >= deadline:
+            # Cuánto se pasó la ventana de decisión de su plazo
+            deadline_overshoot = pygame.time.get_ticks() - deadline
+            send_marker(MARKERS['RESPONSE_OMISSION'], f"Response: Timeout after {decision_ms + deadline_overshoot}ms")
+            break
 
-    return (selected_button, key_pressed, reaction_time)
+    pygame.time.set_timer(DECISION_DEADLINE, 0)
+    pygame.event.clear()
 
-def run_trials(self_combinations, other_combinations, file=None):
-    """Run all decision trials"""
-    # Combine and shuffle all trials
-    all_trials = []
-    
-    # Add self trials
-    for combo in self_combinations:
-        all_trials.append((combo[0], combo[1], "TI"))
-    
-    # Add other trials
-    for combo in other_combinations:
-        all_trials.append((combo[0], combo[1], "OTRO"))
-    
-    shuffle(all_trials)
-    
+    return (selected_button, key_pressed, reaction_time, deadline_overshoot)
+
+def build_trial_schedule(seed, trials_per_condition=35, max_run=3):
+    """Precalcula los trials de la sesión: lista de (descargas, dinero, condición).
+
+    Cada condición tiene todas las celdas descargas x dinero la misma cantidad de
+    veces; el resto (35 = 2 x 16 + 3) va a celdas distintas elegidas con la
+    semilla. TI y OTRO se intercalan sin más de max_run trials seguidos de la misma
+    condición ni la misma oferta dos veces seguidas. La misma semilla da siempre
+    la misma sesión"""
+    rng = Random(seed)
+    cells = list(itertools.product(shock_levels, reward_levels))
+    repeats, extra = divmod(trials_per_condition, len(cells))
+
+    for attempt in range(1000):
+        offers = {}
+        for condition in ("TI", "OTRO"):
+            offers[condition] = cells * repeats + rng.sample(cells, extra)
+            rng.shuffle(offers[condition])
+
+        schedule = []
+        run = 0
+        remaining = {condition: len(condition_offers) for condition, condition_offers in offers.items()}
+        while remaining["TI"] or remaining["OTRO"]:
+            allowed = [condition for condition in ("TI", "OTRO") if remaining[condition]
+                       and not (run >= max_run and schedule and schedule[-1][2] == condition)]
+            if not allowed:
+                break
+            # Elegir la condición con probabilidad proporcional a los trials que le quedan
+            weights = [remaining[condition] for condition in allowed]
+            condition = rng.choices(allowed, weights)[0]
+            run = run + 1 if schedule and schedule[-1][2] == condition else 1
+            remaining[condition] -= 1
+            pending = offers[condition]
+            last = remaining[condition]
+            if schedule and pending[last] == schedule[-1][:2]:
+                # Misma oferta que el trial anterior: se cambia por otra de las que quedan
+                others = [index for index in range(last) if pending[index] != pending[last]]
+                if others:
+                    index = rng.choice(others)
+                    pending[index], pending[last] = pending[last], pending[index]
+            shocks, reward = pending[last]
+            schedule.append((shocks, reward, condition))
+
+        if (len(schedule) == 2 * trials_per_condition
+                and all(a[:2] != b[:2] for a, b in zip(schedule, schedule[1:]))):
+            return schedule
+
+    raise ValueError("No se pudo generar un orden de trials con max_run = {}".format(max_run))
+
+def write_schedule_header(file, seed, schedule):
+    """Escribe la semilla y el orden de los trials como comentarios (#) al inicio del CSV"""
+    file.write(f"# schedule_seed={seed}\n")
+    file.write(f"# max_condition_run={max_condition_run}\n")
+    file.write("# schedule=" + ";".join(f"{shocks},{reward},{condition}" for shocks, reward, condition in schedule) + "\n")
+
+def read_schedule_header(path):
+    """(semilla, orden de los trials) de un CSV de datos de esta tarea, para repetir o auditar la sesión"""
+    seed, schedule = None, []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.startswith("#"):
+                break
+            key, _, value = line[1:].strip().partition("=")
+            if key == "schedule_seed":
+                seed = int(value)
+            elif key == "schedule" and value:
+                for trial in value.split(";"):
+                    shocks, reward, condition = trial.split(",")
+                    schedule.append((int(shocks), int(reward), condition))
+    return seed, schedule
+
+def run_trials(schedule, file=None):
+    """Run all decision trials (schedule: see build_trial_schedule)"""
     # Run each trial
-    for trial_num, (shocks, reward, condition) in enumerate(all_trials):
+    for trial_num, (shocks, reward, condition) in enumerate(schedule):
         # Show receiver (self or other)
-        windows([f"Decisión para", condition], None, 2000)
+        cue_marker = MARKERS['CUE_SELF'] if condition == "TI" else MARKERS['CUE_OTHER']
+        windows([f"Decisión para", condition], None, 2000, (cue_marker, f"Cue - {condition}"))
         
         # Show fixation cross
-        show_fixation_cross(fixation_duration)
+        fixation_overshoot = show_fixation_cross(fixation_duration)
         
         # Get decision
-        selection, key_pressed, reaction_time = take_decision(
+        selection, key_pressed, reaction_time, decision_overshoot = take_decision(
             shocks, reward, f"Decisión para {condition}", max_time=max_decision_time
         )
         
         # Determine outcome
         if selection == 0:  # No decision made
+            send_marker(MARKERS['NO_DECISION_START'], "No decision")
             slide(select_slide('no_decision'), False, K_SPACE, 2)
             chosen_shocks = 0
             chosen_reward = 0
@@ -461,19 +608,26 @@ def run_trials(self_combinations, other_combinations, file=None):
         # Save data
         if file:
             file.write(f"{trial_num+1},{shocks},{reward},{condition},{decision},"
-                      f"{chosen_shocks},{chosen_reward},{reaction_time},{key_pressed}\n")
+                      f"{chosen_shocks},{chosen_reward},{reaction_time},{key_pressed},"
+                      f"{fixation_overshoot},{'' if decision_overshoot is None else decision_overshoot}\n")
             file.flush()
         
         # Show feedback
         if selection != 0:
+            feedback_marker = (MARKERS['FEEDBACK_START'], f"Feedback - {chosen_shocks} shocks for ${chosen_reward}")
             if condition == "TI":
-                windows([f"Has elegido:", f"{chosen_shocks} descargas por ${chosen_reward}"], None, 2000)
+                windows([f"Has elegido:", f"{chosen_shocks} descargas por ${chosen_reward}"], None, 2000, feedback_marker)
             else:
-                windows([f"La otra persona recibirá:", f"{chosen_shocks} descargas por ${chosen_reward}"], None, 2000)
+                windows([f"La otra persona recibirá:", f"{chosen_shocks} descargas por ${chosen_reward}"], None, 2000, feedback_marker)
 
 # Main Function
 def main():
     """Game's main loop"""
+    global experiment_ended
+
+    # Inicializar conexión LSL
+    if use_lsl:
+        initialize_lsl()
     
     # Create data folder if it doesn't exist
     if not os.path.exists('data/'):
@@ -488,15 +642,23 @@ def main():
 
     pygame.init()
 
+    # Orden de los trials (ver build_trial_schedule)
+    seed = schedule_seed if schedule_seed is not None else SystemRandom().randrange(2**31)
+    schedule = build_trial_schedule(seed, trials_per_condition, max_condition_run)
+    print(f"Semilla del orden de los trials: {seed}")
+
     # Create data file
     csv_name = join('data', date_name + "_" + subj_name + ".csv")
-    dfile = open(csv_name, 'w')
+    dfile = open(csv_name, 'w', encoding='utf-8')
+    write_schedule_header(dfile, seed, schedule)
     dfile.write("Trial,Shocks_Option,Reward_Option,Condition,Decision,Chosen_Shocks,"
-                "Chosen_Reward,Reaction_Time,Key_Pressed\n")
+                "Chosen_Reward,Reaction_Time,Key_Pressed,Fixation_Overshoot,Decision_Overshoot\n")
     dfile.flush()
 
     init()
 
+    send_marker(MARKERS['EXPERIMENT_START'], "Experiment started")
+
     # Instructions
     slide(select_slide('welcome'), False, K_SPACE)
     slide(select_slide('Instructions_Decision_1'), False, K_SPACE)
@@ -504,30 +666,13 @@ def main():
     slide(select_slide('Instructions_Decision_3'), False, K_SPACE)
     slide(select_slide('Instructions_Decision_final'), False, K_SPACE)
 
-    # Create all combinations
-    all_combinations = list(itertools.product(shock_levels, reward_levels))
-    
-    # Create trials for each condition
-    self_trials = []
-    other_trials = []
-    
-    # We need 35 trials per condition from 16 possible combinations
-    # So we'll repeat some combinations
-    for _ in range(2):  # 2 * 16 = 32
-        self_trials.extend(all_combinations)
-        other_trials.extend(all_combinations)
-    
-    # Add 3 more random trials to reach 35
-    shuffle(all_combinations)
-    self_trials.extend(all_combinations[:3])
-    shuffle(all_combinations)
-    other_trials.extend(all_combinations[:3])
-    
     # Run the experiment
-    run_trials(self_trials, other_trials, dfile)
+    run_trials(schedule, dfile)
     
     # End
     dfile.close()
+    send_marker(MARKERS['EXPERIMENT_END'], "Experiment completed")
+    experiment_ended = True
     slide(select_slide('farewell'), True, K_SPACE)
     ends()
 
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Marcado de los textos de las diapositivas.
+
+    {NOMBRE}            se reemplaza por el texto y el color definidos para NOMBRE
+    {b}...{/b}          negrita
+    {size=48}...{/size} otro tamaño de letra (se alinea a la línea base)
+
+Cada línea se analiza una sola vez con una expresión regular y se guarda ya
+compilada, igual que su diagramación (fuentes y anchos de cada tramo), así que
+agregar marcadores nuevos no hace más lento el render de las diapositivas. Las
+etiquetas desconocidas se dejan tal cual en el texto.
+"""
+import re
+from collections import namedtuple
+
+TAG = re.compile(r"\{(/?)([A-Za-z_][A-Za-z0-9_]*)(?:=(\d+))?\}")
+
+# Tramo de texto con un mismo estilo (size None = tamaño base)
+Span = namedtuple("Span", "text color bold size")
+
+# Tramo listo para dibujar
+LaidOutSpan = namedtuple("LaidOutSpan", "text color font width")
+
+
+class LineLayout(namedtuple("LineLayout", "spans width ascent height")):
+    """Diagramación de una línea: tramos, ancho total, ascenso y alto máximos"""
+
+
+class SlideMarkup:
+    """Compilador de marcado con caché por línea.
+
+    tokens - dict NOMBRE -> (texto, color)
+    font_for - función (tamaño, negrita) -> pygame.font.Font
+    """
+
+    def __init__(self, tokens, font_for):
+        self.tokens = dict(tokens)
+        self.font_for = font_for
+        self._compiled = {}
+        self._layouts = {}
+
+    def add_token(self, name, text, color):
+        """Agrega (o cambia) un marcador de color"""
+        self.tokens[name] = (text, tuple(color))
+        self.clear()
+
+    def clear(self):
+        self._compiled.clear()
+        self._layouts.clear()
+
+    def compile(self, line, default_color):
+        """Lista de Span de la línea (en caché)"""
+        default_color = tuple(default_color)
+        key = (line, default_color)
+        spans = self._compiled.get(key)
+        if spans is not None:
+            return spans
+
+        spans = []
+        bold = False
+        sizes = []
+        position = 0
+
+        def add(text, color):
+            size = sizes[-1] if sizes else None
+            if spans and spans[-1].color == color and spans[-1].bold == bold and spans[-1].size == size:
+                spans[-1] = spans[-1]._replace(text=spans[-1].text + text)
+            elif text:
+                spans.append(Span(text, color, bold, size))
+
+        for match in TAG.finditer(line):
+            add(line[position:match.start()], default_color)
+            position = match.end()
+            closing, name, value = match.groups()
+            if name == "b" and value is None:
+                bold = not closing
+            elif name == "size" and closing and value is None:
+                if sizes:
+                    sizes.pop()
+            elif name == "size" and not closing and value is not None:
+                sizes.append(int(value))
+            elif not closing and value is None and name in self.tokens:
+                text, color = self.tokens[name]
+                add(text, tuple(color))
+            else:
+                add(match.group(0), default_color)
+        add(line[position:], default_color)
+
+        self._compiled[key] = spans
+        return spans
+
+    def layout(self, line, default_color, size):
+        """LineLayout de la línea con la fuente base de tamaño size (en caché)"""
+        key = (line, tuple(default_color), size)
+        layout = self._layouts.get(key)
+        if layout is not None:
+            return layout
+
+        laid_out = []
+        ascent = height = 0
+        for span in self.compile(line, default_color):
+            font = self.font_for(span.size or size, span.bold)
+            laid_out.append(LaidOutSpan(span.text, span.color, font, font.size(span.text)[0]))
+            ascent = max(ascent, font.get_ascent())
+            height = max(height, font.get_height())
+        layout = LineLayout(laid_out, sum(span.width for span in laid_out), ascent, height)
+        self._layouts[key] = layout
+        return layout
+
+    def plain_parts(self, line, default_color):
+        """Lista de (texto, color), sin negrita ni tamaños"""
+        return [(span.text, span.color) for span in self.compile(line, default_color)]